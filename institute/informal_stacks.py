@@ -774,12 +774,13 @@ def build_legend(displaced_labels, width):
 def generate_diagram(filepath, layers, title, subject):
     """Generates the stack diagram and writes it to a PDF file.
 
-    :param filepath: the path to the PDF file that should be written
+    :param filepath: the path to the PDF file that should be written, or a
+        file-like object
     :param layers: the layers of the stack in chronological order
     :param title: the title of the PDF file
     :param subject: the subject of the PDF file
 
-    :type filepath: str
+    :type filepath: str or file
     :type layers: list of `Layer`
     :type title: unicode
     :type subject: unicode
@@ -213,9 +213,10 @@ class Layout(object):
     def generate_pdf(self, filename):
         """Draws the layout and writes it to a PDF file.
 
-        :param filename: the full path to the PDF that should be created
+        :param filename: the full path to the PDF that should be created, or a
+            file-like object
 
-        :type filename: unicode
+        :type filename: unicode or file
         """
         canvas = Canvas(filename, pagesize=(self.width, self.height))
         self.draw_layout(canvas)
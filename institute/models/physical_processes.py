@@ -42,7 +42,7 @@ from jb_common import search, model_fields
 from jb_common.utils.base import format_lazy, generate_permissions
 import jb_common.utils.base
 import samples.utils.views as utils
-from samples.utils.plots import PlotError
+from samples.utils.plots import PlotError, read_plot_file
 import institute.layouts
 import institute.utils.base
 
@@ -108,7 +108,7 @@ class PDSMeasurement(PhysicalProcess):
         identifying_field = "number"
 
     def draw_plot(self, axes, plot_id, filename, for_thumbnail):
-        x_values, y_values = numpy.loadtxt(filename, comments="#", unpack=True)
+        x_values, y_values = read_plot_file(filename, [0, 1])
         axes.semilogy(x_values, y_values)
         axes.set_xlabel(_("energy in eV"))
         axes.set_ylabel(_("α in cm⁻¹"))
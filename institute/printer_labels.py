@@ -21,7 +21,8 @@
 # this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """Module for generating PDFs for the label printer.  These labels contain the
-sample name and a QR code with the sample ID.  The most challenging task here
+sample name and a QR code with the sample ID.  The QR code is generated
+locally, so no network access is needed.  The most challenging task here
 is to bring even long sample names on the label properly by compressing them
 and/or splitting them into two lines.
 
@@ -36,11 +37,11 @@ from django.utils.six import BytesIO
 import re
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
-from reportlab.lib.utils import ImageReader
+from samples.utils import barcodes
 import institute.reportlab_config
 
 
-__all__ = ["printer_label"]
+__all__ = ["printer_label", "printer_labels"]
 
 
 width = 4.5 * cm
@@ -122,12 +123,37 @@ def best_split(text):
     return text[:split], text[split:]
 
 
-def printer_label(sample):
-    """Generate the PDF of a sample for the label printer.
+def _draw_label(c, sample):
+    """Draws the label of a sample onto the current page of the canvas.
 
-    :param sample: the sample the label of which should be generated
+    :param c: ReportLab canvas object
+    :param sample: the sample the label of which should be drawn
 
+    :type c: canvas.Canvas
     :type sample: `samples.models.Sample`
+    """
+    text = sample.name
+    try:
+        print_line(c, 0, fontsize, text)
+    except ExcessException:
+        first, second = best_split(text)
+        print_line(c, height / 2, fontsize_half, first, force=True)
+        print_line(c, 0, fontsize_half, second, force=True)
+    matrix = barcodes.qr_code(six.text_type(sample.id))
+    quiet_zone = height / (len(matrix) + 2)
+    barcodes.draw_matrix(c, matrix, width - height + quiet_zone, quiet_zone, height - 2 * quiet_zone)
+
+
+def printer_labels(samples, title=None):
+    """Generate one PDF with the labels of many samples for the label printer.
+    Every label is one page.
+
+    :param samples: the samples the labels of which should be generated
+    :param title: the title of the PDF; defaults to the name of the first
+        sample
+
+    :type samples: list of `samples.models.Sample`
+    :type title: unicode
 
     :return:
       the PDF as a byte stream
@@ -135,19 +161,28 @@ def printer_label(sample):
     :rtype: str
     """
     output = BytesIO()
-    text = sample.name
+    title = title or samples[0].name
     c = canvas.Canvas(output, pagesize=(width, height))
     c.setAuthor("JuliaBase samples database")
-    c.setTitle(text)
-    c.setSubject("Label of {0} for the label printer".format(text))
-    try:
-        print_line(c, 0, fontsize, text)
-    except ExcessException:
-        first, second = best_split(text)
-        print_line(c, height / 2, fontsize_half, first, force=True)
-        print_line(c, 0, fontsize_half, second, force=True)
-    c.drawImage(ImageReader("http://chart.googleapis.com/chart?chs=116x116&cht=qr&chl={0}&chld=H|1".format(sample.id)),
-                width - height, 0, height, height)
-    c.showPage()
+    c.setTitle(title)
+    c.setSubject("Labels of {0} for the label printer".format(title))
+    for sample in samples:
+        _draw_label(c, sample)
+        c.showPage()
     c.save()
     return output.getvalue()
+
+
+def printer_label(sample):
+    """Generate the PDF of a sample for the label printer.
+
+    :param sample: the sample the label of which should be generated
+
+    :type sample: `samples.models.Sample`
+
+    :return:
+      the PDF as a byte stream
+
+    :rtype: str
+    """
+    return printer_labels([sample])
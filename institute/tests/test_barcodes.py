@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+from django.test import SimpleTestCase
+from samples.utils import barcodes
+
+
+def as_text(matrix):
+    return "\n".join("".join("#" if module else "." for module in row) for row in matrix)
+
+
+class DataMatrixTest(SimpleTestCase):
+    """The expected symbols were cross-checked with an independent ECC 200
+    encoder.
+    """
+
+    def test_codewords(self):
+        # This is the example of ISO/IEC 16022, Annex O.
+        self.assertEqual(barcodes._data_matrix_codewords("123456"), [142, 164, 186])
+        self.assertEqual(barcodes._reed_solomon([142, 164, 186], 5), [114, 25, 5, 88, 102])
+        self.assertEqual(barcodes._data_matrix_codewords("A1-Ä"), [66, 50, 46, 235, 69])
+
+    def test_10x10(self):
+        self.assertEqual(as_text(barcodes.data_matrix("123456")), "\n".join([
+            "#.#.#.#.#.",
+            "##..#.##.#",
+            "##.....#..",
+            "##...###.#",
+            "##....#...",
+            "#.....####",
+            "###.##....",
+            "####.##..#",
+            "#..###.#..",
+            "##########"]))
+
+    def test_12x12(self):
+        self.assertEqual(as_text(barcodes.data_matrix("14S-001")), "\n".join([
+            "#.#.#.#.#.#.",
+            "#.###....#.#",
+            "#.#....#..#.",
+            "##..##.....#",
+            "#..#.#.####.",
+            "#..#.#..#.##",
+            "#...#.#..#..",
+            "###......#.#",
+            "#..#....#.#.",
+            "#..#.#...#.#",
+            "##.##.#...#.",
+            "############"]))
+
+    def assertSymbol(self, data, size, sha1):
+        matrix = barcodes.data_matrix(data)
+        self.assertEqual((len(matrix), {len(row) for row in matrix}), (size, {size}))
+        self.assertEqual(hashlib.sha1(as_text(matrix).encode("ascii")).hexdigest(), sha1)
+
+    def test_multiple_regions(self):
+        self.assertSymbol(8 * "14S-001 ", 32, "69cce03ad2f38faafc9730c25bdd8c26be3f9241")
+        self.assertSymbol(21 * "14S-001 ", 44, "bd86ffe0e1c2b38f91d2a0c48be4594860c84eae")
+
+    def test_too_long(self):
+        self.assertEqual(len(barcodes.data_matrix(174 * "x")), 48)
+        self.assertRaises(ValueError, barcodes.data_matrix, 175 * "x")
+
+    def test_png(self):
+        png = barcodes.matrix_to_png(barcodes.data_matrix("14S-001"), module_size=2)
+        self.assertEqual(png[:4], b"\x89PNG")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import datetime, threading
+import psycopg2.pool
+from django.test import SimpleTestCase
+from jb_common.utils.blobs.backends import PostgreSQL
+
+
+class FakeCursor(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        pass
+
+    def execute(self, query, parameters=None):
+        self.connection.queries.append((query, parameters))
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return list(self.connection.rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+
+    def __init__(self, queries, rows):
+        self.queries, self.rows = queries, rows
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakePool(object):
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def getconn(self):
+        return FakeConnection(self.storage.queries, self.storage.rows)
+
+    def putconn(self, connection):
+        pass
+
+
+class FakePostgreSQL(PostgreSQL):
+    """PostgreSQL blob backend which doesn't connect to a database but logs the
+    queries.
+    """
+
+    def __init__(self, max_connections, timeout):
+        self.queries, self.rows = [], []
+        super(FakePostgreSQL, self).__init__("database", "user", "password", "host", max_connections=max_connections,
+                                             timeout=timeout)
+        del self.queries[:]
+
+    def _create_pool(self):
+        return FakePool(self)
+
+
+class PostgreSQLPoolTest(SimpleTestCase):
+
+    def test_timeout(self):
+        storage = FakePostgreSQL(max_connections=2, timeout=0.1)
+        connections = [storage.get_connection(), storage.get_connection()]
+        self.assertRaises(psycopg2.pool.PoolError, storage.get_connection)
+        storage.put_connection(connections.pop())
+        storage.put_connection(storage.get_connection())
+
+    def test_streaming_leaves_one_connection(self):
+        storage = FakePostgreSQL(max_connections=3, timeout=0.1)
+        streams = [storage.get_connection(streaming=True), storage.get_connection(streaming=True)]
+        self.assertRaises(psycopg2.pool.PoolError, storage.get_connection, streaming=True)
+        storage.put_connection(storage.get_connection())
+        storage.put_connection(streams.pop())
+        storage.put_connection(storage.get_connection(streaming=True))
+
+    def test_waiting(self):
+        storage = FakePostgreSQL(max_connections=1, timeout=5)
+        connection = storage.get_connection()
+        timer = threading.Timer(0.1, storage.put_connection, (connection,))
+        timer.start()
+        storage.put_connection(storage.get_connection())
+        timer.join()
+
+    def test_getmtimes(self):
+        storage = FakePostgreSQL(max_connections=1, timeout=0.1)
+        mtime = datetime.datetime(2015, 1, 21, 11, 15, 5)
+        storage.rows = [("a", mtime), ("b", mtime)]
+        self.assertEqual(storage.getmtimes(["a", "b", "a"]), {"a": mtime, "b": mtime})
+        self.assertEqual(len(storage.queries), 1)
+        self.assertEqual(sorted(storage.queries[0][1][0]), ["a", "b"])
+        self.assertEqual(storage.getmtimes([]), {})
+        self.assertEqual(len(storage.queries), 1)
+        self.assertEqual(storage.getmtime("a"), mtime)
+        with self.assertRaises(EnvironmentError):
+            storage.getmtimes(["a", "b", "c"])
+        storage.put_connection(storage.get_connection())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from django.db.utils import IntegrityError
+from django.test import TestCase, override_settings
+from django.test.client import Client
+import samples.views.json_client
+from samples.models import Sample
+
+
+@override_settings(ROOT_URLCONF="institute.tests.urls")
+class BulkSubmitTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.client = Client()
+
+    def bulk_submit(self, requests, username="juliabase"):
+        assert self.client.login(username=username, password="12345")
+        return self.client.post("/bulk_submit", {"requests": json.dumps(requests)}, HTTP_ACCEPT="application/json")
+
+    def add_sample_request(self, name):
+        return ["add_sample", {"name": name, "current_location": "lab", "currently_responsible_person": "7"}]
+
+    def assertFailure(self, response, error_code, message_start):
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response["content-type"], "application/json")
+        actual_error_code, error_message = response.json()
+        self.assertEqual(actual_error_code, error_code)
+        self.assertTrue(error_message.startswith(message_start), error_message)
+        self.assertFalse(Sample.objects.filter(name__startswith="14S-9").exists())
+
+    def test_success(self):
+        response = self.bulk_submit([self.add_sample_request("14S-901"), self.add_sample_request("14S-902")])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [Sample.objects.get(name="14S-901").id, Sample.objects.get(name="14S-902").id])
+
+    def test_json_request_exception(self):
+        response = self.bulk_submit([self.add_sample_request("14S-901"), ["add_sample", {"name": "14S-902"}]])
+        self.assertFailure(response, 3, "request #1: ")
+
+    def test_not_found(self):
+        response = self.bulk_submit([self.add_sample_request("14S-901"), self.add_sample_request("14S-902"),
+                                     ["no_such_view/", {}]])
+        self.assertFailure(response, 2, "request #2: ")
+
+    def test_permission_error(self):
+        response = self.bulk_submit([["samples/14S-002/edit/", {"current_location": "lab"}]], username="h.griffin")
+        self.assertFailure(response, 6, "request #0: Permission denied: ")
+
+    def test_unexpected_exception(self):
+        with mock.patch.object(samples.views.json_client.sample_names, "sample_name_format",
+                               side_effect=IntegrityError("UNIQUE constraint failed")):
+            response = self.bulk_submit([self.add_sample_request("14S-901")])
+        self.assertFailure(response, 5, "request #0: IntegrityError: UNIQUE constraint failed")
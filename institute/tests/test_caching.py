@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from jb_common.utils.base import CacheLock, cache_key_locked, cache_lock_statistics, get_cached_file_content
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "cache-lock-test"}})
+class CacheLockTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_exclusive(self):
+        lock = CacheLock("test-lock")
+        self.assertTrue(lock.acquire(wait=0))
+        with cache_key_locked("test-lock", wait=0.05) as locked:
+            self.assertFalse(locked)
+        self.assertEqual(cache_lock_statistics(), (1, 1))
+        lock.release()
+        with cache_key_locked("test-lock", wait=0) as locked:
+            self.assertTrue(locked)
+        self.assertIsNone(cache.get("test-lock"))
+
+    def test_release_only_by_owner(self):
+        lock = CacheLock("test-lock")
+        self.assertTrue(lock.acquire(wait=0))
+        # Simulate the expiry of the lease, and someone else taking the lock.
+        cache.delete("test-lock")
+        other_lock = CacheLock("test-lock")
+        self.assertTrue(other_lock.acquire(wait=0))
+        lock.release()
+        self.assertEqual(cache.get("test-lock"), other_lock.token)
+        other_lock.release()
+        self.assertIsNone(cache.get("test-lock"))
+
+    def test_release_near_expiry(self):
+        lock = CacheLock("test-lock", lease=CacheLock.release_margin)
+        self.assertTrue(lock.acquire(wait=0))
+        token = lock.token
+        lock.release()
+        self.assertEqual(cache.get("test-lock"), token)
+
+    def test_lease(self):
+        lock = CacheLock("test-lock", lease=1)
+        self.assertTrue(lock.acquire(wait=0))
+        self.assertTrue(CacheLock("test-lock").acquire(wait=2))
+        self.assertEqual(cache_lock_statistics(), (1, 0))
+
+    def test_cached_file_content(self):
+        calls = []
+        def generator():
+            calls.append(None)
+            return b"content"
+        self.assertEqual(get_cached_file_content("test/file", generator), b"content")
+        self.assertEqual(get_cached_file_content("test/file", generator), b"content")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache_lock_statistics(), (0, 0))
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import os, re, shutil, tempfile
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from django.test import SimpleTestCase
+from jb_remote.common import JuliaBaseError
+from jb_remote.crawler_tools import FileIndex, find_changed_files, defer_files, CrawlerRunner
+
+
+class FileIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.diff_file = os.path.join(tempfile.mkdtemp(), "diff.db")
+        os.mkdir(os.path.join(self.root, "sub"))
+        self.write("a.dat", "a", mtime=1000000000)
+        self.write("sub/b.dat", "b", mtime=1000000001)
+        self.write("c.txt", "c")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(os.path.dirname(self.diff_file))
+
+    def write(self, relative_path, content, mtime=None):
+        path = os.path.join(self.root, relative_path)
+        with open(path, "w") as file_:
+            file_.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def scan(self, **kwargs):
+        changed, removed = find_changed_files(self.root, self.diff_file, r".*\.dat$", **kwargs)
+        return [os.path.relpath(path, self.root) for path in changed], \
+            [os.path.relpath(path, self.root) for path in removed]
+
+    def test_changes(self):
+        self.assertEqual(self.scan(), (["a.dat", os.path.join("sub", "b.dat")], []))
+        self.assertEqual(self.scan(), ([], []))
+        # Only the modification time changes, but not the content.
+        os.utime(os.path.join(self.root, "a.dat"), (1000000005, 1000000005))
+        self.write("sub/b.dat", "new b", mtime=1000000006)
+        self.assertEqual(self.scan(), ([os.path.join("sub", "b.dat")], []))
+        os.remove(os.path.join(self.root, "a.dat"))
+        self.write("sub/d.dat", "d")
+        self.assertEqual(self.scan(), ([os.path.join("sub", "d.dat")], ["a.dat"]))
+        shutil.rmtree(os.path.join(self.root, "sub"))
+        self.assertEqual(sorted(self.scan()[1]), [os.path.join("sub", "b.dat"), os.path.join("sub", "d.dat")])
+
+    def test_md5_not_queried(self):
+        self.scan()
+        self.write("a.dat", "new a", mtime=1000000010)
+        index = FileIndex(self.diff_file)
+        statements = []
+        index.connection.set_trace_callback(lambda statement: statements.append(statement))
+        try:
+            self.assertEqual(index.scan(self.root, re.compile(r".*\.dat$")), (["a.dat"], []))
+        finally:
+            index.close()
+        self.assertFalse([statement for statement in statements if statement.startswith("SELECT md5")])
+
+    def test_pattern_change(self):
+        self.scan()
+        changed, removed = find_changed_files(self.root, self.diff_file, r".*\.txt$")
+        self.assertEqual([os.path.relpath(path, self.root) for path in changed], ["c.txt"])
+
+    def test_defer_files(self):
+        self.write("e.dat", "e")
+        self.scan()
+        defer_files(self.diff_file, ["e.dat", "a.dat"])
+        # ``a.dat`` is older than twelve weeks, so it is not deferred.
+        self.assertEqual(self.scan(trust_directory_mtimes=True), (["e.dat"], []))
+        self.assertEqual(self.scan(trust_directory_mtimes=True), ([], []))
+
+
+def parse(filepath):
+    with open(filepath) as file_:
+        content = file_.read()
+    if content == "broken":
+        raise ValueError("broken file")
+    return content, {"length": len(content)}
+
+
+class SubmittedObject(object):
+
+    def __init__(self, submitted, filepath, sample_id):
+        self.submitted, self.filepath, self.sample_id = submitted, filepath, sample_id
+
+    def submit(self):
+        if self.sample_id == -1:
+            raise JuliaBaseError(1, "rejected")
+        self.submitted.append((os.path.basename(self.filepath), self.sample_id))
+
+
+class CrawlerRunnerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.submitted = []
+        self.resolved_batches = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, filename, content):
+        path = os.path.join(self.root, filename)
+        with open(path, "w") as file_:
+            file_.write(content)
+        return path
+
+    def build(self, filepath, data, sample_id):
+        return [SubmittedObject(self.submitted, filepath, sample_id)]
+
+    def resolve_sample_names(self, sample_names):
+        sample_names = set(sample_names)
+        self.resolved_batches.append(sample_names)
+        known_samples = {"14S-001": 1, "14S-002": 2, "14S-003": 3, "14S-004": -1}
+        return {name: known_samples[name] for name in sample_names if name in known_samples}
+
+    def run_crawler(self, filepaths, **kwargs):
+        runner = CrawlerRunner("test_crawler_runner_{0}".format(os.getpid()), parse, self.build,
+                               parsing_processes=2, **kwargs)
+        with mock.patch("jb_remote.crawler_tools.resolve_sample_names", self.resolve_sample_names):
+            return runner, runner.run(filepaths)
+
+    def test_submission(self):
+        filepaths = [self.write("{0}.dat".format(i), "14S-00{0}".format(i)) for i in (1, 2, 3)]
+        runner, failed = self.run_crawler(filepaths)
+        self.assertEqual(failed, [])
+        self.assertEqual(self.submitted, [("1.dat", 1), ("2.dat", 2), ("3.dat", 3)])
+        self.assertEqual(runner.statistics["parse"]["items"], 3)
+        self.assertEqual(runner.statistics["submit"]["items"], 3)
+
+    def test_batching(self):
+        filepaths = [self.write("{0}.dat".format(i), "14S-00{0}".format(i % 3 + 1)) for i in range(5)]
+        runner, failed = self.run_crawler(filepaths, batch_size=2)
+        self.assertEqual(failed, [])
+        self.assertEqual(len(self.resolved_batches), 3)
+        # Names which were already resolved are not looked up again.
+        self.assertEqual(self.resolved_batches, [{"14S-001", "14S-002"}, {"14S-003"}, set()])
+        self.assertEqual(len(self.submitted), 5)
+
+    def test_stage_failures(self):
+        broken = self.write("broken.dat", "broken")
+        unknown = self.write("unknown.dat", "14S-999")
+        rejected = self.write("rejected.dat", "14S-004")
+        good = self.write("good.dat", "14S-001")
+        runner, failed = self.run_crawler([broken, unknown, rejected, good])
+        self.assertEqual(sorted(failed), sorted([broken, unknown, rejected]))
+        self.assertEqual(self.submitted, [("good.dat", 1)])
+        self.assertEqual(runner.statistics["parse"]["errors"], 1)
+        self.assertEqual(runner.statistics["submit"]["errors"], 2)
+        # A rejected submission invalidates the cached sample ID.
+        self.assertNotIn("14S-004", runner.sample_ids)
+
+    def test_resolve_failure(self):
+        filepath = self.write("1.dat", "14S-001")
+        runner = CrawlerRunner("test_crawler_runner_{0}".format(os.getpid()), parse, self.build, parsing_processes=1)
+        with mock.patch("jb_remote.crawler_tools.resolve_sample_names", side_effect=JuliaBaseError(1, "down")):
+            self.assertEqual(runner.run([filepath]), [filepath])
+        self.assertEqual(runner.statistics["resolve"]["errors"], 1)
+        self.assertEqual(self.submitted, [])
+
+    def test_create_sample(self):
+        created = []
+        def create_sample(sample_name, data):
+            created.append((sample_name, data["length"]))
+            return 42
+        filepaths = [self.write("{0}.dat".format(i), "14S-999") for i in (1, 2)]
+        runner, failed = self.run_crawler(filepaths, create_sample=create_sample)
+        self.assertEqual(failed, [])
+        self.assertEqual(created, [("14S-999", 7)])
+        self.assertEqual(self.submitted, [("1.dat", 42), ("2.dat", 42)])
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth.models import User
+from samples.models import Sample, FeedEntry
+from samples.permissions import get_user_hash
+from samples.utils.views.feed import Reporter
+
+
+@override_settings(ROOT_URLCONF="institute.tests.urls")
+class FeedTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.user = User.objects.get(username="r.calvert")
+        self.url = "/feeds/r.calvert+" + get_user_hash(self.user)
+        self.sample = Sample.objects.get(name="14S-002")
+
+    def copy_samples(self, samples):
+        Reporter(User.objects.get(username="juliabase")).report_copied_my_samples(samples, self.user, "")
+        return self.user.feed_entries.latest("id")
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len([query for query in queries if "SAVEPOINT" not in query["sql"]]), 1)
+        self.copy_samples([self.sample])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "14S-002")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_orphaned_entries(self):
+        orphaned_entry = self.copy_samples([self.sample])
+        remaining_entry = self.copy_samples([self.sample, Sample.objects.get(name="14S-003")])
+        response = self.client.get(self.url)
+        etag, number_of_entries = response["ETag"], response.content.count(b"<entry>")
+        self.sample.delete()
+        self.assertFalse(FeedEntry.objects.filter(pk=orphaned_entry.pk).exists())
+        self.assertTrue(FeedEntry.objects.filter(pk=remaining_entry.pk).exists())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.count(b"<entry>"), number_of_entries - 1)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import datetime, io, os, shutil, tempfile
+from django.test import SimpleTestCase, override_settings
+from django.test.client import RequestFactory
+import django.utils.timezone
+from jb_common.utils import blobs
+from jb_common.utils.blobs.backends import Filesystem
+from jb_common.utils.base import _parse_range, file_response, blob_file_response
+
+
+class ParseRangeTest(SimpleTestCase):
+
+    def test_ranges(self):
+        self.assertEqual(_parse_range("bytes=0-99", 1000), (0, 100))
+        self.assertEqual(_parse_range("bytes = 100-", 1000), (100, 900))
+        self.assertEqual(_parse_range("bytes=900-2000", 1000), (900, 100))
+        self.assertEqual(_parse_range("bytes=-100", 1000), (900, 100))
+        self.assertEqual(_parse_range("bytes=-2000", 1000), (0, 1000))
+
+    def test_unsatisfiable(self):
+        self.assertEqual(_parse_range("bytes=1000-", 1000), (None, None))
+        self.assertEqual(_parse_range("bytes=200-100", 1000), (None, None))
+        self.assertEqual(_parse_range("bytes=-0", 1000), (None, None))
+
+    def test_ignored(self):
+        self.assertIsNone(_parse_range("bytes=-", 1000))
+        self.assertIsNone(_parse_range("bytes=0-1,5-6", 1000))
+        self.assertIsNone(_parse_range("lines=0-1", 1000))
+
+
+class FileResponseTest(SimpleTestCase):
+    content = bytes(bytearray(range(256))) * 4
+    last_modified = datetime.datetime(2015, 1, 21, 11, 15, 5, tzinfo=django.utils.timezone.utc)
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cleaned_up = False
+
+    def get(self, **headers):
+        def cleanup():
+            self.cleaned_up = True
+        return file_response(self.factory.get("/", **headers), io.BytesIO(self.content), len(self.content),
+                             "application/octet-stream", last_modified=self.last_modified, cleanup=cleanup)
+
+    def get_content(self, response):
+        content = b"".join(response.streaming_content)
+        response.close()
+        return content
+
+    def test_full(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Last-Modified"], "Wed, 21 Jan 2015 11:15:05 GMT")
+        self.assertEqual(self.get_content(response), self.content)
+        self.assertTrue(self.cleaned_up)
+
+    def test_partial(self):
+        response = self.get(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/1024")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(self.get_content(response), self.content[10:20])
+
+    def test_if_range(self):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get(HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE=etag).status_code, 206)
+        response = self.get(HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_content(response), self.content)
+
+    def test_not_modified(self):
+        etag = self.get()["ETag"]
+        self.cleaned_up = False
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(self.cleaned_up)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE="Wed, 21 Jan 2015 11:15:05 GMT").status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE="Wed, 21 Jan 2015 11:15:04 GMT").status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE="garbage").status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"',
+                                  HTTP_IF_MODIFIED_SINCE="Wed, 21 Jan 2015 11:15:05 GMT").status_code, 200)
+
+    def test_unsatisfiable(self):
+        response = self.get(HTTP_RANGE="bytes=2000-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+        self.assertTrue(self.cleaned_up)
+
+
+class BlobFileResponseTest(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        with open(os.path.join(self.root, "file.dat"), "wb") as file_:
+            file_.write(b"content")
+        self.original_storage, blobs.storage = blobs.storage, Filesystem(self.root)
+
+    def tearDown(self):
+        blobs.storage = self.original_storage
+        shutil.rmtree(self.root)
+
+    @override_settings(USE_X_SENDFILE=True)
+    def test_x_sendfile_temporary(self):
+        response = blob_file_response("file.dat")
+        exported_path = response["X-Sendfile-Temporary"]
+        self.assertNotIn("X-Sendfile", response)
+        self.assertNotEqual(exported_path, os.path.join(self.root, "file.dat"))
+        os.unlink(exported_path)
+
+    @override_settings(USE_X_SENDFILE=False)
+    def test_streamed_export_removed(self):
+        links = os.stat(os.path.join(self.root, "file.dat")).st_nlink
+        response = blob_file_response("file.dat", request=RequestFactory().get("/"))
+        self.assertEqual(b"".join(response.streaming_content), b"content")
+        response.close()
+        self.assertEqual(os.stat(os.path.join(self.root, "file.dat")).st_nlink, links)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import os, shutil, tempfile, datetime
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from django.test import TestCase, override_settings
+import django.utils.timezone
+from django.utils.safestring import SafeData
+from samples.models import Process
+from samples.utils import fragments
+from samples import signals
+import samples.models.common
+
+
+class FragmentsTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(CACHE_ROOT=self.cache_root)
+        self.settings_override.enable()
+        self.process = Process.objects.get(pk=1).actual_instance
+        self.sample = self.process.samples.all()[0]
+        self.user = self.process.operator
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_root)
+
+    def get_context(self):
+        return self.process.get_context_for_user(self.user, {"sample": self.sample, "original_sample": self.sample,
+                                                             "latest_descendant": None, "cutoff_timestamp": None})
+
+    def test_store(self):
+        self.assertIsNone(fragments.get_fragments(self.process, "key"))
+        fragments.store_fragments(self.process, "key", {"html_body": "<p>body</p>", "short_html_body": None})
+        stored_fragments = fragments.get_fragments(self.process, "key")
+        self.assertEqual(stored_fragments, {"html_body": "<p>body</p>", "short_html_body": None,
+                                            "extended_html_body": None})
+        self.assertIsInstance(stored_fragments["html_body"], SafeData)
+        self.assertIsNone(fragments.get_fragments(self.process, "other key"))
+        self.assertEqual(fragments.get_stored_process_ids(), {self.process.id})
+        fragments.delete_fragments(self.process.id)
+        self.assertIsNone(fragments.get_fragments(self.process, "key"))
+        self.assertEqual(fragments.get_stored_process_ids(), set())
+
+    def test_outdated(self):
+        fragments.store_fragments(self.process, "key", {"html_body": "old"})
+        self.process.last_modified += datetime.timedelta(seconds=1)
+        self.assertIsNone(fragments.get_fragments(self.process, "key"))
+        fragments.store_fragments(self.process, "key", {"html_body": "new"})
+        self.assertEqual(fragments.get_fragments(self.process, "key")["html_body"], "new")
+        self.assertEqual(len(os.listdir(fragments._fragments_directory(self.process.id))), 1)
+
+    def test_context(self):
+        context = self.get_context()
+        self.assertTrue(context["html_body"])
+        with mock.patch.object(samples.models.common, "render_to_string") as render_to_string:
+            self.assertEqual(self.get_context()["html_body"], context["html_body"])
+        self.assertFalse(render_to_string.called)
+
+    def test_process_deletion(self):
+        self.get_context()
+        self.assertEqual(fragments.get_stored_process_ids(), {self.process.id})
+        self.process.delete()
+        self.assertEqual(fragments.get_stored_process_ids(), set())
+
+    def test_warming(self):
+        fragments.store_fragments(Process(id=100000, last_modified=django.utils.timezone.now()), "key",
+                                  {"html_body": "orphan"})
+        now = django.utils.timezone.now()
+        Process.objects.update(last_modified=now - datetime.timedelta(days=2))
+        Process.objects.filter(pk=self.process.pk).update(last_modified=now)
+        signals.warm_process_fragments(sender=None)
+        self.assertEqual(fragments.get_stored_process_ids(), {self.process.id})
+        self.process = Process.objects.get(pk=self.process.pk).actual_instance
+        with mock.patch.object(samples.models.common, "render_to_string") as render_to_string:
+            self.assertTrue(self.get_context()["html_body"])
+        self.assertFalse(render_to_string.called)
@@ -27,6 +27,7 @@ import os
 from django.test import TestCase, override_settings
 from django.test.client import Client
 from django.contrib.auth.models import User
+from samples.models import Sample
 
 
 @override_settings(ROOT_URLCONF="institute.tests.urls")
@@ -40,6 +41,14 @@ class MainFeaturesTest(TestCase):
     def test_main_menu(self):
         response = self.client.get("/")
         self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'href="/printer_labels"')
+
+    def test_printer_labels(self):
+        sample_ids = Sample.objects.filter(name__in=["14S-001", "14S-002"]).values_list("id", flat=True)
+        response = self.client.get("/printer_labels", {"samples": ",".join(str(id_) for id_ in sample_ids)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
 
     def test_add_samples(self):
         response = self.client.get("/samples/add/")
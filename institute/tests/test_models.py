@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.contrib.auth.models import User, Group, Permission
+import django.utils.timezone
+from jb_common.utils.base import get_cache_generation
+from jb_common.models import Topic, Department, resolve_actual_instances
+from samples.permissions import get_permission_snapshot, get_main_menu_capabilities, can_edit_any_topics, \
+    assert_can_edit_topic, PermissionError
+from samples.models import Process, Sample, SampleSplit, ExternalOperator, get_ancestor_ids, touch_genealogy
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "genealogy-test"}})
+class GenealogyTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.user = User.objects.get(username="r.calvert")
+        self.root = Sample.objects.get(name="14S-002")
+        self.first_split, (self.child, self.sibling) = self.split(self.root, ["14S-002-1", "14S-002-2"])
+        self.second_split, (self.grandchild,) = self.split(self.child, ["14S-002-1-1"])
+
+    def split(self, parent, piece_names):
+        sample_split = SampleSplit.objects.create(timestamp=django.utils.timezone.now(), operator=self.user, parent=parent)
+        sample_split.samples.add(parent)
+        pieces = [Sample.objects.create(name=name, current_location="lab", currently_responsible_person=self.user,
+                                        topic=parent.topic, split_origin=sample_split) for name in piece_names]
+        return sample_split, pieces
+
+    def test_ancestor_ids(self):
+        expected_ids = [self.grandchild.pk, self.child.pk, self.root.pk]
+        self.assertEqual(get_ancestor_ids(self.grandchild), expected_ids)
+        self.assertEqual(get_ancestor_ids(self.root), [self.root.pk])
+        vendor = connection.vendor
+        connection.vendor = "other"
+        try:
+            self.assertEqual(get_ancestor_ids(self.grandchild), expected_ids)
+        finally:
+            connection.vendor = vendor
+
+    def test_touch_genealogy(self):
+        family = [self.root, self.child, self.sibling, self.grandchild]
+        past = django.utils.timezone.now() - datetime.timedelta(days=1)
+        Sample.objects.filter(pk__in=[sample.pk for sample in family]).update(last_modified=past)
+        SampleSplit.objects.filter(pk__in=[self.first_split.pk, self.second_split.pk]).update(last_modified=past)
+        unrelated_sample = Sample.objects.get(name="14S-003")
+        Sample.objects.filter(pk=unrelated_sample.pk).update(last_modified=past)
+        self.user.samples_user_details.my_samples_list_timestamp = past
+        self.user.samples_user_details.save()
+        self.root.watchers.add(self.user)
+        generations = {sample.pk: get_cache_generation("sample-generation:{0}".format(sample.pk))
+                       for sample in family + [unrelated_sample]}
+        split_generation = get_cache_generation("process-generation:{0}".format(self.second_split.pk))
+
+        # ancestry, three generations of pieces, three bulk updates
+        with self.assertNumQueries(7):
+            touch_genealogy(self.sibling)
+
+        for sample in family:
+            if sample != self.sibling:
+                self.assertGreater(Sample.objects.get(pk=sample.pk).last_modified, past)
+            self.assertNotEqual(get_cache_generation("sample-generation:{0}".format(sample.pk)), generations[sample.pk])
+        self.assertEqual(Sample.objects.get(pk=unrelated_sample.pk).last_modified, past)
+        self.assertEqual(get_cache_generation("sample-generation:{0}".format(unrelated_sample.pk)),
+                         generations[unrelated_sample.pk])
+        for sample_split in [self.first_split, self.second_split]:
+            self.assertGreater(SampleSplit.objects.get(pk=sample_split.pk).last_modified, past)
+        self.assertNotEqual(get_cache_generation("process-generation:{0}".format(self.second_split.pk)), split_generation)
+        self.assertGreater(User.objects.get(pk=self.user.pk).samples_user_details.my_samples_list_timestamp, past)
+
+
+class ResolveActualInstancesTest(TestCase):
+    fixtures = ["test_main"]
+
+    def test_resolve_actual_instances(self):
+        expected = [process.actual_instance for process in Process.objects.order_by("id")]
+        actual_classes = {type(process) for process in expected}
+        self.assertGreater(len(actual_classes), 1)
+        processes = list(Process.objects.order_by("id"))
+        with self.assertNumQueries(len(actual_classes)):
+            actual_instances = resolve_actual_instances(processes)
+        self.assertEqual(actual_instances, expected)
+        self.assertEqual([type(process) for process in actual_instances], [type(process) for process in expected])
+        with self.assertNumQueries(0):
+            self.assertEqual([process.actual_instance for process in processes], expected)
+            self.assertIs(resolve_actual_instances([expected[0]])[0], expected[0])
+
+    def test_query_set(self):
+        expected = [process.actual_instance for process in Process.objects.order_by("id")]
+        self.assertEqual(Process.objects.order_by("id").resolve_actual_instances(), expected)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "permission-snapshot-test"}})
+class PermissionSnapshotTest(TestCase):
+    fixtures = ["test_main"]
+
+    def get_snapshot(self):
+        return get_permission_snapshot(User.objects.get(username="h.griffin"))
+
+    def test_group_permissions(self):
+        user = User.objects.get(username="h.griffin")
+        group = Group.objects.create(name="Renamers")
+        user.groups.add(group)
+        self.assertNotIn("samples.rename_samples", self.get_snapshot().permissions)
+        group.permissions.add(Permission.objects.get(codename="rename_samples"))
+        self.assertIn("samples.rename_samples", self.get_snapshot().permissions)
+        group.permissions.clear()
+        self.assertNotIn("samples.rename_samples", self.get_snapshot().permissions)
+
+    def test_my_samples(self):
+        sample = Sample.objects.get(name="14S-002")
+        self.assertNotIn(sample.id, self.get_snapshot().my_sample_ids)
+        sample.watchers.add(User.objects.get(username="h.griffin"))
+        self.assertIn(sample.id, self.get_snapshot().my_sample_ids)
+
+    def test_existing_permissions(self):
+        self.assertIn("rename_samples", {codename for __, codename in self.get_snapshot().existing_permissions})
+        Permission.objects.filter(codename="rename_samples").delete()
+        self.assertNotIn("rename_samples", {codename for __, codename in self.get_snapshot().existing_permissions})
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "main-menu-capabilities-test"}})
+class MainMenuCapabilitiesTest(TestCase):
+    fixtures = ["test_main"]
+
+    def get_capabilities(self, username="h.griffin"):
+        return get_main_menu_capabilities(User.objects.get(username=username))
+
+    def create_topic(self, name, members, manager, confidential=False):
+        topic = Topic(name=name, confidential=confidential, department=Department.objects.get(pk=1),
+                      manager=User.objects.get(username=manager))
+        topic.save()
+        topic.members = User.objects.filter(username__in=members)
+        return topic
+
+    def test_cached(self):
+        self.get_capabilities()
+        with self.assertNumQueries(2):
+            self.get_capabilities()
+
+    def test_topic_manager(self):
+        topic = self.create_topic("Lasers", ["h.griffin"], "r.calvert")
+        self.assertFalse(self.get_capabilities().can_edit_topics)
+        topic.manager = User.objects.get(username="h.griffin")
+        topic.save()
+        self.assertTrue(self.get_capabilities().can_edit_topics)
+        topic.delete()
+        self.assertFalse(self.get_capabilities().can_edit_topics)
+
+    def test_external_operator(self):
+        external_operator = ExternalOperator.objects.create(name="Dr. Sommer", institution="Uni", email="s@example.com")
+        self.assertFalse(self.get_capabilities().has_external_contacts)
+        external_operator.contact_persons.add(User.objects.get(username="h.griffin"))
+        self.assertTrue(self.get_capabilities().has_external_contacts)
+        external_operator.contact_persons.clear()
+        self.assertFalse(self.get_capabilities().has_external_contacts)
+
+    def test_group_permissions(self):
+        group = Group.objects.create(name="Renamers")
+        group.user_set.add(User.objects.get(username="h.griffin"))
+        self.assertFalse(self.get_capabilities().can_rename_samples)
+        group.permissions.add(Permission.objects.get(codename="rename_samples"))
+        self.assertTrue(self.get_capabilities().can_rename_samples)
+        group.permissions.clear()
+        self.assertFalse(self.get_capabilities().can_rename_samples)
+
+    def test_can_edit_any_topics(self):
+        """Checks that `can_edit_any_topics` agrees with `assert_can_edit_topic`
+        for every user.
+        """
+        self.create_topic("Secret", ["h.griffin"], "h.griffin", confidential=True)
+        self.create_topic("Public", ["j.silverton"], "h.griffin")
+        User.objects.get(username="s.renard").user_permissions.add(Permission.objects.get(codename="change_topic"))
+        self.create_topic("Only confidential", ["e.monroe"], "e.monroe", confidential=True)
+        for user in User.objects.all():
+            user = User.objects.get(pk=user.pk)
+            can_edit_topics = False
+            for topic in Topic.objects.all():
+                try:
+                    assert_can_edit_topic(user, topic)
+                except PermissionError:
+                    pass
+                else:
+                    can_edit_topics = True
+            self.assertEqual(can_edit_any_topics(user), can_edit_topics, user.username)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+from django.test import TestCase
+from django.core import serializers
+from django.contrib.auth.models import User
+from samples.models import Sample, SampleAlias
+from samples.utils.name_index import find_samples
+
+
+class FindSamplesTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        user = User.objects.get(username="r.calvert")
+        for name in ["XABC", "ABCD", "ABC", "ZABCZ", "ABC-1", "AXBC"]:
+            Sample.objects.create(name=name, current_location="lab", currently_responsible_person=user)
+        SampleAlias.objects.create(name="OLDABC", sample=Sample.objects.get(name="14S-003"))
+
+    def names(self, found_samples):
+        return [sample.name for sample in found_samples]
+
+    def test_ranking(self):
+        found_samples, too_many = find_samples(Sample.objects.all(), "abc")
+        self.assertEqual(self.names(found_samples), ["ABC", "ABC-1", "ABCD", "XABC", "ZABCZ"])
+        self.assertFalse(too_many)
+
+    def test_aliases(self):
+        self.assertNotIn("14S-003", self.names(find_samples(Sample.objects.all(), "oldab")[0]))
+        self.assertEqual(self.names(find_samples(Sample.objects.all(), "oldab", aliases=True)[0]), ["14S-003"])
+        SampleAlias.objects.get(name="OLDABC").delete()
+        self.assertEqual(find_samples(Sample.objects.all(), "oldab", aliases=True)[0], [])
+
+    def test_short_pattern(self):
+        self.assertEqual(self.names(find_samples(Sample.objects.all(), "xb")[0]), ["AXBC"])
+
+    def test_base_query(self):
+        found_samples, __ = find_samples(Sample.objects.exclude(name="ABC"), "abc")
+        self.assertEqual(self.names(found_samples), ["ABC-1", "ABCD", "XABC", "ZABCZ"])
+
+    def test_limit(self):
+        self.assertEqual(find_samples(Sample.objects.all(), "abc", limit=5), (find_samples(Sample.objects.all(), "abc")[0],
+                                                                             False))
+        found_samples, too_many = find_samples(Sample.objects.all(), "abc", limit=2)
+        self.assertEqual(self.names(found_samples), ["ABC", "ABC-1"])
+        self.assertTrue(too_many)
+
+    def test_raw_saves(self):
+        """Samples and aliases loaded from fixtures are saved “raw”, i.e. without
+        their ``save()`` methods.  They must be indexed nevertheless.
+        """
+        data = json.dumps([{"model": "samples.sample", "pk": 1000,
+                            "fields": {"name": "RAWSAMPLE", "current_location": "lab", "currently_responsible_person": 7,
+                                       "purpose": "", "tags": "", "last_modified": "2015-01-01T00:00:00Z"}},
+                           {"model": "samples.samplealias", "pk": 1000, "fields": {"name": "RAWALIAS", "sample": 1000}}])
+        for deserialized_object in serializers.deserialize("json", data):
+            deserialized_object.save()
+        self.assertEqual(self.names(find_samples(Sample.objects.all(), "wsamp")[0]), ["RAWSAMPLE"])
+        self.assertEqual(self.names(find_samples(Sample.objects.all(), "walia", aliases=True)[0]), ["RAWSAMPLE"])
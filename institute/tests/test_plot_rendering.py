@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import os, shutil, tempfile
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.db import transaction
+from institute.models import PDSMeasurement
+from samples.utils import plot_rendering
+
+
+class RenderPlotTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            CACHE_ROOT=self.cache_root,
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                "LOCATION": "plot-rendering-test"}})
+        self.settings_override.enable()
+        cache.clear()
+        self.measurement = PDSMeasurement.objects.get(number=1)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_root)
+
+    def render(self, thumbnail=True, timeout=10):
+        return plot_rendering.render_plot(self.measurement, "", thumbnail, [self.measurement.last_modified], timeout)
+
+    def test_synchronous(self):
+        self.assertIsNone(plot_rendering.get_pool())
+        path = self.render()
+        self.assertTrue(path.startswith(self.cache_root))
+        with open(path, "rb") as thumbnail:
+            self.assertEqual(thumbnail.read(4), b"\x89PNG")
+        with open(self.render(thumbnail=False), "rb") as plot:
+            self.assertEqual(plot.read(4), b"%PDF")
+
+    def test_up_to_date(self):
+        path = self.render()
+        os.utime(path, (1e9 + 1, 1e9 + 1))
+        self.assertEqual(self.render(), path)
+        self.assertGreater(os.stat(path).st_mtime, 1e9 + 1)
+        mtime = os.stat(path).st_mtime
+        self.assertEqual(self.render(), path)
+        self.assertEqual(os.stat(path).st_mtime, mtime)
+
+    @override_settings(PLOT_RENDERING_PROCESSES=1)
+    def test_in_flight(self):
+        """If another request is already rendering the plot, `render_plot` waits
+        for it instead of rendering the plot a second time.
+        """
+        destination = self.measurement.calculate_plot_locations("")["thumbnail_file"]
+        cache.set("plot-rendering:" + os.path.join(self.cache_root, destination), True)
+        self.assertIsNone(self.render(timeout=0.2))
+
+    @override_settings(PLOT_RENDERING_PROCESSES=1)
+    def test_deferred_scheduling(self):
+        with transaction.atomic():
+            plot_rendering.schedule_thumbnail(self.measurement)
+        self.assertEqual(plot_rendering._scheduled_renders.processes, {self.measurement.pk: self.measurement})
+        plot_rendering.discard_scheduled_thumbnails()
+        self.assertEqual(plot_rendering._scheduled_renders.processes, {})
+
+    def test_no_pool(self):
+        plot_rendering.schedule_thumbnail(self.measurement)
+        self.assertFalse(getattr(plot_rendering._scheduled_renders, "processes", None))
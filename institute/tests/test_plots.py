@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import os, glob, shutil, tempfile
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from django.test import SimpleTestCase, override_settings
+from samples.utils import plots
+from samples.utils.plots import PlotError, read_plot_file, read_plot_file_beginning_at_line_number, \
+    read_plot_file_beginning_after_start_value
+
+
+class ReadPlotFileTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(CACHE_ROOT=os.path.join(self.directory, "cache"))
+        self.settings_override.enable()
+        self.filename = self.write("# comment\n1 2,5 3\n\n2 x 4\n", mtime=1000000000)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def write(self, content, mtime=None):
+        filename = os.path.join(self.directory, "data.dat")
+        with open(filename, "w") as datafile:
+            datafile.write(content)
+        if mtime is not None:
+            os.utime(filename, (mtime, mtime))
+        return filename
+
+    def sidecars(self):
+        return glob.glob(os.path.join(self.directory, "cache", "plot_data", "*", "*.npy"))
+
+    def assertColumns(self, columns, expected):
+        self.assertEqual([[None if value != value else value for value in column] for column in columns], expected)
+
+    def test_read_plot_file(self):
+        self.assertColumns(read_plot_file(self.filename, [0, 1]), [[1, 2], [2.5, None]])
+        self.assertColumns(read_plot_file(self.filename, [2]), [[3, 4]])
+        self.assertRaises(PlotError, read_plot_file, self.filename, [3])
+        self.assertRaises(PlotError, read_plot_file, os.path.join(self.directory, "missing.dat"), [0])
+
+    def test_line_numbers_and_start_values(self):
+        filename = self.write("header\n[data]\n1;2\n3;4\n[end]\n5;6\n")
+        self.assertColumns(read_plot_file_beginning_at_line_number(filename, [1], 3, 4, ";"), [[2, 4]])
+        self.assertColumns(read_plot_file_beginning_after_start_value(filename, [0, 1], "[DATA]", "[end]", ";"),
+                           [[1, 3], [2, 4]])
+        self.assertColumns(read_plot_file_beginning_after_start_value(filename, [0], "[data]", separator=";"),
+                           [[1, 3, None, 5]])
+
+    def test_cache(self):
+        columns = read_plot_file(self.filename, [0, 2])
+        self.assertEqual(len(self.sidecars()), 1)
+        with mock.patch.object(plots, "parse_columns") as parse_columns:
+            cached_columns = read_plot_file(self.filename, [0, 2])
+        self.assertFalse(parse_columns.called)
+        self.assertColumns(cached_columns, [[1, 2], [3, 4]])
+        cached_columns[0][0] = 5
+        columns[0][0] = 5
+        self.assertColumns(read_plot_file(self.filename, [0, 2]), [[1, 2], [3, 4]])
+        # Other arguments are cached separately.
+        read_plot_file(self.filename, [0])
+        self.assertEqual(len(self.sidecars()), 2)
+
+    def test_invalidation(self):
+        read_plot_file(self.filename, [0])
+        old_sidecar, = self.sidecars()
+        self.write("7\n", mtime=1000000001)
+        self.assertColumns(read_plot_file(self.filename, [0]), [[7]])
+        new_sidecar, = self.sidecars()
+        self.assertNotEqual(new_sidecar, old_sidecar)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import os, shutil, tempfile, threading, time, socket
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from django.test import SimpleTestCase
+from jb_remote import settings
+from jb_remote.six.moves import urllib
+from jb_remote.common import connection, ConnectionPool, KeepAliveHandler, JuliaBaseConnection
+import jb_remote.samples
+from jb_remote.samples import SampleIDs, Sample
+
+
+class FakeConnection(object):
+
+    def __init__(self, name="connection"):
+        self.name, self.closed = name, False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def test_reuse(self):
+        pool = ConnectionPool()
+        connection_, reused = pool.get("key", lambda: FakeConnection("new"))
+        self.assertEqual((connection_.name, reused), ("new", False))
+        pool.put("key", connection_)
+        self.assertEqual(pool.get("key", lambda: FakeConnection("new")), (connection_, True))
+        self.assertEqual(pool.get("other key", lambda: FakeConnection("new"))[1], False)
+
+    def test_limit(self):
+        pool = ConnectionPool()
+        connections = [FakeConnection() for __ in range(settings.MAX_CONCURRENT_REQUESTS + 1)]
+        for connection_ in connections:
+            pool.put("key", connection_)
+        self.assertEqual(len(pool.idle_connections["key"]), settings.MAX_CONCURRENT_REQUESTS)
+        self.assertEqual([connection_.closed for connection_ in connections],
+                         settings.MAX_CONCURRENT_REQUESTS * [False] + [True])
+        pool.clear()
+        self.assertTrue(all(connection_.closed for connection_ in connections))
+        self.assertEqual(pool.idle_connections, {})
+
+
+class FakeResponse(object):
+
+    def __init__(self, body, will_close=False):
+        self.body, self.will_close = body, will_close
+        self.msg, self.status, self.reason = {"Content-Type": "text/plain"}, 200, "OK"
+
+    def read(self):
+        return self.body
+
+
+class FakeHTTPConnection(FakeConnection):
+    """Connection whose outcomes are taken from the class attribute
+    ``outcomes``: either a `FakeResponse` or an exception to raise.
+    """
+    outcomes = []
+    instances = []
+
+    def __init__(self, host, timeout):
+        super(FakeHTTPConnection, self).__init__(host)
+        self.requests = []
+        self.instances.append(self)
+
+    def request(self, method, selector, data, headers):
+        self.requests.append((method, selector))
+
+    def getresponse(self):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class KeepAliveHandlerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool()
+        self.handler = KeepAliveHandler(self.pool)
+        FakeHTTPConnection.outcomes, FakeHTTPConnection.instances = [], []
+
+    def open(self, url="http://juliabase.example.com/samples/14S-001"):
+        request = urllib.request.Request(url)
+        request.timeout = 10
+        return self.handler._open(FakeHTTPConnection, request)
+
+    def test_keep_alive(self):
+        FakeHTTPConnection.outcomes = [FakeResponse(b"first"), FakeResponse(b"second")]
+        self.assertEqual(self.open().read(), b"first")
+        self.assertEqual(self.open().read(), b"second")
+        self.assertEqual(len(FakeHTTPConnection.instances), 1)
+        self.assertEqual(FakeHTTPConnection.instances[0].requests, 2 * [("GET", "/samples/14S-001")])
+        self.assertFalse(FakeHTTPConnection.instances[0].closed)
+
+    def test_will_close(self):
+        FakeHTTPConnection.outcomes = [FakeResponse(b"", will_close=True), FakeResponse(b"")]
+        self.open()
+        self.assertTrue(FakeHTTPConnection.instances[0].closed)
+        self.open()
+        self.assertEqual(len(FakeHTTPConnection.instances), 2)
+
+    def test_stale_connection(self):
+        FakeHTTPConnection.outcomes = [FakeResponse(b""), socket.error("connection reset"), FakeResponse(b"fresh")]
+        self.open()
+        self.assertEqual(self.open().read(), b"fresh")
+        self.assertEqual(len(FakeHTTPConnection.instances), 2)
+        self.assertTrue(FakeHTTPConnection.instances[0].closed)
+
+    def test_error_on_new_connection(self):
+        FakeHTTPConnection.outcomes = [socket.error("connection refused")]
+        self.assertRaises(urllib.error.URLError, self.open)
+        self.assertTrue(FakeHTTPConnection.instances[0].closed)
+        self.assertEqual(self.pool.idle_connections, {})
+
+
+class ParallelRequestsTest(SimpleTestCase):
+
+    def setUp(self):
+        self.connection = JuliaBaseConnection()
+
+    def tearDown(self):
+        if self.connection.thread_pool:
+            self.connection.thread_pool.terminate()
+
+    def test_submit(self):
+        future = self.connection.submit(lambda a, b: a * b, 3, b=4)
+        self.assertEqual(future.result(5), 12)
+        self.assertTrue(future.done())
+        future = self.connection.submit(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, future.result, 5)
+
+    def test_map(self):
+        lock = threading.Lock()
+        running = [0, 0]
+        def function(index, factor):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return index * factor
+        indices = list(range(3 * settings.MAX_CONCURRENT_REQUESTS))
+        self.assertEqual(self.connection.map(function, indices, len(indices) * [2]), [2 * i for i in indices])
+        self.assertTrue(1 < running[1] <= settings.MAX_CONCURRENT_REQUESTS)
+
+
+class BackoffTest(SimpleTestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        patchers = [mock.patch("jb_remote.common.time.sleep", self.sleeps.append),
+                    mock.patch("jb_remote.common.random.uniform", lambda low, high: high)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_backoff(self):
+        with mock.patch.object(connection.opener, "open", side_effect=urllib.error.URLError("down")) as open_:
+            self.assertRaises(urllib.error.URLError, connection._do_http_request, "http://juliabase.example.com/")
+        self.assertEqual(open_.call_count, 10)
+        self.assertEqual(self.sleeps, [0.25, 0.5, 1, 2, 4, 8, 16, 30, 30])
+
+    def test_recovery(self):
+        with mock.patch.object(connection.opener, "open", side_effect=[urllib.error.URLError("down"), "response"]):
+            self.assertEqual(connection._do_http_request("http://juliabase.example.com/"), "response")
+        self.assertEqual(self.sleeps, [0.25])
+
+
+class SampleIDsTest(SimpleTestCase):
+    server_ids = {"14S-001": 1, "14S-002": 2, "ambiguous": [3, 4]}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.requested_names = []
+        self.now = 1000000000
+        patchers = [mock.patch.object(settings, "SAMPLE_IDS_CACHE_PATH", os.path.join(self.directory, "ids.json")),
+                    mock.patch.object(settings, "SAMPLE_IDS_TTL", 3600),
+                    mock.patch.object(connection, "open", self.open),
+                    mock.patch.object(jb_remote.samples.time, "time", lambda: self.now)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sample_ids = SampleIDs()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self, relative_url, data=None, response_is_json=True, result_callback=None):
+        path, __, names = relative_url.partition("?samples=")
+        self.assertEqual(path, "primary_keys")
+        names = [urllib.parse.unquote_plus(name) for name in names.split(",")]
+        self.requested_names.append(sorted(names))
+        return {"samples": {name: self.server_ids[name] for name in names if name in self.server_ids}}
+
+    def test_lookup(self):
+        self.assertEqual(self.sample_ids.lookup(["14S-001", "14S-002", "14S-002", "unknown", "ambiguous"]),
+                         {"14S-001": 1, "14S-002": 2})
+        self.assertEqual(self.requested_names, [["14S-001", "14S-002", "ambiguous", "unknown"]])
+        self.assertEqual(self.sample_ids.lookup(["14S-001", "unknown"]), {"14S-001": 1})
+        self.assertEqual(self.requested_names[1:], [["unknown"]])
+
+    def test_chunks(self):
+        with mock.patch.object(SampleIDs, "chunk_size", 2):
+            self.assertEqual(self.sample_ids.lookup(["14S-001", "14S-002", "unknown"]), {"14S-001": 1, "14S-002": 2})
+        self.assertEqual(len(self.requested_names), 2)
+
+    def test_ttl(self):
+        self.sample_ids.lookup(["14S-001"])
+        self.now += 3599
+        self.sample_ids.lookup(["14S-001"])
+        self.assertEqual(len(self.requested_names), 1)
+        self.now += 1
+        self.sample_ids.lookup(["14S-001"])
+        self.assertEqual(len(self.requested_names), 2)
+
+    def test_discard(self):
+        self.sample_ids.lookup(["14S-001"])
+        self.sample_ids.discard("14S-001")
+        self.sample_ids.discard("unknown")
+        self.sample_ids.lookup(["14S-001"])
+        self.assertEqual(len(self.requested_names), 2)
+
+    def test_persistence(self):
+        self.sample_ids.update({"14S-001": 1})
+        self.now += 3000
+        self.sample_ids.update({"14S-002": 2})
+        self.now += 1000
+        self.sample_ids.save()
+        self.assertEqual(os.listdir(self.directory), ["ids.json"])
+        self.assertEqual(SampleIDs().lookup(["14S-001", "14S-002"]), {"14S-001": 1, "14S-002": 2})
+        self.assertEqual(self.requested_names, [["14S-001"]])
+
+    def test_sample_submit(self):
+        with mock.patch.object(jb_remote.samples, "sample_ids", self.sample_ids), \
+             mock.patch.object(jb_remote.samples, "primary_keys", {"users": {"r.calvert": 7}}), \
+             mock.patch.object(connection, "open", lambda relative_url, data, result_callback=None: 42):
+            sample = Sample()
+            sample.name, sample.currently_responsible_person = "14S-003", "r.calvert"
+            self.assertEqual(sample.submit(), 42)
+            self.assertEqual(self.sample_ids.lookup(["14S-003"]), {"14S-003": 42})
+            sample.name = "14S-004"
+            sample.submit()
+        self.assertEqual(self.sample_ids.lookup(["14S-003", "14S-004"]), {"14S-004": 42})
+        self.assertEqual(self.requested_names, [["14S-003"]])
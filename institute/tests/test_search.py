@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+import django.utils.timezone
+from jb_common.models import Topic
+from jb_common import search
+from jb_common.search import get_search_results, get_search_tree_node
+from samples import permissions
+from samples.models import Sample, SampleSeries, Result, Process, Clearance
+from institute.models import PDSMeasurement, LayerThicknessMeasurement
+
+
+class SearchResultsTest(TestCase):
+    fixtures = ["test_main"]
+
+    def get_search_tree(self):
+        search_tree = Sample.get_search_tree_node()
+        search_tree.parse_data({}, "")
+        self.assertTrue(search_tree.is_valid())
+        return search_tree
+
+    def test_paging(self):
+        all_ids = list(Sample.objects.order_by("-pk").values_list("pk", flat=True))
+        self.assertGreater(len(all_ids), 5)
+        found_ids, before = [], None
+        while True:
+            with self.assertNumQueries(2):
+                results, too_many_results = get_search_results(self.get_search_tree(), 5, before=before)
+            found_ids.extend(sorted((sample.pk for sample in results), reverse=True))
+            if not too_many_results:
+                break
+            self.assertEqual(len(results), 5)
+            before = min(sample.pk for sample in results)
+        self.assertEqual(found_ids, all_ids)
+
+    def test_too_many_results(self):
+        number = Sample.objects.count()
+        self.assertEqual(get_search_results(self.get_search_tree(), number)[1], False)
+        self.assertEqual(get_search_results(self.get_search_tree(), number - 1)[1], True)
+        results, too_many_results = get_search_results(self.get_search_tree(), number,
+                                                       Sample.objects.filter(name__startswith="14S-00"))
+        self.assertEqual({sample.name for sample in results}, set(Sample.objects.filter(name__startswith="14S-00").
+                                                                    values_list("name", flat=True)))
+        self.assertFalse(too_many_results)
+
+
+class ViewableInstancesTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        now = django.utils.timezone.now()
+        r_calvert, h_griffin = User.objects.get(username="r.calvert"), User.objects.get(username="h.griffin")
+        topic = Topic.objects.get(pk=3)
+        topic.confidential = True
+        topic.save()
+        sample_series = SampleSeries.objects.create(name="r.calvert-14-Series", timestamp=now, topic=topic,
+                                                    currently_responsible_person=r_calvert, description="")
+        sample_series.samples = Sample.objects.filter(name__in=["14S-001", "14S-002"])
+        result = Result.objects.create(operator=h_griffin, timestamp=now, title="Griffin's result")
+        result.samples = Sample.objects.filter(name="14S-001")
+        result = Result.objects.create(operator=r_calvert, timestamp=now, title="Series result")
+        sample_series.results.add(result)
+        clearance = Clearance.objects.create(user=h_griffin, sample=Sample.objects.get(name="14S-003"))
+        clearance.processes = Sample.objects.get(name="14S-003").processes.all()[:1]
+
+    def test_equivalence(self):
+        instances = list(Sample.objects.all()) + list(SampleSeries.objects.all()) + \
+            [process.actual_instance for process in Process.objects.all()]
+        checks = ((Sample, permissions.has_permission_to_fully_view_sample),
+                  (SampleSeries, permissions.has_permission_to_view_sample_series),
+                  (Result, permissions.has_permission_to_view_result_process),
+                  (Process, permissions.has_permission_to_view_physical_process))
+        numbers_of_viewable_instances = set()
+        for user in User.objects.all():
+            expected = []
+            for instance in instances:
+                for model, has_permission in checks:
+                    if isinstance(instance, model):
+                        if has_permission(User.objects.get(pk=user.pk), instance):
+                            expected.append(instance)
+                        break
+            self.assertEqual(permissions.get_viewable_instances(User.objects.get(pk=user.pk), instances), expected,
+                             user.username)
+            numbers_of_viewable_instances.add(len(expected))
+        self.assertGreater(len(numbers_of_viewable_instances), 3)
+
+
+class SearchTreeCloneTest(TestCase):
+    fixtures = ["test_main"]
+    data = {"name": "14S-00", "1-_model": "PDSMeasurement", "1-_old_model": "PDSMeasurement"}
+
+    def assertIndependent(self, first, second):
+        self.assertIsNot(first.children, second.children)
+        for first_field, second_field in zip(first.search_fields, second.search_fields):
+            self.assertIsNot(first_field, second_field)
+
+    def test_clones(self):
+        PDSMeasurement.objects.get(number=1).samples.add(Sample.objects.get(name="14S-001"))
+        first, second = get_search_tree_node(Sample), get_search_tree_node(Sample)
+        self.assertIsInstance(first, search.DetailsSearchTreeNode)
+        self.assertIndependent(first, second)
+        self.assertIsNot(first.details_node, second.details_node)
+        self.assertIndependent(first.details_node, second.details_node)
+        # Within one clone, the search fields of the details node are still
+        # the merged ones.
+        for search_field in first.details_node.search_fields:
+            self.assertTrue(any(search_field is field for field in first.search_fields))
+        first.parse_data(self.data, "")
+        self.assertTrue(first.is_valid())
+        self.assertEqual([sample.name for sample in get_search_results(first, 10)[0]], ["14S-001"])
+        self.assertEqual(len(first.children), 2)
+        self.assertEqual((second.children, second.details_node.children), ([], []))
+        self.assertFalse(any(hasattr(search_field, "form") for search_field in second.search_fields))
+        second.parse_data({}, "")
+        self.assertTrue(second.is_valid())
+        self.assertEqual(len(get_search_results(second, 100)[0]), Sample.objects.count())
+        self.assertEqual(first.search_fields[0].form.cleaned_data["name"], "14S-00")
+        prototype = search.search_tree_prototypes[Sample]
+        self.assertEqual((prototype.children, prototype.details_node.children), ([], []))
+
+    def test_abstract_clones(self):
+        prototype = search.AbstractSearchTreeNode(Process, {}, [search.TextSearchField(Process, "comments")],
+                                                  [PDSMeasurement, LayerThicknessMeasurement])
+        first, second = prototype.clone(), prototype.clone()
+        self.assertIndependent(first, second)
+        self.assertIs(first.derivative_choice, first.search_fields[-1])
+        self.assertIsNot(first.derivative_choice, second.derivative_choice)
+        for first_derivative, second_derivative in zip(first.derivatives, second.derivatives):
+            self.assertIs(first_derivative.children, first.children)
+            self.assertIs(first_derivative.search_fields[0], first.search_fields[0])
+            self.assertIndependent(first_derivative, second_derivative)
+        first.parse_data({"derivative": "PDSMeasurement"}, "")
+        self.assertTrue(first.is_valid())
+        self.assertEqual({type(process) for process in get_search_results(first, 100)[0]}, {PDSMeasurement})
+        self.assertFalse(hasattr(second.derivative_choice, "form"))
+        self.assertFalse(hasattr(prototype.derivatives[0].search_fields[0], "form"))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+from django.test import TestCase, override_settings
+from django.test.client import Client
+from django.contrib.auth.models import User
+import django.utils.timezone
+from jb_common.models import Topic
+from samples.data_tree import DataNode, DataItem
+from samples.models import Sample, SampleSeries
+from samples.views.table_export import build_column_group_list, build_column_group_list_from_row_trees, \
+    flatten_tree, generate_table_rows, generate_table_rows_lazily
+
+
+def create_row_trees(consumed=None):
+    for i, extra_keys in enumerate([[], ["voltage"], ["current", "voltage"]]):
+        if consumed is not None:
+            consumed.append(i)
+        row_tree = DataNode("sample", "14S-00{0}".format(i))
+        row_tree.items = [DataItem("name", "14S-00{0}".format(i)), DataItem("location", "lab {0}".format(i))]
+        for j in range(i + 1):
+            result = DataNode("result")
+            result.items = [DataItem("title", "result {0}".format(j))] + \
+                [DataItem(key, "{0} {1}".format(key, i)) for key in extra_keys]
+            row_tree.children.append(result)
+        yield row_tree
+
+
+class LazyTableRowsTest(TestCase):
+
+    def generate_rows_lazily(self, row_trees, selected_key_indices=None):
+        def prepared_row_trees():
+            for row_tree in create_row_trees():
+                row_tree.find_unambiguous_names(0)
+                yield row_tree
+        __, columns = build_column_group_list_from_row_trees(prepared_row_trees())
+        if selected_key_indices is None:
+            selected_key_indices = list(range(len(columns)))
+        return generate_table_rows_lazily(row_trees, columns, selected_key_indices, True, "sample")
+
+    def test_equivalence(self):
+        root = DataNode("root")
+        root.children = list(create_row_trees())
+        root.find_unambiguous_names()
+        root.complete_items_in_children()
+        __, columns = build_column_group_list(root)
+        table = generate_table_rows(flatten_tree(root), columns, list(range(len(columns))),
+                                    [row_tree.descriptive_name for row_tree in root.children], "sample")
+        lazy_table = list(self.generate_rows_lazily(create_row_trees()))
+        def as_dicts(table):
+            return [dict(zip(table[0], row)) for row in table[1:]]
+        self.assertEqual(sorted(lazy_table[0]), sorted(table[0]))
+        self.assertEqual(as_dicts(lazy_table), as_dicts(table))
+        self.assertEqual(lazy_table[3][0], "14S-002")
+        self.assertIn("voltage {result\xa0#3}", lazy_table[0])
+
+    def test_laziness(self):
+        consumed = []
+        rows = self.generate_rows_lazily(create_row_trees(consumed), [0])
+        self.assertEqual(next(rows), ["sample", "name"])
+        self.assertEqual(consumed, [])
+        self.assertEqual(next(rows), ["14S-000", "14S-000"])
+        self.assertEqual(consumed, [0])
+
+
+@override_settings(ROOT_URLCONF="institute.tests.urls")
+class StreamingExportTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        r_calvert = User.objects.get(username="r.calvert")
+        self.sample_series = SampleSeries.objects.create(
+            name="r.calvert-14-Series", timestamp=django.utils.timezone.now(), topic=Topic.objects.get(pk=3),
+            currently_responsible_person=r_calvert, description="")
+        self.sample_series.samples = Sample.objects.filter(name__in=["14S-001", "14S-002", "14S-003"])
+        self.client = Client()
+        assert self.client.login(username="r.calvert", password="12345")
+        self.url = "/sample_series/r.calvert-14-Series/export/"
+
+    def test_csv(self):
+        response = self.client.get(self.url, {"stream": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual([line.split("\t")[0] for line in lines[1:]], ["14S-001", "14S-002", "14S-003"])
+        response = self.client.get(self.url, {"stream": "1", "columns": ["0", "1"]})
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual({len(line.split("\t")) for line in lines}, {3})
+
+    def test_json_lines(self):
+        response = self.client.get(self.url, {"stream": "1"}, HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode("utf-8").splitlines()]
+        self.assertEqual([row["sample"] for row in rows], ["14S-001", "14S-002", "14S-003"])
+
+    def test_invalid_columns(self):
+        self.assertEqual(self.client.get(self.url, {"stream": "1", "columns": "100000"}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {"stream": "1", "columns": "x"}).status_code, 404)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
+
+import os, shutil, tempfile
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+import PIL.Image
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+import django.utils.timezone
+import jb_common.utils.blobs
+from jb_common.utils.blobs.backends import Filesystem
+from samples.models import Result
+from samples.utils import thumbnails
+
+
+def create_image(width, height, mode="RGB", image_format="png"):
+    output = six.BytesIO()
+    PIL.Image.new(mode, (width, height)).save(output, image_format)
+    return output.getvalue()
+
+
+def image_properties(content):
+    image = PIL.Image.open(six.BytesIO(content))
+    return image.format, image.size
+
+
+class ScaleImageTest(TestCase):
+
+    def test_scale_image(self):
+        self.assertEqual(image_properties(thumbnails.scale_image(create_image(400, 200), 100, "png")),
+                         ("PNG", (100, 50)))
+        self.assertEqual(image_properties(thumbnails.scale_image(create_image(20, 10), 100, "png")), ("PNG", (20, 10)))
+        self.assertEqual(image_properties(thumbnails.scale_image(create_image(200, 400, "RGBA"), 100, "jpeg")),
+                         ("JPEG", (50, 100)))
+
+    def test_rasterize_pdf(self):
+        with mock.patch.object(thumbnails, "_rasterize_pdf", return_value=b"png") as rasterize_pdf:
+            with mock.patch("samples.utils.plot_rendering.get_pool", return_value=None):
+                self.assertEqual(thumbnails.rasterize_pdf(b"%PDF", 100), b"png")
+            rasterize_pdf.assert_called_once_with(b"%PDF", 100)
+            pool = mock.Mock()
+            pool.apply.return_value = b"pooled png"
+            with mock.patch("samples.utils.plot_rendering.get_pool", return_value=pool):
+                self.assertEqual(thumbnails.rasterize_pdf(b"%PDF", 100), b"pooled png")
+            pool.apply.assert_called_once_with(rasterize_pdf, (b"%PDF", 100))
+            self.assertEqual(rasterize_pdf.call_count, 1)
+
+
+@override_settings(THUMBNAIL_WIDTH=100)
+class ResultThumbnailTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(CACHE_ROOT=os.path.join(self.directory, "cache"))
+        self.settings_override.enable()
+        patcher = mock.patch.object(jb_common.utils.blobs, "storage", Filesystem(os.path.join(self.directory, "blobs")))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.result = Result.objects.create(operator=User.objects.get(username="r.calvert"), title="Image",
+                                            timestamp=django.utils.timezone.now(), image_type="png")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def store_image(self, content, mtime):
+        image_file = jb_common.utils.blobs.storage.open(self.result.get_image_locations()["image_file"], "w")
+        image_file.write(content)
+        image_file.close()
+        path = os.path.join(self.directory, "blobs", self.result.get_image_locations()["image_file"])
+        os.utime(path, (mtime, mtime))
+
+    def test_generation(self):
+        self.store_image(create_image(400, 200), 1000000000)
+        path = thumbnails.get_result_thumbnail(self.result)
+        self.assertTrue(path.startswith(os.path.join(self.directory, "cache")))
+        with open(path, "rb") as thumbnail:
+            self.assertEqual(image_properties(thumbnail.read()), ("PNG", (100, 50)))
+        with mock.patch.object(thumbnails, "generate_result_thumbnail") as generate_result_thumbnail:
+            self.assertEqual(thumbnails.get_result_thumbnail(self.result), path)
+        self.assertFalse(generate_result_thumbnail.called)
+        self.store_image(create_image(200, 400), os.path.getmtime(path) + 10)
+        self.assertEqual(thumbnails.get_result_thumbnail(self.result), path)
+        with open(path, "rb") as thumbnail:
+            self.assertEqual(image_properties(thumbnail.read()), ("PNG", (50, 100)))
+
+    def test_pdf(self):
+        self.result.image_type = "pdf"
+        self.result.save()
+        self.store_image(b"%PDF-1.4", 1000000000)
+        with mock.patch.object(thumbnails, "rasterize_pdf", return_value=create_image(2000, 1000)) as rasterize_pdf:
+            path = thumbnails.get_result_thumbnail(self.result)
+        rasterize_pdf.assert_called_once_with(b"%PDF-1.4", 200 / (210 / 25.4))
+        with open(path, "rb") as thumbnail:
+            self.assertEqual(image_properties(thumbnail.read()), ("PNG", (100, 50)))
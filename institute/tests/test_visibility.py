@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+import django.apps
+from django.db.models import signals
+from django.test import TestCase
+from django.core import serializers
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from jb_common.models import Topic
+from samples.models import Sample, SampleVisibility, Clearance
+from samples.utils.visibility import get_visibilities
+
+
+class SampleVisibilityTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.topic = Topic.objects.get(pk=3)
+        self.sample = Sample.objects.create(name="SECRET-1", current_location="lab", topic=self.topic,
+                                            currently_responsible_person=User.objects.get(username="j.silverton"))
+
+    def assertVisibility(self, usernames, sample=None):
+        """Asserts that the sample's name is visible exactly to the given users,
+        where ``None`` means everyone, and that the stored rows are the same as
+        if they were computed from scratch.
+        """
+        sample = sample or self.sample
+        stored = set(SampleVisibility.objects.filter(sample=sample).values_list("sample", "user"))
+        self.assertEqual(stored, get_visibilities(Sample.objects.filter(pk=sample.pk)))
+        self.assertEqual({user_id and User.objects.get(pk=user_id).username for __, user_id in stored}, set(usernames))
+
+    def send_post_migrate(self, app_label):
+        app_config = django.apps.apps.get_app_config(app_label)
+        signals.post_migrate.send(sender=app_config, app_config=app_config, verbosity=0, interactive=False,
+                                  using="default")
+
+    def make_confidential(self, confidential=True):
+        self.topic.confidential = confidential
+        self.topic.save()
+
+    def test_confidential_toggle(self):
+        self.assertVisibility({None})
+        self.make_confidential()
+        self.assertVisibility({"n.burkhardt", "e.monroe", "r.calvert", "j.silverton"})
+        self.make_confidential(False)
+        self.assertVisibility({None})
+
+    def test_topic_membership(self):
+        self.make_confidential()
+        self.topic.members.add(User.objects.get(username="h.griffin"))
+        self.assertVisibility({"n.burkhardt", "e.monroe", "r.calvert", "j.silverton", "h.griffin"})
+        self.topic.members.remove(User.objects.get(username="n.burkhardt"))
+        self.assertVisibility({"e.monroe", "r.calvert", "j.silverton", "h.griffin"})
+        User.objects.get(username="s.renard").topics.add(self.topic)
+        self.assertVisibility({"e.monroe", "r.calvert", "j.silverton", "h.griffin", "s.renard"})
+        User.objects.get(username="e.monroe").topics.clear()
+        self.assertVisibility({"r.calvert", "j.silverton", "h.griffin", "s.renard"})
+        self.topic.members.clear()
+        self.assertVisibility({"j.silverton"})
+
+    def test_responsible_person(self):
+        self.make_confidential()
+        self.sample.currently_responsible_person = User.objects.get(username="h.griffin")
+        self.sample.save()
+        self.assertVisibility({"n.burkhardt", "e.monroe", "r.calvert", "h.griffin"})
+
+    def test_clearance(self):
+        self.make_confidential()
+        clearance = Clearance.objects.create(user=User.objects.get(username="s.renard"), sample=self.sample)
+        self.assertVisibility({"n.burkhardt", "e.monroe", "r.calvert", "j.silverton", "s.renard"})
+        clearance.delete()
+        self.assertVisibility({"n.burkhardt", "e.monroe", "r.calvert", "j.silverton"})
+        Clearance.objects.create(user=User.objects.get(username="r.calvert"), sample=self.sample).delete()
+        self.assertVisibility({"n.burkhardt", "e.monroe", "r.calvert", "j.silverton"})
+
+    def test_raw_saves(self):
+        """Fixtures are saved “raw”, and the topic of a sample may be loaded after
+        the sample.
+        """
+        data = json.dumps([{"model": "samples.sample", "pk": 1000,
+                            "fields": {"name": "RAWSAMPLE", "current_location": "lab", "currently_responsible_person": 7,
+                                       "topic": 1000, "purpose": "", "tags": "",
+                                       "last_modified": "2015-01-01T00:00:00Z"}},
+                           {"model": "samples.clearance", "pk": 1000,
+                            "fields": {"user": 8, "sample": 1000, "last_modified": "2015-01-01T00:00:00Z"}},
+                           {"model": "jb_common.topic", "pk": 1000,
+                            "fields": {"name": "Secret", "confidential": True, "department": 1, "manager": 4,
+                                       "members": [4]}}])
+        for deserialized_object in serializers.deserialize("json", data):
+            deserialized_object.save()
+        self.assertVisibility({"r.calvert", "s.renard", "h.griffin"}, Sample.objects.get(pk=1000))
+
+    def test_rebuild(self):
+        self.make_confidential()
+        SampleVisibility.objects.filter(sample=self.sample).delete()
+        self.send_post_migrate("jb_common")
+        self.assertFalse(SampleVisibility.objects.filter(sample=self.sample).exists())
+        self.send_post_migrate("samples")
+        self.assertVisibility({"n.burkhardt", "e.monroe", "r.calvert", "j.silverton"})
+        Topic.objects.filter(pk=self.topic.pk).update(confidential=False)
+        call_command("rebuild_sample_visibility")
+        self.assertVisibility({None})
+        self.assertVisibility({None}, Sample.objects.get(name="14S-002"))
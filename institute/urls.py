@@ -56,6 +56,7 @@ urlpatterns = [
         "stack_diagram_thumbnail"),
     url(r"layouts/(?P<sample_id>\d+)/(?P<process_id>\d+)$", layout.show_layout, name="show_layout"),
     url(r"^printer_label/(?P<sample_id>\d+)$", sample.printer_label, name="printer_label"),
+    url(r"^printer_labels$", sample.multiple_printer_labels, name="printer_labels"),
     url(r"^trac/", TemplateView.as_view(template_name="bug_tracker.html")),
 
     # Remote client
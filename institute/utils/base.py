@@ -22,12 +22,10 @@
 
 
 from __future__ import absolute_import, unicode_literals, division
-from django.utils.six.moves import cStringIO as StringIO
 
 import datetime, re
-import numpy
 from samples import models
-from samples.utils.plots import PlotError
+from samples.utils.plots import PlotError, get_cached_columns, parse_columns
 from institute.views.samples import json_client
 
 
@@ -82,6 +80,29 @@ def clean_up_after_merging(from_sample, to_sample):
             substrate_from_sample.delete()
 
 
+def _parse_solarsimulator_plot_file(filename, position):
+    """Parser for `read_solarsimulator_plot_file`, to be used with
+    :py:func:`samples.utils.plots.get_cached_columns`.  The columns of the cell
+    positions are given in the ``# Positions:`` header line.  See
+    `read_solarsimulator_plot_file` for the parameters.
+    """
+    try:
+        lines = open(filename).read().splitlines()
+    except IOError:
+        raise PlotError("Data file could not be read.")
+    for line in lines:
+        if line.startswith("# Positions:"):
+            positions = line.partition(":")[2].split()
+            break
+    else:
+        positions = []
+    try:
+        column = positions.index(position) + 1
+    except ValueError:
+        raise PlotError("Cell position not found in the datafile.")
+    return parse_columns(lines, [0, column], comments="#")
+
+
 def read_solarsimulator_plot_file(filename, position):
     """Read a datafile from a solarsimulator measurement and return the content of
     the voltage column and the selected current column.
@@ -95,27 +116,10 @@ def read_solarsimulator_plot_file(filename, position):
     :return:
       all voltages in Volt, then all currents in Ampere
 
-    :rtype: list of float, list of float
+    :rtype: ``numpy.ndarray``, ``numpy.ndarray``
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
         unparseble data)
     """
-    try:
-        datafile_content = StringIO(open(filename).read())
-    except IOError:
-        raise PlotError("Data file could not be read.")
-    for line in datafile_content:
-        if line.startswith("# Positions:"):
-            positions = line.partition(":")[2].split()
-            break
-    else:
-        positions = []
-    try:
-        column = positions.index(position) + 1
-    except ValueError:
-        raise PlotError("Cell position not found in the datafile.")
-    datafile_content.seek(0)
-    try:
-        return numpy.loadtxt(datafile_content, usecols=(0, column), unpack=True)
-    except ValueError:
-        raise PlotError("Data file format was invalid.")
+    x_values, y_values = get_cached_columns(filename, _parse_solarsimulator_plot_file, position)
+    return x_values, y_values
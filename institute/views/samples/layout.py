@@ -22,8 +22,9 @@
 
 
 from __future__ import unicode_literals, absolute_import, division
+import django.utils.six as six
 
-import os, subprocess, uuid
+import os
 from functools import partial
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
@@ -31,22 +32,18 @@ from django.http import Http404
 from django.shortcuts import get_object_or_404
 import jb_common.utils.base
 import samples.utils.views as utils
+from samples.utils import thumbnails
 from institute import models
 from institute import layouts
 
 
 def generate_layout(sample, process):
-    # FixMe: This should be implemented without writing to the disk.
-    pdf_filename = "/tmp/layouts_{}.pdf".format(uuid.uuid4())
     layout = layouts.get_layout(sample, process)
     if not layout:
         raise Http404("error")
-    layout.generate_pdf(pdf_filename)
-    resolution = settings.THUMBNAIL_WIDTH / (layout.width / 72)
-    content = subprocess.check_output(["gs", "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pngalpha", "-r{0}".format(resolution),
-                                       "-dEPSCrop", "-sOutputFile=-", pdf_filename])
-    os.unlink(pdf_filename)
-    return content
+    output = six.BytesIO()
+    layout.generate_pdf(output)
+    return thumbnails.rasterize_pdf(output.getvalue(), settings.THUMBNAIL_WIDTH / (layout.width / 72))
 
 
 @login_required
@@ -56,4 +53,4 @@ def show_layout(request, process_id, sample_id):
     png_filename = os.path.join("layouts", "{0}-{1}.png".format(process.id, sample.id))
     content = jb_common.utils.base.get_cached_file_content(
         png_filename, partial(generate_layout, sample, process), timestamps=[sample.last_modified, process.last_modified])
-    return jb_common.utils.base.static_response(content, png_filename)
+    return jb_common.utils.base.static_response(content, png_filename, request=request)
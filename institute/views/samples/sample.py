@@ -34,14 +34,14 @@ from django.shortcuts import render, get_object_or_404
 import django.forms as forms
 from django.forms.utils import ValidationError
 from django.forms import widgets
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 from django.utils.html import format_html, format_html_join
 from django.utils.translation import ugettext, ugettext_lazy as _
 from django.utils.text import capfirst
 import django.utils.timezone
 from django.contrib.auth.decorators import login_required
 import django.core.urlresolvers
-from jb_common.utils.base import help_link, get_really_full_name, int_or_zero
+from jb_common.utils.base import help_link, get_really_full_name, int_or_zero, static_response
 from jb_common.utils.views import TopicField
 from samples import models, permissions
 import samples.utils.views as utils
@@ -330,4 +330,46 @@ def printer_label(request, sample_id):
     return response
 
 
+@login_required
+def multiple_printer_labels(request):
+    """Generates one PDF for the label printer with the labels of many samples.
+    The samples are given in the query string: ``split`` is the ID of a sample
+    split (all its pieces are taken), ``series`` is the name of a sample
+    series, and ``samples`` is a comma-separated list of sample IDs.  If none
+    of them is given, the labels of “My Samples” are generated.
+
+    :param request: the current HTTP Request object
+
+    :type request: HttpRequest
+
+    :return:
+      the HTTP response object
+
+    :rtype: HttpResponse
+    """
+    title = None
+    if "split" in request.GET:
+        split = get_object_or_404(models.SampleSplit, pk=utils.convert_id_to_int(request.GET["split"]))
+        samples = list(split.pieces.all())
+        title = split.parent.name
+    elif "series" in request.GET:
+        sample_series = get_object_or_404(models.SampleSeries, name=request.GET["series"])
+        permissions.assert_can_view_sample_series(request.user, sample_series)
+        samples = list(sample_series.samples.all())
+        title = sample_series.name
+    elif "samples" in request.GET:
+        sample_ids = [utils.convert_id_to_int(sample_id) for sample_id in request.GET["samples"].split(",")]
+        samples = list(models.Sample.objects.in_bulk(sample_ids).values())
+    else:
+        samples = list(request.user.my_samples.all())
+        title = _("My Samples")
+    if not samples:
+        raise Http404("No samples given.")
+    if "series" not in request.GET:
+        for sample in samples:
+            permissions.get_sample_clearance(request.user, sample)
+    samples.sort(key=lambda sample: sample.name)
+    return static_response(printer_labels.printer_labels(samples, title), content_type="application/pdf")
+
+
 _ = ugettext
@@ -27,7 +27,6 @@
 from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 
-import subprocess, uuid, os
 from functools import partial
 from django.http import Http404
 from django.shortcuts import get_object_or_404
@@ -37,21 +36,18 @@ from django.utils.translation import ugettext as _
 import jb_common.utils.base
 from samples import permissions
 import samples.utils.views as utils
+from samples.utils import thumbnails
 from institute import models, informal_stacks
 
 
 def generate_stack(thumbnail, locations, sample, sample_details):
-    # FixMe: This should be implemented without writing to the disk.
-    pdf_filename = "/tmp/stack_{}.pdf".format(uuid.uuid4())
+    output = six.BytesIO()
     informal_stacks.generate_diagram(
-        pdf_filename, [informal_stacks.Layer(layer) for layer in sample_details.informal_layers.all()],
+        output, [informal_stacks.Layer(layer) for layer in sample_details.informal_layers.all()],
         six.text_type(sample), _("Layer stack of {0}").format(sample))
+    content = output.getvalue()
     if thumbnail:
-        content = subprocess.check_output(["gs", "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pngalpha", "-r100", "-dEPSCrop",
-                                           "-sOutputFile=-", pdf_filename])
-    else:
-        content = open(pdf_filename, "rb").read()
-    os.unlink(pdf_filename)
+        content = thumbnails.rasterize_pdf(content, 100)
     return content
 
 
@@ -85,4 +81,4 @@ def show_stack(request, sample_id, thumbnail):
         filepath, partial(generate_stack, thumbnail, locations, sample, sample_details), timestamps=[sample.last_modified])
     return jb_common.utils.base.static_response(
         content, None if thumbnail else "{0}_stack.pdf".format(defaultfilters.slugify(six.text_type(sample))),
-        "image/png" if thumbnail else "application/pdf")
+        "image/png" if thumbnail else "application/pdf", request)
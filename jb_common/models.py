@@ -229,6 +229,74 @@ class Topic(models.Model):
             return self
 
 
+def resolve_actual_instances(instances):
+    """Resolves the polymorphy of many instances of a :py:class:`PolymorphicModel`
+    at once.  Accessing ``actual_instance`` on each instance costs one query
+    per instance.  This function groups the instances by content type and
+    fetches the actual instances with one query per concrete model instead.
+    Instances which already are of their actual class don't cause a query at
+    all.
+
+    Additionally, the fetched actual instances are stored in the cache of
+    ``actual_instance`` of the given instances, so that accessing this
+    attribute later is for free.
+
+    :param instances: the instances which should be resolved; they all must be
+      instances of :py:class:`PolymorphicModel` subclasses
+
+    :type instances: iterable of `PolymorphicModel`
+
+    :return:
+      the actual instances, in the same order as `instances`; if an actual
+      instance could not be found, it is ``None`` (like it would be with
+      ``actual_instance``)
+
+    :rtype: list of `PolymorphicModel`
+    """
+    instances = list(instances)
+    pending_ids = {}
+    for instance in instances:
+        cache_attr = type(instance).actual_instance.cache_attr
+        if hasattr(instance, cache_attr) or instance.content_type_id is None or instance.actual_object_id is None:
+            continue
+        if ContentType.objects.get_for_model(instance).id == instance.content_type_id:
+            setattr(instance, cache_attr, instance)
+        else:
+            pending_ids.setdefault(instance.content_type_id, set()).add(instance.actual_object_id)
+    actual_instances = {}
+    for content_type_id, ids in pending_ids.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for id_, actual_instance in model._base_manager.in_bulk(ids).items():
+            setattr(actual_instance, type(actual_instance).actual_instance.cache_attr, actual_instance)
+            actual_instances[content_type_id, id_] = actual_instance
+    result = []
+    for instance in instances:
+        cache_attr = type(instance).actual_instance.cache_attr
+        if not hasattr(instance, cache_attr):
+            setattr(instance, cache_attr,
+                    actual_instances.get((instance.content_type_id, instance.actual_object_id)))
+        result.append(getattr(instance, cache_attr))
+    return result
+
+
+class PolymorphicQuerySet(models.QuerySet):
+    """Query set for :py:class:`PolymorphicModel` subclasses.  It adds the
+    method :py:meth:`resolve_actual_instances`.
+    """
+
+    def resolve_actual_instances(self):
+        """Returns the actual instances of all elements of this query set.  See
+        the module-level function :py:func:`resolve_actual_instances` for
+        details.
+
+        :return:
+          the actual instances
+
+        :rtype: list of `PolymorphicModel`
+        """
+        return resolve_actual_instances(self)
+
+
 class PolymorphicModel(models.Model):
     """Abstract model class, which provides the attribute
     :py:attr:`actual_instance`.  This solves the problem that Django's ORM does
@@ -241,12 +309,18 @@ class PolymorphicModel(models.Model):
     <https://django-model-utils.readthedocs.org/en/latest/managers.html#inheritancemanager>.
 
     Simply derive the top-level model class from this one, and then you can
-    easily resolve polymorphy in it and its derived classes.
+    easily resolve polymorphy in it and its derived classes.  If you need the
+    actual instances of many objects, use
+    :py:meth:`PolymorphicQuerySet.resolve_actual_instances` (or the function
+    :py:func:`resolve_actual_instances`) in order to avoid one query per
+    object.
     """
     content_type = models.ForeignKey(ContentType, models.CASCADE, null=True, blank=True, editable=False)
     actual_object_id = models.PositiveIntegerField(null=True, blank=True, editable=False)
     actual_instance = GenericForeignKey("content_type", "actual_object_id")
 
+    objects = PolymorphicQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         """Saves the instance and assures that `actual_instance` is set.
         """
@@ -32,6 +32,7 @@ from django.utils.translation import ugettext_lazy as _, ugettext
 from django.conf import settings
 from django.db import models
 from django.db.models import Q
+from django.core.exceptions import FieldDoesNotExist
 import jb_common.utils.base as utils
 from jb_common import model_fields
 
@@ -470,54 +471,134 @@ def get_all_searchable_models():
         for model in utils.get_all_models().values():
             if hasattr(model, "get_search_tree_node"):
                 try:
-                    model.get_search_tree_node()
+                    node = model.get_search_tree_node()
                 except NotImplementedError:
                     pass
                 except SetLockedException:
                     all_searchable_models.add(model)
                 else:
                     all_searchable_models.add(model)
+                    search_tree_prototypes.setdefault(model, node)
     all_searchable_models = frozenset(all_searchable_models)
     return all_searchable_models
 
 
-def get_search_results(search_tree, max_results, base_query=None):
+search_tree_prototypes = {}
+def get_search_tree_node(model_class):
+    """Returns a new search tree node for the given model class.  Building a
+    node with the ``get_search_tree_node`` method of the model introspects the
+    model fields and the related models, which is costly for deep trees.
+    Since the result doesn't change while the process is running, it is built
+    only once per model class and stored as a prototype.  The returned node is
+    a cheap clone of it, with fresh search fields and without children, so
+    that it can be bound to the request data with ``parse_data``.
+
+    Always use this function instead of calling ``get_search_tree_node`` of
+    the model directly.
+
+    :param model_class: the model class for which the node should be returned
+
+    :type model_class: class (decendant of models.Model)
+
+    :return:
+      the unbound search tree node for this model class
+
+    :rtype: `SearchTreeNode`
+
+    :raises NotImplementedError: if the model class is not searchable
+    """
+    try:
+        prototype = search_tree_prototypes[model_class]
+    except KeyError:
+        prototype = search_tree_prototypes[model_class] = model_class.get_search_tree_node()
+    return prototype.clone()
+
+
+def build_search_schema():
+    """Builds the prototype search tree nodes of all searchable models, so
+    that no request has to do it.  This is called when the ``samples`` app is
+    ready.
+    """
+    for model in get_all_searchable_models():
+        get_search_tree_node(model)
+
+
+def get_search_results(search_tree, max_results, base_query=None, before=None):
     """Returns all found model instances for the given search.  It is a
     wrapper around the ``get_query_set`` method of the top-level node in the
-    search tree, and it serves three purposes:
+    search tree, and it works in two phases:
 
-        1. It limits the number of found instances
+        1. It fetches only the primary keys of the matches, descending, at most
+           ``max_results + 1`` of them.  The extra one tells whether there are
+           more matches, so that no ``count()`` is necessary.  Since the query
+           set contains only semi-joins, it needs no ``DISTINCT``.
 
-        2. It converts the result query into a list of model instances.
+        2. It fetches the model instances for these primary keys.  If the
+           top-level node is abstract, it finds the actual instance for each
+           found object.
 
-        3. If the top-level node is abstract, it finds the actual instance for
-           each found object.
+    The results are paged by their primary keys (“keyset pagination”): The
+    next page is got by passing the smallest primary key of the current page
+    as ``before``.
 
     :param search_tree: the complete search tree of the search
     :param max_results: the maximal number of results to be returned
     :param base_query: the query set to be used as the starting point of the
         query; it is used to restrict the found items to what the user is
         allowed to see
+    :param before: if given, only objects with a smaller primary key are found
 
     :type search_tree: `SearchTreeNode`
     :type max_results: int
     :type base_query: QuerySet
+    :type before: int or NoneType
 
     :return:
       the found objects, whether more than ``max_results`` were found
 
     :rtype: list of model instances, bool
     """
-    # FixMe: The order_by() is necessary until
-    # https://code.djangoproject.com/ticket/24254 is fixed.
-    results = search_tree.get_query_set(base_query).order_by().distinct()
-    too_many_results = results.count() > max_results
-    if too_many_results:
-        results = results[:max_results]
-    results = search_tree.model_class.objects.filter(pk__in=results)
+    results = search_tree.get_query_set(base_query).order_by("-pk")
+    if before is not None:
+        results = results.filter(pk__lt=before)
+    primary_keys = list(results.values_list("pk", flat=True)[:max_results + 1])
+    too_many_results = len(primary_keys) > max_results
+    results = search_tree.model_class.objects.filter(pk__in=primary_keys[:max_results])
     if isinstance(search_tree, AbstractSearchTreeNode):
-        results = [result.actual_instance for result in results]
-    return results, too_many_results
+        # Local import because jb_common.models imports this module.
+        from jb_common.models import resolve_actual_instances
+        results = resolve_actual_instances(results)
+    return list(results), too_many_results
+
+
+def _get_reverse_query_name(model_class, field_name):
+    """Returns the name with which the related model behind ``field_name`` can
+    be filtered by instances of ``model_class``.  For example, if ``Sample``
+    has the field ``processes``, this returns ``"samples"``.
+
+    :param model_class: the model class which contains the relation
+    :param field_name: the name of the relation in ``model_class``
+
+    :type model_class: class (decendant of models.Model)
+    :type field_name: str
+
+    :return:
+      the query name of the reverse relation, or ``None`` if it could not be
+      determined
+
+    :rtype: str or NoneType
+    """
+    try:
+        field = model_class._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        return None
+    if field.auto_created and not field.concrete:
+        reverse_name = field.field.name
+    elif field.is_relation and hasattr(field, "related_query_name"):
+        reverse_name = field.related_query_name()
+    else:
+        return None
+    return reverse_name if reverse_name and not reverse_name.endswith("+") else None
 
 
 @python_2_unicode_compatible
@@ -570,6 +651,34 @@ class SearchTreeNode(object):
         self.children = []
         self.search_fields = search_fields
 
+    def clone(self, memo=None):
+        """Returns a copy of this node which can be bound to request data
+        without affecting this node.  The search fields are copied, while the
+        static data like `related_models` is shared.  Children are not copied;
+        the clone has none.
+
+        :param memo: maps the IDs of already copied search fields to their
+          copies; this way, search fields which are shared between nodes (e.g.
+          between an abstract node and its derivatives) are shared between the
+          clones, too
+
+        :type memo: dict mapping int to `SearchField`
+
+        :return:
+          the unbound copy of this node
+
+        :rtype: `SearchTreeNode`
+        """
+        memo = {} if memo is None else memo
+        node = copy.copy(self)
+        node.children = []
+        node.search_fields = []
+        for search_field in self.search_fields:
+            if id(search_field) not in memo:
+                memo[id(search_field)] = copy.copy(search_field)
+            node.search_fields.append(memo[id(search_field)])
+        return node
+
     def parse_data(self, data, prefix):
         """Create all forms associated with this node (all the seach fields,
         and the `SearchModelForm` for all children), and create recursively the
@@ -605,7 +714,7 @@ class SearchTreeNode(object):
             if not search_model_form.is_valid():
                 break
             model_name = data[new_prefix + "-_model"]
-            node = utils.get_all_models()[model_name].get_search_tree_node()
+            node = get_search_tree_node(utils.get_all_models()[model_name])
             parse_node = search_model_form.cleaned_data["_model"] == search_model_form.cleaned_data["_old_model"]
             node.parse_data(data if parse_node else None, new_prefix)
             search_model_form = SearchModelForm(self.related_models.keys(),
@@ -641,10 +750,35 @@ class SearchTreeNode(object):
         result = result.filter(**kwargs)
         for __, node in self.children:
             if node:
-                name = self.related_models[node.model_class] + "__pk__in"
-                result = result.filter(**{name: node.get_query_set()})
+                result = self.filter_by_child(result, node)
         return result.only("pk")
 
+    def filter_by_child(self, result, node):
+        """Restricts a query set of this node to the instances which are related
+        to matches of a child node.  This is compiled into a semi-join
+        (``pk IN (SELECT …)``), which the database can execute like
+        ``EXISTS``, so that the outer query never contains duplicates and
+        doesn't need ``DISTINCT``.
+
+        :param result: the query set to be restricted
+        :param node: the child node
+
+        :type result: QuerySet
+        :type node: `SearchTreeNode`
+
+        :return:
+          the restricted query set
+
+        :rtype: QuerySet
+        """
+        field_name = self.related_models[node.model_class]
+        reverse_name = _get_reverse_query_name(self.model_class, field_name)
+        if reverse_name:
+            matches = node.get_query_set().values(reverse_name)
+        else:
+            matches = self.model_class.objects.filter(**{field_name + "__pk__in": node.get_query_set()}).values("pk")
+        return result.filter(pk__in=matches)
+
     def is_valid(self):
         """Returns whether the whole tree contains only bound and valid
         forms.  Note that the last children of each node – or, more precisely,
@@ -770,6 +904,17 @@ class AbstractSearchTreeNode(SearchTreeNode):
         # derivatives because they have copies of ``self.search_fields``.
         self.search_fields.append(self.derivative_choice)
 
+    def clone(self, memo=None):
+        memo = {} if memo is None else memo
+        node = super(AbstractSearchTreeNode, self).clone(memo)
+        node.derivative_choice = memo[id(self.derivative_choice)]
+        node.derivatives = []
+        for derivative in self.derivatives:
+            derivative = derivative.clone(memo)
+            derivative.children = node.children
+            node.derivatives.append(derivative)
+        return node
+
     def get_query_set(self, base_query=None):
         """Returns all model instances matching the search.  This is heavily changed
         from :py:meth:`SearchTreeNode.get_query_set`.  By and large it only
@@ -800,7 +945,7 @@ class AbstractSearchTreeNode(SearchTreeNode):
                 Q_expression |= current_Q
             else:
                 Q_expression = current_Q
-        result = result.filter(Q_expression).distinct()
+        result = result.filter(Q_expression)
         return result.only("pk")
 
 
@@ -841,10 +986,16 @@ class DetailsSearchTreeNode(SearchTreeNode):
         super(DetailsSearchTreeNode, self).__init__(model_class, related_models, search_fields)
         self.details_model_attribute = details_model_attribute
         self.details_model_class = getattr(model_class, details_model_attribute).related.related_model
-        self.details_node = self.details_model_class.get_search_tree_node()
+        self.details_node = get_search_tree_node(self.details_model_class)
         self.related_models.update(self.details_node.related_models)
         self.search_fields.extend(self.details_node.search_fields)
 
+    def clone(self, memo=None):
+        memo = {} if memo is None else memo
+        node = super(DetailsSearchTreeNode, self).clone(memo)
+        node.details_node = self.details_node.clone(memo)
+        return node
+
     def get_query_set(self, base_query=None):
         # The basic idea here is the following: The search fields and the
         # related models of the details model were merged with the ones of the
@@ -864,11 +1015,11 @@ class DetailsSearchTreeNode(SearchTreeNode):
             if values:
                 kwargs.update(values)
         result = result.filter(**kwargs)
+        self.details_node.children = []
         for __, node in self.children:
             if node:
                 if node.model_class not in self.details_node.related_models:
-                    name = self.related_models[node.model_class] + "__pk__in"
-                    result = result.filter(**{name: node.get_query_set()})
+                    result = self.filter_by_child(result, node)
                 else:
                     self.details_node.children.append((None, node))
         result = result.filter(pk__in=self.details_node.get_query_set())
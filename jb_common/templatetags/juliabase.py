@@ -37,6 +37,7 @@ from django.utils.text import capfirst
 # This *must* be absolute because otherwise, a Django module of the same name
 # is imported.
 import jb_common.utils.base as utils
+import jb_common.models
 
 register = template.Library()
 
@@ -265,11 +266,9 @@ def actual_instances(instances):
     The name of the class in all-lowercase in injected into each instance in
     the ``type`` attribute.
     """
-    result = []
-    for instance in instances:
-        actual_instance = instance.actual_instance
+    result = jb_common.models.resolve_actual_instances(instances)
+    for actual_instance in result:
         actual_instance.type = actual_instance.__class__.__name__.lower()
-        result.append(actual_instance)
     return result
 
 
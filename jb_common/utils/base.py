@@ -22,12 +22,13 @@ from __future__ import absolute_import, division, unicode_literals
 import django.utils.six as six
 from django.utils.six.moves import urllib
 
-import codecs, re, os, os.path, time, json, datetime, copy, mimetypes, string, hashlib
+import codecs, re, os, os.path, time, json, datetime, copy, mimetypes, string, hashlib, socket, uuid, threading, io, calendar
 from contextlib import contextmanager
 from functools import wraps
 from smtplib import SMTPException
 from functools import update_wrapper
 import django.http
+import django.utils.http
 import django.contrib.auth.models
 import django.core.urlresolvers
 from django.core.cache import cache
@@ -543,6 +544,28 @@ def getmtime_utc(path):
     return datetime.datetime.fromtimestamp(os.path.getmtime(path), django.utils.timezone.utc)
 
 
+def _get_source_mtimes(source_files):
+    """Returns the modification timestamps of the given source files.  Blobs
+    are looked up with one call to the storage backend.
+
+    :param source_files: the paths of the source files; if relative, they are
+        assumed to be in the blob storage.
+
+    :type source_files: list of unicode
+
+    :return:
+      the modification timestamps
+
+    :rtype: list of datetime.datetime
+
+    :raises OSError: if one of the source paths is not found
+    """
+    if all(os.path.isabs(path) for path in source_files):
+        return [getmtime_utc(filename) for filename in source_files]
+    else:
+        return list(blobs.storage.getmtimes(source_files).values())
+
+
 def is_update_necessary(destination, source_files=[], timestamps=[], additional_inaccuracy=0):
     """Returns whether the destination file needs to be re-created from the
     sources.  It bases of the timestamps of last file modification.  If the
@@ -573,11 +596,7 @@ def is_update_necessary(destination, source_files=[], timestamps=[], additional_
     :raises OSError: if one of the source paths is not found
     """
     all_timestamps = copy.copy(timestamps)
-    if all(os.path.isabs(path) for path in source_files):
-        getmtime = getmtime_utc
-    else:
-        getmtime = blobs.storage.getmtime
-    all_timestamps.extend(getmtime(filename) for filename in source_files)
+    all_timestamps.extend(_get_source_mtimes(source_files))
     if not all_timestamps:
         return False
     # The ``+1`` is for avoiding false positives due to floating point
@@ -591,7 +610,11 @@ def get_cached_file_content(path, generator, source_files=[], timestamps=[]):
     from cache, taking the timestamps of all ``source_files`` and the
     ``timestamps`` into account.  If the cache lookup fails, ``generator`` is
     called (without arguments!) to generate the file content, which is then
-    cached.
+    cached.  Concurrent requests for the same missing file don't generate it
+    several times: The cache key is locked with `cache_key_locked` while
+    ``generator`` runs, and the others wait for the result for a short time.
+    If the lock cannot be acquired in time, the content is generated anyway but
+    not cached.
 
     :param destination: the absolute path to the destination file
     :param generator: callable which returns the file content; it is only
@@ -613,18 +636,21 @@ def get_cached_file_content(path, generator, source_files=[], timestamps=[]):
     :raises OSError: if one of the source paths is not found
     """
     all_timestamps = copy.copy(timestamps)
-    if all(os.path.isabs(path) for path in source_files):
-        getmtime = getmtime_utc
-    else:
-        getmtime = blobs.storage.getmtime
-    all_timestamps.extend(getmtime(filename) for filename in source_files)
+    all_timestamps.extend(_get_source_mtimes(source_files))
     hash_ = hashlib.sha1()
     hash_.update(";".join(six.text_type(timestamp) for timestamp in sorted(all_timestamps)).encode("ascii"))
     key = "file:{timestamp_hash}:{path}".format(timestamp_hash=hash_.hexdigest()[:10], path=path)
     content = get_from_cache(key)
     if content is None:
-        content = generator()
-        cache.set(key, content)
+        # Only one process generates the content; all others wait for it and
+        # take the result from the cache.
+        with cache_key_locked("lock:" + key) as locked:
+            if locked:
+                content = cache.get(key)
+            if content is None:
+                content = generator()
+                if locked:
+                    cache.set(key, content)
     return content
 
 
@@ -642,38 +668,209 @@ def format_lazy(string, *args, **kwargs):
 format_lazy = allow_lazy(format_lazy, six.text_type)
 
 
-def static_response(content, served_filename="", content_type=None):
+class _FileRange(object):
+    """File-like object which reads only a part of another file.  When it is
+    closed, the underlying file is closed, too, and the optional ``cleanup``
+    callable is called.  This is used by `FileResponse` to stream byte ranges
+    and to remove temporary files after they have been sent.
+    """
+
+    def __init__(self, file, start, length, cleanup=None):
+        self.file, self.remaining, self.cleanup = file, length, cleanup
+        if start:
+            self.file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return b""
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        try:
+            self.file.close()
+        finally:
+            if self.cleanup:
+                self.cleanup()
+                self.cleanup = None
+
+
+class _FileResponse(django.http.FileResponse):
+    block_size = 64 * 1024
+
+
+_range_pattern = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+def _parse_range(header, size):
+    """Parses the value of a HTTP ``Range`` header.  Only single byte ranges are
+    supported; anything else is ignored.
+
+    :param header: the value of the ``Range`` header
+    :param size: the size of the file in bytes
+
+    :type header: str
+    :type size: int
+
+    :return:
+      the start and the length of the range; ``None`` if the whole file should
+      be sent; ``(None, None)`` if the range cannot be satisfied
+
+    :rtype: (int, int) or (``NoneType``, ``NoneType``) or ``NoneType``
+    """
+    match = _range_pattern.match(header)
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if not start:
+        length = min(int(end), size)
+        return (size - length, length) if length else (None, None)
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        return (None, None)
+    return start, end - start + 1
+
+
+def file_response(request, file, size, content_type, served_filename=None, last_modified=None, etag=None,
+                  cleanup=None):
+    """Streams a file-like object to the client.  The content is sent chunk by
+    chunk, so that large files are never held in memory completely.  If
+    ``request`` is given, conditional requests (``If-None-Match``,
+    ``If-Modified-Since``) and single byte ranges (``Range``, ``If-Range``) are
+    supported.
+
+    :param request: the current HTTP Request object; may be ``None``
+    :param file: the file to be sent; it must support ``read(size)`` and
+      ``close()``, and ``seek(offset)`` if byte ranges should be possible
+    :param size: the size of the file in bytes
+    :param content_type: the MIME type of the content
+    :param served_filename: the filename the should be transmitted; if given,
+        the response will be an "attachment"
+    :param last_modified: the modification timestamp of the file
+    :param etag: the entity tag of the file, including the double quotes; if
+      not given, it is derived from ``last_modified`` and ``size``
+    :param cleanup: callable with no arguments which is called after the file
+      was sent, e.g. for removing a temporary file
+
+    :type request: HttpRequest or ``NoneType``
+    :type file: file-like object
+    :type size: int
+    :type content_type: str
+    :type served_filename: str
+    :type last_modified: datetime.datetime
+    :type etag: str
+    :type cleanup: callable
+
+    :return:
+      the HTTP response with the file
+
+    :rype: ``django.http.HttpResponse``
+    """
+    last_modified_timestamp = last_modified and calendar.timegm(last_modified.utctimetuple())
+    if not etag and last_modified:
+        etag = '"{0:x}-{1:x}"'.format(last_modified_timestamp, size)
+    range_ = None
+    if request is not None:
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if_modified_since = django.utils.http.parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+        if if_none_match and etag and etag in [tag.strip() for tag in if_none_match.split(",")] or \
+           not if_none_match and if_modified_since is not None and last_modified and \
+           if_modified_since >= last_modified_timestamp:
+            _FileRange(file, 0, 0, cleanup).close()
+            response = django.http.HttpResponseNotModified()
+            if etag:
+                response["ETag"] = etag
+            return response
+        if "HTTP_RANGE" in request.META and hasattr(file, "seek"):
+            if_range = request.META.get("HTTP_IF_RANGE")
+            if not if_range or if_range == etag or \
+               last_modified and django.utils.http.parse_http_date_safe(if_range) == last_modified_timestamp:
+                range_ = _parse_range(request.META["HTTP_RANGE"], size)
+    if range_ == (None, None):
+        _FileRange(file, 0, 0, cleanup).close()
+        response = django.http.HttpResponse(status=416)
+        response["Content-Range"] = "bytes */{0}".format(size)
+        return response
+    start, length = range_ or (0, size)
+    response = _FileResponse(_FileRange(file, start, length, cleanup), content_type=content_type)
+    response["Content-Length"] = length
+    response["Accept-Ranges"] = "bytes" if hasattr(file, "seek") else "none"
+    if range_:
+        response.status_code = 206
+        response["Content-Range"] = "bytes {0}-{1}/{2}".format(start, start + length - 1, size)
+    if last_modified:
+        response["Last-Modified"] = django.utils.http.http_date(last_modified_timestamp)
+    if etag:
+        response["ETag"] = etag
+    if served_filename:
+        response["Content-Disposition"] = 'attachment; filename="{0}"'.format(served_filename)
+    return response
+
+
+def static_response(content, served_filename="", content_type=None, request=None):
     """Serves a bytes string as static content.
 
     :param content: the content to be served
     :param served_filename: the filename the should be transmitted; if given,
         the response will be an "attachment"
     :param content_type: the MIME type of the content
+    :param request: the current HTTP Request object; if given, conditional
+        requests and byte ranges are supported, with an ETag derived from the
+        content
 
     :type content: bytes
     :type served_filename: str
     :type content_type: str
+    :type request: HttpRequest
 
     :return:
       the HTTP response with the static file
 
     :rype: ``django.http.HttpResponse``
     """
-    response = django.http.HttpResponse()
-    response.write(content)
-    response["Content-Type"] = content_type or mimetypes.guess_type(served_filename)[0] or "application/octet-stream"
-    response["Content-Length"] = len(content)
-    if served_filename:
-        response["Content-Disposition"] = 'attachment; filename="{0}"'.format(served_filename)
-    return response
+    content_type = content_type or mimetypes.guess_type(served_filename)[0] or "application/octet-stream"
+    etag = request and '"{0}"'.format(hashlib.sha1(content).hexdigest())
+    return file_response(request, io.BytesIO(content), len(content), content_type, served_filename, etag=etag)
 
 
-def static_file_response(filepath, served_filename=None):
-    """Serves a file of the local file system.
+def _serve_file(filepath, served_filename, request, is_temporary, last_modified=None):
+    """Serves a file of the local file system, either by the Web server with
+    ``X-Sendfile``, or by streaming it with `file_response`.  See
+    `static_file_response` for the parameters.  Additionally, ``is_temporary``
+    denotes whether the file should be deleted after it was sent, and
+    ``last_modified`` overrides the modification time of the file.
+    """
+    if settings.USE_X_SENDFILE:
+        response = django.http.HttpResponse()
+        response["X-Sendfile-Temporary" if is_temporary else "X-Sendfile"] = filepath
+        response["Content-Type"] = mimetypes.guess_type(filepath)[0] or "application/octet-stream"
+        response["Content-Length"] = os.path.getsize(filepath)
+        if served_filename:
+            response["Content-Disposition"] = 'attachment; filename="{0}"'.format(served_filename)
+        return response
+    file_ = open(filepath, "rb")
+    size = os.fstat(file_.fileno()).st_size
+    last_modified = last_modified or getmtime_utc(filepath)
+    return file_response(request, file_, size, mimetypes.guess_type(filepath)[0] or "application/octet-stream",
+                         served_filename, last_modified, cleanup=(lambda: os.unlink(filepath)) if is_temporary else None)
+
+
+def static_file_response(filepath, served_filename=None, request=None):
+    """Serves a file of the local file system.  If ``USE_X_SENDFILE`` is not
+    set, the file is streamed in chunks.
 
     :param filepath: the absolute path to the file to be served
     :param served_filename: the filename the should be transmitted; if given,
         the response will be an "attachment"
+    :param request: the current HTTP Request object; if given, conditional
+        requests and byte ranges are supported
+
+    :type filepath: str
+    :type served_filename: unicode
+    :type request: HttpRequest
 
     :return:
       the HTTP response with the static file
@@ -685,21 +882,41 @@ def static_file_response(filepath, served_filename=None):
         path = os.path.join(os.path.realpath(path), "")
         if os.path.commonprefix([filepath, path]) == path:
             is_temporary = True
+            break
     else:
         is_temporary = False
+    return _serve_file(filepath, served_filename, request, is_temporary)
 
-    response = django.http.HttpResponse()
-    if settings.USE_X_SENDFILE:
-        response["X-Sendfile-Temporary" if is_temporary else "X-Sendfile"] = filepath
-    else:
-        response.write(open(filepath, "rb").read())
-        if is_temporary:
-            os.unlink(filepath)
-    response["Content-Type"] = mimetypes.guess_type(filepath)[0] or "application/octet-stream"
-    response["Content-Length"] = os.path.getsize(filepath)
-    if served_filename:
-        response["Content-Disposition"] = 'attachment; filename="{0}"'.format(served_filename)
-    return response
+
+def blob_file_response(path, served_filename=None, request=None):
+    """Serves a file of the blob storage.  If the backend supports streaming,
+    the file content is sent chunk by chunk directly from the storage.
+    Otherwise, the file is exported, sent, and the exported file removed
+    afterwards.  ``Last-Modified`` and ``ETag`` are derived from the blob's
+    modification time.
+
+    :param path: the full path to the file in the blob storage
+    :param served_filename: the filename the should be transmitted; if given,
+        the response will be an "attachment"
+    :param request: the current HTTP Request object; if given, conditional
+        requests and byte ranges are supported
+
+    :type path: str
+    :type served_filename: unicode
+    :type request: HttpRequest
+
+    :return:
+      the HTTP response with the file
+
+    :rype: ``django.http.HttpResponse``
+    """
+    last_modified = blobs.storage.getmtime(path)
+    if not blobs.storage.streaming:
+        exported_path = blobs.storage.export(path)
+        return _serve_file(exported_path, served_filename, request, True, last_modified)
+    blob_file = blobs.storage.open(path, "r")
+    return file_response(request, blob_file, blob_file.size, mimetypes.guess_type(path)[0] or "application/octet-stream",
+                         served_filename, last_modified)
 
 
 def mkdirs(path):
@@ -722,31 +939,229 @@ def mkdirs(path):
                 raise
 
 
+class CacheLock(object):
+    """Lock in the cache with lease expiry.  The lock is held by storing a
+    token in the cache item ``key``.  This token identifies the owner (host,
+    process, and a random part), and the cache item expires after ``lease``
+    seconds, so that a crashed or stuck owner cannot block other processes for
+    longer than that.  Only the owner may release the lock.
+
+    Django's cache API has no atomic compare-and-delete.  Thus, between
+    checking the token and deleting the cache item in `release`, the lease
+    could expire and someone else could take the lock, which would then be
+    deleted by mistake.  To rule this out, the lock is only deleted if its
+    lease still has `release_margin` seconds left; otherwise, it is left to
+    expire by itself.  (A remaining, very unlikely race is the eviction of the
+    cache item under memory pressure in exactly this moment.)
+
+    You will rarely use this class directly; use `cache_key_locked` instead.
+    """
+    release_margin = 2
+
+    def __init__(self, key, lease=30):
+        """
+        :param key: the cache key used for the lock
+        :param lease: number of seconds after which the lock is released
+            automatically
+
+        :type key: str
+        :type lease: int
+        """
+        self.key, self.lease = key, lease
+        self.token = self.expiry = None
+
+    def _add(self, token):
+        """Tries to take the lock once.
+
+        :param token: the token identifying the owner
+
+        :type token: str
+
+        :return:
+          whether the lock could be taken
+
+        :rtype: bool
+        """
+        now = time.time()
+        if cache.add(self.key, token, self.lease):
+            self.token, self.expiry = token, now + self.lease
+            return True
+        return False
+
+    def acquire(self, wait=2):
+        """Tries to acquire the lock.  If it is held by someone else, it polls
+        with increasing delays for at most ``wait`` seconds.  Contentions and
+        timeouts are counted for `cache_lock_statistics`.
+
+        :param wait: maximal number of seconds to wait for the lock
+
+        :type wait: int or float
+
+        :return:
+          whether the lock could be acquired
+
+        :rtype: bool
+        """
+        token = "{0}:{1}:{2}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+        deadline = time.time() + wait
+        delay = 0.01
+        if self._add(token):
+            return True
+        _incr_cache_item("samples-cache-lock-contentions", 1)
+        while time.time() + delay <= deadline:
+            time.sleep(delay)
+            if self._add(token):
+                return True
+            delay = min(2 * delay, 0.3)
+        _incr_cache_item("samples-cache-lock-timeouts", 1)
+        return False
+
+    def release(self):
+        """Releases the lock if we are still its owner.  If the lease has
+        expired meanwhile, the lock may belong to someone else now, and it is
+        left alone.  If the lease is about to expire, the lock is left alone,
+        too, see the class docstring.
+        """
+        if self.token is not None:
+            if time.time() < self.expiry - self.release_margin and cache.get(self.key) == self.token:
+                cache.delete(self.key)
+            self.token = self.expiry = None
+
+
 @contextmanager
-def cache_key_locked(key):
-    """Locks the ``key`` in the cache.  If ``key`` already exists, it waits for
-    max. 6 seconds.  If it's still not released, the whole cache is cleared.
-    In all cases, ``key`` is hold in the context.  After the context is left
-    (even via an exception), the key is deleted, i.e. the lock is removed.  Use
-    it like this::
-
-        with cache_key_locked("my_lock_name"):
-            ...
+def cache_key_locked(key, wait=2, lease=30):
+    """Locks the ``key`` in the cache.  If ``key`` is already locked, it waits
+    for max. ``wait`` seconds.  The context yields whether the lock could be
+    acquired.  If not, the caller must not do anything that needs the lock; for
+    example, it should skip storing an item in the cache.  After the context is
+    left (even via an exception), the lock is removed.  Use it like this::
+
+        with cache_key_locked("my_lock_name") as locked:
+            if locked:
+                ...
+
+    The lock expires after ``lease`` seconds in any case, so a stuck process
+    cannot block others forever.
+
+    :param key: the cache key used for the lock
+    :param wait: maximal number of seconds to wait for the lock
+    :param lease: number of seconds after which the lock is released
+        automatically
+
+    :type key: str
+    :type wait: int or float
+    :type lease: int
     """
-    cycles = 20
-    while cycles:
-        if cache.add(key, 1):
-            break
-        cycles -= 1
-        time.sleep(0.3)
-    else:
-        cache.clear()
-        successful = cache.add(key, 1)
-        assert successful
+    lock = CacheLock(key, lease)
+    locked = lock.acquire(wait)
+    try:
+        yield locked
+    finally:
+        if locked:
+            lock.release()
+
+
+def _new_cache_generation():
+    """Internal routine for creating the start value of a cache generation
+    counter.  It is derived from the current time so that a counter which was
+    evicted from the cache never re-uses the generations of its previous life.
+    """
+    return int(time.time() * 1000000)
+
+
+def get_cache_generation(key):
+    """Returns the current value of a generation counter in the cache.  Such
+    counters are embedded into the cache keys of derived items, e.g. of a
+    sample datasheet.  This way, all derived items are invalidated at once by
+    `bump_cache_generation`, without having to know their keys.  The stale
+    items simply age out of the cache.
+
+    :param key: the cache key of the generation counter, e.g.
+        ``"sample-generation:42"``
+
+    :type key: str
+
+    :return:
+      the current generation
+
+    :rtype: int
+    """
+    generation = cache.get(key)
+    if generation is None:
+        generation = _new_cache_generation()
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def bump_cache_generation(key):
+    """Increments a generation counter in the cache atomically.  See
+    `get_cache_generation` for further information.
+
+    :param key: the cache key of the generation counter, e.g.
+        ``"sample-generation:42"``
+
+    :type key: str
+    """
+    deferred_keys = getattr(_deferred_generation_bumps, "keys", None)
+    if deferred_keys is not None:
+        deferred_keys.add(key)
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_cache_generation(), None)
+
+
+def bump_cache_generations(keys):
+    """Increments many generation counters in the cache.  This is used for
+    expiring the cache items of many objects in one go, e.g. of a whole family
+    of samples.  See `bump_cache_generation` for further information.
+
+    :param keys: the cache keys of the generation counters
+
+    :type keys: iterable of str
+    """
+    deferred_keys = getattr(_deferred_generation_bumps, "keys", None)
+    if deferred_keys is not None:
+        deferred_keys.update(keys)
+        return
+    keys = list(keys)
+    existing = cache.get_many(keys)
+    missing = {}
+    for key in keys:
+        if key in existing:
+            try:
+                cache.incr(key)
+                continue
+            except ValueError:
+                pass
+        missing[key] = _new_cache_generation()
+    if missing:
+        cache.set_many(missing, None)
+
+
+_deferred_generation_bumps = threading.local()
+
+@contextmanager
+def deferred_cache_generation_bumps():
+    """Context manager which collects all calls of `bump_cache_generation` and
+    `bump_cache_generations` in the current thread and executes them in one go
+    when the block is left.  This way, a counter which is bumped many times –
+    e.g. of a sample which gets many new processes in a bulk submission – is
+    bumped only once.  Nested usage is allowed; only the outermost block bumps
+    the counters.
+    """
+    if getattr(_deferred_generation_bumps, "keys", None) is not None:
+        yield
+        return
+    _deferred_generation_bumps.keys = set()
     try:
         yield
     finally:
-        cache.delete(key)
+        keys, _deferred_generation_bumps.keys = _deferred_generation_bumps.keys, None
+        if keys:
+            bump_cache_generations(keys)
 
 
 class MyNone:
@@ -805,6 +1220,19 @@ def cache_hit_rate():
         return hits / (hits + misses)
 
 
+def cache_lock_statistics():
+    """Returns the number of contentions and timeouts of `cache_key_locked`
+    that have been recorded so far.  A contention means that a lock was not
+    available immediately, a timeout that it could not be acquired at all.
+
+    :return:
+      the number of contentions, the number of timeouts
+
+    :rtype: int, int
+    """
+    return cache.get("samples-cache-lock-contentions", 0), cache.get("samples-cache-lock-timeouts", 0)
+
+
 def convert_bytes_to_str(byte_array):
     """Converts an array of bytes representing the string literals as decimal
     integers to unicode letters.
@@ -29,9 +29,9 @@
 from __future__ import absolute_import, division, unicode_literals
 import django.utils.six as six
 
-import os, uuid, datetime
+import os, uuid, datetime, threading, time
 from contextlib import contextmanager
-import psycopg2
+import psycopg2, psycopg2.pool
 from django.conf import settings
 from jb_common.utils.base import mkdirs, getmtime_utc
 from jb_common.signals import storage_changed
@@ -44,7 +44,8 @@ if six.PY2:
 class BlobStorage(object):
     """Abstract base class for blob storage backends.  It lists all methods that
     may be implemented and their signatures.  Currently, core JuliaBase only
-    calls the methods `open` and `export`.
+    calls the methods `open`, `export`, `getmtime`, `getmtimes`, and
+    `unlink`.
 
     Note the “full path” means that it must be complete.  *Important*: Any
     paths in the blob storage must not start with a slash.
@@ -80,6 +81,24 @@ class BlobStorage(object):
         """
         raise NotImplementedError
 
+    def getmtimes(self, paths):
+        """Returns the modification timestamps of many files at once.  The
+        default implementation calls `getmtime` for every path; backends
+        should override it if they can do better.
+
+        :param paths: full paths to files
+
+        :type paths: iterable of str
+
+        :return:
+          the modification timestamps of the files
+
+        :rtype: dict mapping str to datetime.datetime
+
+        :raises FileNotFoundError: if one of the paths does not exist
+        """
+        return {path: self.getmtime(path) for path in paths}
+
     def unlink(self, path):
         """Removes the file at ``path``.  This must not be a directory.
 
@@ -89,12 +108,21 @@ class BlobStorage(object):
         """
         raise NotImplementedError
 
+    streaming = False
+    """Whether `open` in mode ``"r"`` is the preferred way to serve a file of
+    this backend.  If ``False``, files are served by `export`, which is
+    preferable if the Web server can send the exported file by itself.
+    """
+
     def open(self, path, mode="r"):
         """Opens the file at ``path``.  This must be a regular file.  The returned
         objects is guaranteed to have two simple methods: ``write(data)``
         writes ``data`` to the file and can be called multiple times.  And
         ``close()`` closes the file and should be called when all data is
-        written.
+        written.  In mode ``"r"``, it has a method ``read(size=-1)`` instead
+        of ``write``, a method ``seek(offset)``, an attribute ``size`` with the
+        file size in bytes, and it is iterable over chunks of the file
+        content.
 
         :param path: full path to a file
         :param mode: mode in which the file should be opened; may be ``"r"`` or
@@ -145,20 +173,34 @@ class Filesystem(BlobStorage):
 
     class File(object):
         """A very simplistic file-like objects.  It only defines the methods that are
-        needed in JuliaBase: `write` (with one parameter) and `close`.  I need
-        this wrapper to have a hook in the `close` method to call the
+        needed in JuliaBase: `read`, `write` (with one parameter), and `close`.
+        I need this wrapper to have a hook in the `close` method to call the
         ``storage_changed`` signal.
         """
 
-        def __init__(self, file):
-            self.file = file
+        chunk_size = 64 * 1024
+
+        def __init__(self, file, mode):
+            self.file, self.mode = file, mode
+            if mode == "r":
+                self.size = os.fstat(file.fileno()).st_size
+
+        def read(self, size=-1):
+            return self.file.read(size)
+
+        def seek(self, offset):
+            self.file.seek(offset)
 
         def write(self, data):
             self.file.write(data)
 
+        def __iter__(self):
+            return iter(lambda: self.file.read(self.chunk_size), b"")
+
         def close(self):
             self.file.close()
-            storage_changed.send(Filesystem)
+            if self.mode == "w":
+                storage_changed.send(Filesystem)
 
 
     def __init__(self, root=None):
@@ -181,7 +223,7 @@ class Filesystem(BlobStorage):
         filepath = os.path.join(self.root, path)
         if mode == "w":
             mkdirs(filepath)
-        return Filesystem.File(open(filepath, mode + "b"))
+        return Filesystem.File(open(filepath, mode + "b"), mode)
 
     def export(self, path):
         """Create a hard link to the file.  Three directories are tried, in this order:
@@ -214,28 +256,62 @@ class PostgreSQL(BlobStorage):
     database using PostgreSQL's “large object” facility.  Moreover, it creates
     one table called “blobs” in the database to link the large object IDs
     (OIDs) with the pathname and an mtime timestamp.
+
+    The database connections are taken from a pool owned by the backend.
+    Since the backend is created before the Web server may fork its worker
+    processes, every process creates its own pool on first use.  Files are
+    served by streaming the large object directly into the response.  A
+    streamed file holds its connection until the response is finished.
+    Therefore, streamed files may take all connections of the pool but one, so
+    that short operations like `getmtimes` are never blocked by slow
+    downloads.  If no connection is free, further requests wait for one, but
+    not longer than ``timeout`` seconds.
     """
 
+    streaming = True
+
     class BlobFile(object):
         """A very simplistic file-like objects.  It only defines the methods that are
-        needed in JuliaBase: `write` (with one parameter) and `close`.
+        needed in JuliaBase: `read`, `write` (with one parameter), and `close`.
+        The database connection is held until `close` is called.
         """
 
-        def __init__(self, path, connection, cursor, large_object):
-            self.path, self.connection, self.cursor, self.large_object = path, connection, cursor, large_object
+        chunk_size = 64 * 1024
+
+        def __init__(self, storage, path, mode, connection, cursor, large_object):
+            self.storage, self.path, self.mode, self.connection, self.cursor, self.large_object = \
+                storage, path, mode, connection, cursor, large_object
+            self.closed = False
+            if mode == "r":
+                self.size = large_object.seek(0, os.SEEK_END)
+                large_object.seek(0)
+
+        def read(self, size=-1):
+            return self.large_object.read(size)
+
+        def seek(self, offset):
+            self.large_object.seek(offset)
 
         def write(self, data):
             self.large_object.write(data)
 
-        def close(self):
-            self.cursor.execute("UPDATE blobs SET mtime=now() WHERE path=%s;", (self.path,))
-            self.large_object.close()
-            self.connection.commit()
-            self.cursor.close()
-            self.connection.close()
-
+        def __iter__(self):
+            return iter(lambda: self.large_object.read(self.chunk_size), b"")
 
-    def __init__(self, database, user, password, host):
+        def close(self):
+            if not self.closed:
+                self.closed = True
+                try:
+                    if self.mode == "w":
+                        self.cursor.execute("UPDATE blobs SET mtime=now() WHERE path=%s;", (self.path,))
+                    self.large_object.close()
+                    self.connection.commit()
+                finally:
+                    self.cursor.close()
+                    self.storage.put_connection(self.connection)
+
+
+    def __init__(self, database, user, password, host, min_connections=1, max_connections=10, timeout=10):
         """Class constructor.  It creates the table “blobs” in the database if
         it doesn't exist yet.
 
@@ -243,21 +319,134 @@ class PostgreSQL(BlobStorage):
         :param user: PostgreSQL user name
         :param password: PostgreSQL password
         :param host: PostgreSQL hostname
+        :param min_connections: number of connections which are kept open in the
+          pool of each process
+        :param max_connections: maximal number of connections of the pool of
+          each process; if all of them are in use, further requests wait until
+          a connection is given back
+        :param timeout: maximal number of seconds to wait for a free connection
 
         :type database: str
         :type user: str
         :type password: str
         :type host: str
+        :type min_connections: int
+        :type max_connections: int
+        :type timeout: int or float
         """
         self.database, self.user, self.password, self.host = database, user, password, host
-        with psycopg2.connect(database=self.database, user=self.user, password=self.password, host=self.host) \
-             as connection, connection.cursor() as cursor:
-            try:
+        self.min_connections, self.max_connections, self.timeout = min_connections, max_connections, timeout
+        self.pool = self.pool_pid = None
+        self.pool_lock = threading.Lock()
+        self.pool_condition = threading.Condition()
+        self.used_connections = 0
+        with self.connection() as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_tables WHERE tablename='blobs';")
+            if not cursor.fetchone():
                 cursor.execute("CREATE TABLE blobs (path varchar(255), large_object_id oid NOT NULL, "
                                "mtime timestamp with time zone NOT NULL, "
                                "PRIMARY KEY (path), UNIQUE (large_object_id));")
-            except psycopg2.ProgrammingError:
-                connection.reset()
+
+    def _create_pool(self):
+        """Creates the connection pool of the current process.
+
+        :return:
+          the new connection pool
+
+        :rtype: psycopg2.pool.ThreadedConnectionPool
+        """
+        return psycopg2.pool.ThreadedConnectionPool(self.min_connections, self.max_connections, database=self.database,
+                                                    user=self.user, password=self.password, host=self.host)
+
+    def get_connection(self, streaming=False):
+        """Takes a database connection from the pool.  It must be given back with
+        `put_connection`.  If all ``max_connections`` connections are in use,
+        this waits for at most ``timeout`` seconds until one is given back,
+        because psycopg2's pool would raise a ``PoolError`` immediately.  A
+        connection for streaming is only given out if this leaves at least one
+        connection for other operations.  If the process was forked since the
+        pool was created, a new pool is created because connections must not be
+        shared between processes.
+
+        :param streaming: whether the connection is held while a file is sent to
+          the client
+
+        :type streaming: bool
+
+        :return:
+          a database connection
+
+        :rtype: psycopg2.extensions.connection
+
+        :raises psycopg2.pool.PoolError: if no connection got free within
+          ``timeout`` seconds
+        """
+        with self.pool_lock:
+            if self.pool_pid != os.getpid():
+                self.pool = self._create_pool()
+                self.pool_condition = threading.Condition()
+                self.used_connections = 0
+                self.pool_pid = os.getpid()
+            pool, condition = self.pool, self.pool_condition
+        limit = max(self.max_connections - 1, 1) if streaming else self.max_connections
+        deadline = time.time() + self.timeout
+        with condition:
+            while self.used_connections >= limit:
+                remaining_time = deadline - time.time()
+                if remaining_time <= 0:
+                    raise psycopg2.pool.PoolError("no free blob database connection within {0} seconds".
+                                                  format(self.timeout))
+                condition.wait(remaining_time)
+            self.used_connections += 1
+        try:
+            return pool.getconn()
+        except:
+            self._release_slot(condition)
+            raise
+
+    def _release_slot(self, condition):
+        """Marks a connection of the pool as free again, and wakes up the threads
+        which are waiting for a connection.
+
+        :param condition: the condition of the pool of the current process
+
+        :type condition: threading.Condition
+        """
+        with condition:
+            self.used_connections -= 1
+            condition.notify_all()
+
+    def put_connection(self, connection):
+        """Gives a database connection back to the pool.  An open transaction is
+        rolled back.
+
+        :param connection: the database connection, as returned by
+          `get_connection`
+
+        :type connection: psycopg2.extensions.connection
+        """
+        if self.pool_pid == os.getpid():
+            try:
+                self.pool.putconn(connection)
+            finally:
+                self._release_slot(self.pool_condition)
+        else:
+            connection.close()
+
+    @contextmanager
+    def connection(self):
+        """Context manager for a pooled database connection.  The transaction is
+        committed at the end, or rolled back if an exception occurred.
+        """
+        connection = self.get_connection()
+        try:
+            yield connection
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+        finally:
+            self.put_connection(connection)
 
     @staticmethod
     def get_oid(cursor, path):
@@ -281,23 +470,24 @@ class PostgreSQL(BlobStorage):
         return result and result[0]
 
     @contextmanager
-    def existing_large_object(self, path):
+    def existing_large_object(self, path, mode="rb"):
         """Context manager for getting *existing* blobs.  If a blob with the given
         ``path`` doesn't exist, an exception is raised.  Otherwise, it returns
-        the OID of the blob and a database cursor.
+        the large object and a database cursor.
 
         :param path: path to an existing file in the blob database
+        :param mode: mode in which the large object is opened
 
         :type path: str
+        :type mode: str
 
         :raises FileNotFoundError: if no file with that path exists
         """
-        with psycopg2.connect(database=self.database, user=self.user, password=self.password, host=self.host) \
-             as connection, connection.cursor() as cursor:
+        with self.connection() as connection, connection.cursor() as cursor:
             oid = self.get_oid(cursor, path)
             if oid is None:
                 raise FileNotFoundError("No such blob: {}".format(repr(path)))
-            large_object = connection.lobject(oid)
+            large_object = connection.lobject(oid, mode)
             try:
                 yield large_object, cursor
             finally:
@@ -305,9 +495,19 @@ class PostgreSQL(BlobStorage):
                     large_object.close()
 
     def getmtime(self, path):
-        with self.existing_large_object(path) as (large_object, cursor):
-            cursor.execute("SELECT mtime FROM blobs WHERE large_object_id=%s;", (large_object.oid,))
-            return cursor.fetchone()[0]
+        return self.getmtimes([path])[path]
+
+    def getmtimes(self, paths):
+        paths = set(paths)
+        if not paths:
+            return {}
+        with self.connection() as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT path, mtime FROM blobs WHERE path = ANY(%s);", (list(paths),))
+            result = dict(cursor.fetchall())
+        missing_paths = paths - set(result)
+        if missing_paths:
+            raise FileNotFoundError("No such blob: {}".format(repr(missing_paths.pop())))
+        return result
 
     def unlink(self, path):
         with self.existing_large_object(path) as (large_object, cursor):
@@ -315,17 +515,26 @@ class PostgreSQL(BlobStorage):
             large_object.unlink()
 
     def open(self, path, mode):
-        assert mode == "w"
-        connection = psycopg2.connect(database=self.database, user=self.user, password=self.password, host=self.host)
-        cursor = connection.cursor()
-        oid = self.get_oid(cursor, path)
-        if oid is None:
-            large_object = connection.lobject(mode="wb")
-            cursor.execute("INSERT INTO blobs VALUES (%s, %s, now());", (path, large_object.oid))
-        else:
-            large_object = connection.lobject(oid, mode="wb")
-            large_object.truncate()
-        return PostgreSQL.BlobFile(path, connection, cursor, large_object)
+        assert mode in ("r", "w")
+        connection = self.get_connection(streaming=mode == "r")
+        try:
+            cursor = connection.cursor()
+            oid = self.get_oid(cursor, path)
+            if mode == "r":
+                if oid is None:
+                    raise FileNotFoundError("No such blob: {}".format(repr(path)))
+                large_object = connection.lobject(oid, mode="rb")
+            elif oid is None:
+                large_object = connection.lobject(mode="wb")
+                cursor.execute("INSERT INTO blobs VALUES (%s, %s, now());", (path, large_object.oid))
+            else:
+                large_object = connection.lobject(oid, mode="wb")
+                large_object.truncate()
+        except:
+            connection.rollback()
+            self.put_connection(connection)
+            raise
+        return PostgreSQL.BlobFile(self, path, mode, connection, cursor, large_object)
 
     def export(self, path):
         with self.existing_large_object(path) as (large_object, cursor):
@@ -347,7 +347,8 @@ def plot(request, image_format):
     except models.KickerNumber.DoesNotExist:
         timestamps = []
     content = get_cached_file_content(plot_filepath, partial(generate_plot, image_format), timestamps=timestamps)
-    return static_response(content, "kicker.pdf" if image_format == "pdf" else None, mimetypes.guess_type(plot_filepath))
+    return static_response(content, "kicker.pdf" if image_format == "pdf" else None, mimetypes.guess_type(plot_filepath)[0],
+                           request)
     
 
 @login_required
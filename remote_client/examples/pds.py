@@ -22,6 +22,7 @@ from __future__ import unicode_literals
 import sys, os, datetime, glob
 sys.path.append(os.path.abspath(".."))
 from jb_remote_inm import *
+from jb_remote.crawler_tools import CrawlerRunner
 
 
 def read_pds_file(filepath):
@@ -38,27 +39,30 @@ def read_pds_file(filepath):
     return result
 
         
-setup_logging("console")
-login("juliabase", "12345")
-
-for filepath in sorted(glob.glob("pds_raw_data/*.dat")):
+def parse(filepath):
     pds_header_data = read_pds_file(filepath)
-    try:
-        sample_id = get_sample(pds_header_data["sample"])
-    except SampleNotFound as exception:
-        sample = exception.sample
-        sample.currently_responsible_person = pds_header_data["operator"]
-        sample.current_location = "PDS lab"
-        sample.topic = "Legacy"
-        sample_id = sample.submit()
+    return pds_header_data["sample"], pds_header_data
+
+
+def create_sample(sample_name, pds_header_data):
+    sample = Sample()
+    sample.name = sample_name
+    sample.currently_responsible_person = pds_header_data["operator"]
+    sample.current_location = "PDS lab"
+    sample.topic = "Legacy"
+    sample_id = sample.submit()
+
+    substrate = Substrate()
+    substrate.timestamp = pds_header_data["timestamp"] - datetime.timedelta(minutes=1)
+    substrate.timestamp_inaccuracy = 3
+    substrate.sample_ids = [sample_id]
+    substrate.material = "corning"
+    substrate.operator = "n.burkhardt"
+    substrate.submit()
+    return sample_id
 
-        substrate = Substrate()
-        substrate.timestamp = pds_header_data["timestamp"] - datetime.timedelta(minutes=1)
-        substrate.timestamp_inaccuracy = 3
-        substrate.sample_ids = [sample_id]
-        substrate.material = "corning"
-        substrate.operator = "n.burkhardt"
-        substrate.submit()
+
+def build(filepath, pds_header_data, sample_id):
     pds_measurement = PDSMeasurement()
     pds_measurement.operator = pds_header_data["operator"]
     pds_measurement.timestamp = pds_header_data["timestamp"]
@@ -66,6 +70,15 @@ for filepath in sorted(glob.glob("pds_raw_data/*.dat")):
     pds_measurement.apparatus = "pds" + pds_header_data["apparatus"]
     pds_measurement.raw_datafile = os.path.basename(filepath)
     pds_measurement.sample_id = sample_id
-    pds_measurement.submit()
+    return [pds_measurement]
+
+
+# The guard is necessary because the parsers run in a process pool, whose
+# workers import this module on platforms without ``fork``.
+if __name__ == "__main__":
+    setup_logging("console")
+    login("juliabase", "12345")
+
+    CrawlerRunner("pds_crawler", parse, build, create_sample).run(sorted(glob.glob("pds_raw_data/*.dat")))
 
-logout()
+    logout()
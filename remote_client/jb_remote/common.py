@@ -40,18 +40,22 @@
 
 from __future__ import absolute_import, unicode_literals, division
 from . import six
-from .six.moves import urllib, http_cookiejar, _thread
+from .six.moves import urllib, http_cookiejar, http_client, _thread
 
-import mimetypes, json, logging, os, datetime, time, random, re, decimal
+import mimetypes, json, logging, os, datetime, time, random, re, decimal, socket, threading
+from multiprocessing.pool import ThreadPool
 from io import IOBase
 if six.PY3:
     file = IOBase
+    from urllib.request import AbstractHTTPHandler
+else:
+    from urllib2 import AbstractHTTPHandler
 
 from . import settings
 
 
 __all__ = ["login", "logout", "connection", "primary_keys", "JuliaBaseError", "setup_logging",
-           "format_timestamp", "parse_timestamp", "as_json"]
+           "format_timestamp", "parse_timestamp", "as_json", "Batch"]
 
 
 def setup_logging(destination=None):
@@ -318,13 +322,166 @@ class JuliaBaseError(Exception):
         return "({0}) {1}".format(self.error_code, self.error_message)
 
 
+class ConnectionPool(object):
+    """Pool of idle persistent HTTP connections.  The connections are grouped
+    by their class and host.  It is thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle_connections = {}
+
+    def get(self, key, factory):
+        """Returns an idle connection, or a new one if there is none.
+
+        :param key: the connection class and the host
+        :param factory: callable which creates a new connection
+
+        :type key: tuple
+        :type factory: callable without parameters
+
+        :return:
+          the connection, whether it was taken from the pool
+
+        :rtype: ``http.client.HTTPConnection``, bool
+        """
+        with self.lock:
+            connections = self.idle_connections.get(key)
+            if connections:
+                return connections.pop(), True
+        return factory(), False
+
+    def put(self, key, connection):
+        """Returns a connection to the pool.  If there are too many idle
+        connections already, it is closed instead.
+
+        :param key: the connection class and the host
+        :param connection: the connection; it must not have pending responses
+
+        :type key: tuple
+        :type connection: ``http.client.HTTPConnection``
+        """
+        with self.lock:
+            connections = self.idle_connections.setdefault(key, [])
+            if len(connections) < settings.MAX_CONCURRENT_REQUESTS:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        """Closes all idle connections.
+        """
+        with self.lock:
+            for connections in self.idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self.idle_connections.clear()
+
+
+class KeepAliveHandler(AbstractHTTPHandler):
+    """URL handler for HTTP and HTTPS which keeps the connections to the
+    server open and re-uses them for subsequent requests.  This saves the TCP
+    and TLS handshakes.  The response body is read completely before the
+    connection is returned to the pool.
+    """
+    handler_order = 400
+
+    def __init__(self, connection_pool):
+        AbstractHTTPHandler.__init__(self)
+        self.connection_pool = connection_pool
+
+    http_request = AbstractHTTPHandler.do_request_
+    https_request = AbstractHTTPHandler.do_request_
+
+    def http_open(self, request):
+        return self._open(http_client.HTTPConnection, request)
+
+    def https_open(self, request):
+        return self._open(http_client.HTTPSConnection, request)
+
+    def _open(self, connection_class, request):
+        if six.PY2:
+            host, selector, data = request.get_host(), request.get_selector(), request.get_data()
+        else:
+            host, selector, data = request.host, request.selector, request.data
+        if not host:
+            raise urllib.error.URLError("no host given")
+        headers = dict(request.unredirected_hdrs)
+        headers.update((key, value) for key, value in request.headers.items() if key not in headers)
+        headers = {name.title(): value for name, value in headers.items()}
+        key = (connection_class, host)
+        while True:
+            connection, reused = self.connection_pool.get(key, lambda: connection_class(host, timeout=request.timeout))
+            try:
+                connection.request(request.get_method(), selector, data, headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (socket.error, http_client.HTTPException) as error:
+                connection.close()
+                # The server may have closed an idle connection in the
+                # meantime.  Then, we simply try again with a fresh one.
+                if not reused:
+                    raise urllib.error.URLError(error)
+            else:
+                break
+        if response.will_close:
+            connection.close()
+        else:
+            self.connection_pool.put(key, connection)
+        result = urllib.response.addinfourl(six.BytesIO(body), response.msg, request.get_full_url(), response.status)
+        result.code, result.msg = response.status, response.reason
+        return result
+
+
+class Future(object):
+    """Result of a function call which is executed in the background by
+    :py:meth:`JuliaBaseConnection.submit`.
+    """
+
+    def __init__(self, async_result):
+        self.async_result = async_result
+
+    def done(self):
+        """Returns whether the call has finished.
+
+        :rtype: bool
+        """
+        return self.async_result.ready()
+
+    def result(self, timeout=None):
+        """Waits for the call to finish and returns its result.  If the call
+        raised an exception, it is raised here again.
+
+        :param timeout: maximal number of seconds to wait; ``None`` means
+            forever
+
+        :type timeout: float or NoneType
+
+        :return:
+          the return value of the call
+
+        :rtype: ``object``
+
+        :raises multiprocessing.TimeoutError: if the call hasn't finished within
+          ``timeout`` seconds
+        """
+        return self.async_result.get(timeout)
+
+
 class JuliaBaseConnection(object):
     """Class for the routines that connect to the database at HTTP level.
     This is a singleton class, and its only instance resides at top-level in
     this module.
+
+    The connections to the server are kept open and re-used.  Both the
+    connections and the session cookies are shared by all threads, so you can
+    use the connection from many threads at the same time.  The easiest way to
+    do so is `map`.
     """
     cookie_jar = http_cookiejar.CookieJar()
-    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookie_jar))
+    connection_pool = ConnectionPool()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookie_jar),
+                                         KeepAliveHandler(connection_pool))
     http_headers = [("User-agent", "JuliaBase-Remote/1.0"),
                     ("X-requested-with", "XMLHttpRequest"),
                     ("Accept", "application/json,text/html;q=0.9,application/xhtml+xml;q=0.9,text/*;q=0.8,*/*;q=0.7")]
@@ -333,6 +490,19 @@ class JuliaBaseConnection(object):
     def __init__(self):
         self.username = None
         self.root_url = None
+        self.thread_pool = None
+        self.thread_pool_lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def batch(self):
+        """The `Batch` which is active in the current thread, or ``None``.
+        """
+        return getattr(self.local, "batch", None)
+
+    @batch.setter
+    def batch(self, batch):
+        self.local.batch = batch
 
     def _do_http_request(self, url, data=None):
         logging.debug("{0} {1!r}".format(url, data))
@@ -360,7 +530,9 @@ class JuliaBaseConnection(object):
                 if max_cycles == 0:
                     logging.error("Request failed.")
                     raise
-            time.sleep(3 * random.random())
+            # Exponential backoff with jitter, so that many threads don't
+            # hammer a struggling server in lockstep.
+            time.sleep(random.uniform(0, min(30, 0.25 * 2 ** (9 - max_cycles))))
 
     @staticmethod
     def _clean_data(data):
@@ -380,7 +552,7 @@ class JuliaBaseConnection(object):
                         cleaned_data[key] = cleaned_list
         return cleaned_data
 
-    def open(self, relative_url, data=None, response_is_json=True):
+    def open(self, relative_url, data=None, response_is_json=True, result_callback=None):
         """Do an HTTP request with the JuliaBase server.  If ``data`` is not
         ``None``, its a POST request, and GET otherwise.
 
@@ -391,11 +563,14 @@ class JuliaBaseConnection(object):
             request.
         :param response_is_json: whether the content type of the response must
             be JSON
+        :param result_callback: only used within a `Batch`: it is called with
+            the response once the queued request has been sent
 
         :type relative_url: str
         :type data: dict mapping unicode to unicode, int, float, bool, file, or
           list
         :type response_is_json: bool
+        :type result_callback: callable or NoneType
 
         :return:
           the response to the request
@@ -408,9 +583,15 @@ class JuliaBaseConnection(object):
             incomplete.
         :raises urllib.error.URLError: if a lower-level error occured, e.g. the
             HTTP connection couldn't be established.
+
+        Within a `Batch`, POST requests are queued, and ``None`` is returned.
         """
         if self.root_url is None:
             raise Exception("No root URL defined.  Maybe not logged-in?")
+        if data is not None and self.batch is not None:
+            assert response_is_json
+            self.batch.add(relative_url, self._clean_data(data), result_callback)
+            return None
         response = self._do_http_request(self.root_url + relative_url, self._clean_data(data))
         if response_is_json:
             assert response.info()["Content-Type"].startswith("application/json")
@@ -438,10 +619,174 @@ class JuliaBaseConnection(object):
     def logout(self):
         self.open("logout_remote_client")
         self.username = self.root_url = None
+        self.connection_pool.clear()
+
+    def _get_thread_pool(self):
+        with self.thread_pool_lock:
+            if self.thread_pool is None:
+                self.thread_pool = ThreadPool(settings.MAX_CONCURRENT_REQUESTS)
+            return self.thread_pool
+
+    def submit(self, function, *args, **kwargs):
+        """Calls a function in a background thread.  At most
+        ``settings.MAX_CONCURRENT_REQUESTS`` calls are executed at the same
+        time; further calls are queued.  For example::
+
+            future = connection.submit(connection.open, "samples/14-JS-1")
+            …
+            sample_data = future.result()
+
+        Don't call `submit` or `map` from within a function which is executed
+        this way, because this may dead-lock.
+
+        :param function: the function to call
+        :param args: the positional arguments of ``function``
+        :param kwargs: the keyword arguments of ``function``
+
+        :type function: callable
+
+        :return:
+          the future of the result of the call
+
+        :rtype: `Future`
+        """
+        return Future(self._get_thread_pool().apply_async(function, args, kwargs))
+
+    def map(self, function, *iterables):
+        """Like Python's ``map`` but the calls are executed in parallel, with at
+        most ``settings.MAX_CONCURRENT_REQUESTS`` calls at the same time.  This
+        is useful for issuing many independent requests, for example::
+
+            connection.map(lambda measurement: measurement.submit(), measurements)
+
+        If a call raises an exception, it is raised here again.  Don't call
+        `submit` or `map` from within ``function``, because this may
+        dead-lock.
+
+        :param function: the function to call
+        :param iterables: the iterables containing the arguments of
+            ``function``
+
+        :type function: callable
+        :type iterables: list of iterable
+
+        :return:
+          the results of the calls, in the order of the arguments
+
+        :rtype: list
+        """
+        return self._get_thread_pool().map(lambda args: function(*args), list(zip(*iterables)))
 
 connection = JuliaBaseConnection()
 
 
+class Batch(object):
+    """Context manager for submitting many objects in bulk.  All POST requests
+    issued in the ``with`` block – e.g. by the ``submit()`` methods – are
+    queued and sent to the server in chunks.  The server executes every chunk
+    in one database transaction.  For example::
+
+        with Batch() as batch:
+            for measurement in measurements:
+                measurement.submit()
+        process_ids = batch.results
+
+    Within the block, ``submit()`` returns ``None``.  The ``id`` attribute of
+    a new object is set as soon as the chunk containing it has been sent, at
+    the latest when the block is left.  The results of all queued requests are
+    available in the attribute ``results`` after the block, in the order of
+    the requests.  If a request fails, the chunk it belongs to is rolled back
+    and a `JuliaBaseError` is raised; its message starts with the index of the
+    failed request within the chunk.  GET requests are not affected by the
+    batch.  If a GET request depends on the queued requests (e.g. the next free
+    deposition number), call :py:meth:`flush` before it.  File uploads cannot be
+    batched.
+
+    Batches apply to the current thread only.
+
+    :ivar results: the results of all submitted requests so far
+
+    :type results: list of ``object``
+    """
+
+    def __init__(self, chunk_size=100):
+        """
+        :param chunk_size: the maximal number of requests sent in one go
+
+        :type chunk_size: int
+        """
+        self.chunk_size = chunk_size
+        self.requests = []
+        self.result_callbacks = []
+        self.sample_ids = set()
+        self.results = []
+
+    def __enter__(self):
+        assert connection.batch is None, "Batches must not be nested."
+        connection.batch = self
+        return self
+
+    def __exit__(self, type_, value, tb):
+        try:
+            if type_ is None:
+                self.flush()
+        finally:
+            connection.batch = None
+
+    def add(self, relative_url, data, result_callback=None):
+        """Queues a POST request.  You will rarely call this method directly;
+        it is called by :py:meth:`JuliaBaseConnection.open`.  If the queue is
+        full, it is sent before the new request is added, so that
+        ``result_callback`` is never called before
+        :py:meth:`JuliaBaseConnection.open` has returned.
+
+        :param relative_url: the non-domain part of the URL
+        :param data: the cleaned POST data
+        :param result_callback: called with the response to this request once
+            it has been sent
+
+        :type relative_url: str
+        :type data: dict mapping unicode to unicode or list of unicode
+        :type result_callback: callable or NoneType
+        """
+        assert not any(isinstance(value, file) for value in data.values()), "File uploads cannot be batched."
+        if len(self.requests) >= self.chunk_size:
+            self.flush()
+        self.requests.append((relative_url, data))
+        self.result_callbacks.append(result_callback)
+
+    def add_to_my_samples(self, sample_ids):
+        """Makes sure that the samples are on “My Samples” while the requests
+        are executed on the server.  This replaces
+        :py:class:`~jb_remote.samples.TemporaryMySamples` within a batch.
+
+        :param sample_ids: the IDs of the samples
+
+        :type sample_ids: iterable of int
+        """
+        self.sample_ids.update(sample_ids)
+
+    def flush(self):
+        """Sends all queued requests to the server.
+        """
+        if not self.requests:
+            return
+        requests, self.requests = self.requests, []
+        result_callbacks, self.result_callbacks = self.result_callbacks, []
+        sample_ids, self.sample_ids = self.sample_ids, set()
+        connection.batch = None
+        try:
+            results = connection.open("bulk_submit", {"requests": json.dumps(requests),
+                                                      "my_samples": comma_separated_ids(sample_ids)})
+        finally:
+            connection.batch = self
+        self.results.extend(results)
+        for result_callback, result in zip(result_callbacks, results):
+            if result_callback:
+                result_callback(result)
+        logging.info("Submitted {0} requests in bulk.".format(len(requests)))
+
+
 def login(username, password, testserver=False):
     """Logins to JuliaBase.
 
@@ -474,7 +819,9 @@ class PrimaryKeys(object):
     """Dictionary-like class for storing primary keys.  I use this class only
     to delay the costly loading of the primary keys until they are really
     accessed.  This way, GET-request-only usage of the Remote Client becomes
-    faster.  It is a singleton.
+    faster.  The primary keys are fetched again after
+    ``settings.PRIMARY_KEYS_TTL`` seconds, so that long-running programs see
+    new users and topics.  It is a singleton.
 
     :ivar components: set of types of primary keys that should be fetched.  For
         example, it may contain ``"external_operators=*"`` if all external
@@ -487,11 +834,13 @@ class PrimaryKeys(object):
 
     def __init__(self):
         self.primary_keys = None
+        self.timestamp = None
         self.components = {"topics=*", "users=*"}
 
     def __getitem__(self, key):
-        if self.primary_keys is None:
+        if self.primary_keys is None or time.time() - self.timestamp > settings.PRIMARY_KEYS_TTL:
             self.primary_keys = connection.open("primary_keys?" + "&".join(self.components))
+            self.timestamp = time.time()
         return self.primary_keys[key]
 
 primary_keys = PrimaryKeys()
@@ -18,13 +18,25 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import absolute_import, unicode_literals, division
-from six.moves import cPickle as pickle
-from six.moves.email_mime_multipart import MIMEMultipart
-from six.moves.email_mime_text import MIMEText
+from .six.moves import cPickle as pickle
+from .six.moves.email_mime_multipart import MIMEMultipart
+from .six.moves.email_mime_text import MIMEText
+from .six.moves import queue
 
-import os, sys, re, subprocess, time, smtplib, email, logging
+import os, sys, re, time, smtplib, email, logging, hashlib, sqlite3, select, struct
+import multiprocessing, threading, traceback
+from multiprocessing.pool import ThreadPool
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 from . import settings
+from .common import JuliaBaseError
+from .samples import sample_ids
 
 
 class PIDLock(object):
@@ -99,7 +111,249 @@ class PIDLock(object):
             logging.info("Removed lock {0}".format(self.lockfile_path))
 
 
-def find_changed_files(root, diff_file, pattern=""):
+class _DirEntry(object):
+    """Minimal replacement for ``os.DirEntry`` on Pythons without
+    ``os.scandir``.
+    """
+
+    def __init__(self, dirpath, name):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_symlink(self):
+        return os.path.islink(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def _scandir(dirpath):
+    if scandir:
+        return scandir(dirpath)
+    return [_DirEntry(dirpath, name) for name in os.listdir(dirpath)]
+
+
+def _md5sum(filepath):
+    """Returns the MD5 hash of the file contents, or ``None`` if the file could
+    not be read (e.g. because it was removed in the meantime).  Big chunks are
+    read, so that ``hashlib`` can release the GIL while hashing.
+    """
+    hash_ = hashlib.md5()
+    try:
+        with open(filepath, "rb") as file_:
+            for chunk in iter(lambda: file_.read(1024 * 1024), b""):
+                hash_.update(chunk)
+    except (IOError, OSError):
+        return None
+    return hash_.hexdigest()
+
+
+class FileIndex(object):
+    """Persistent index of the files below a root directory, stored in an
+    SQLite database.  For every file, it contains modification time, size, and
+    MD5 hash, and for every directory, its modification time.  The latter
+    changes whenever files are added to or removed from the directory, so a
+    directory with an unchanged modification time needn't be listed again.
+
+    Old pickle files of `find_changed_files` are converted automatically.
+
+    You will rarely use this class directly.  Use `find_changed_files`,
+    `watch_changed_files`, and `defer_files` instead.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path to the SQLite database; it is created if it doesn't
+            exist yet
+
+        :type path: str
+        """
+        legacy_statuses = legacy_pattern = None
+        if os.path.exists(path):
+            with open(path, "rb") as file_:
+                is_sqlite = file_.read(16) == b"SQLite format 3\0"
+            if not is_sqlite:
+                legacy_statuses, legacy_pattern = pickle.load(open(path, "rb"))
+                os.rename(path, path + ".old")
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS files (directory TEXT, name TEXT, mtime REAL, size INTEGER, md5 TEXT,
+                                              PRIMARY KEY (directory, name));
+            CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, mtime REAL);
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+            """)
+        if legacy_statuses is not None:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, NULL, ?)",
+                    (os.path.split(relative_filepath) + (mtime, md5.decode("ascii") if isinstance(md5, bytes) else md5)
+                     for relative_filepath, (mtime, md5) in legacy_statuses.items()))
+                self.set_pattern(legacy_pattern)
+            os.remove(path + ".old")
+        self.directories = dict(self.connection.execute("SELECT path, mtime FROM directories"))
+        self.subdirectories = {}
+        for directory in self.directories:
+            if directory:
+                self.subdirectories.setdefault(os.path.dirname(directory), set()).add(directory)
+
+    def close(self):
+        self.connection.close()
+
+    def get_pattern(self):
+        row = self.connection.execute("SELECT value FROM settings WHERE key='pattern'").fetchone()
+        return row[0] if row else None
+
+    def set_pattern(self, pattern):
+        self.connection.execute("INSERT OR REPLACE INTO settings VALUES ('pattern', ?)", (pattern,))
+
+    def get_files(self, directory):
+        """Returns the indexed files of a directory.
+
+        :param directory: path of the directory relative to the root
+
+        :type directory: str
+
+        :return:
+          mapping of the filenames to modification time, size, and MD5 hash
+
+        :rtype: dict mapping str to (float, int, str)
+        """
+        return {name: (mtime, size, md5) for name, mtime, size, md5 in
+                self.connection.execute("SELECT name, mtime, size, md5 FROM files WHERE directory=?", (directory,))}
+
+    def remove_non_matching(self, compiled_pattern):
+        """Removes all files from the index whose names don't match the
+        pattern.  Moreover, all directories are marked as changed, so that
+        they are listed again in the next scan.
+        """
+        non_matching = [(directory, name) for directory, name in self.connection.execute("SELECT directory, name FROM files")
+                        if not compiled_pattern.match(name)]
+        self.connection.executemany("DELETE FROM files WHERE directory=? AND name=?", non_matching)
+        self.connection.execute("UPDATE directories SET mtime=NULL")
+        self.directories = dict.fromkeys(self.directories)
+
+    def remove_directory_tree(self, directory):
+        """Removes a directory and everything below it from the index.
+
+        :param directory: path of the directory relative to the root
+
+        :type directory: str
+
+        :return:
+          the paths of the removed files relative to the root
+
+        :rtype: list of str
+        """
+        removed = []
+        for subdirectory in list(self.subdirectories.get(directory, ())):
+            removed.extend(self.remove_directory_tree(subdirectory))
+        removed.extend(os.path.join(directory, name) for name in self.get_files(directory))
+        self.connection.execute("DELETE FROM files WHERE directory=?", (directory,))
+        self.connection.execute("DELETE FROM directories WHERE path=?", (directory,))
+        self.directories.pop(directory, None)
+        self.subdirectories.pop(directory, None)
+        self.subdirectories.get(os.path.dirname(directory), set()).discard(directory)
+        return removed
+
+    def set_directory_mtime(self, directory, mtime):
+        self.connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?)", (directory, mtime))
+        if directory not in self.directories and directory:
+            self.subdirectories.setdefault(os.path.dirname(directory), set()).add(directory)
+        self.directories[directory] = mtime
+
+    def scan(self, root, compiled_pattern, directories=None, trust_directory_mtimes=False, hashing_threads=4):
+        """Scans the file tree for changes and updates the index.
+
+        :param root: absolute root path of the files to be scanned
+        :param compiled_pattern: regular expression for filenames (without
+            path) that should be scanned
+        :param directories: if given, only these directories (relative to
+            ``root``) and new directories below them are scanned, and they are
+            always listed; this is used for inotify events
+        :param trust_directory_mtimes: whether files in directories whose
+            modification time hasn't changed are assumed to be unchanged, too.
+            This is much faster but misses files which are modified in place.
+        :param hashing_threads: the number of threads computing MD5 hashes
+
+        :type root: str
+        :type compiled_pattern: ``_sre.SRE_Pattern``
+        :type directories: iterable of str or NoneType
+        :type trust_directory_mtimes: bool
+        :type hashing_threads: int
+
+        :return:
+          files changed, files removed; both relative to ``root``.  Changed
+          files are sorted by timestamp, oldest first.
+
+        :rtype: list of str, list of str
+        """
+        touched = []
+        removed = []
+        stack = [""] if directories is None else list(directories)
+        while stack:
+            directory = stack.pop()
+            dirpath = os.path.join(root, directory)
+            try:
+                directory_mtime = os.stat(dirpath).st_mtime
+            except OSError:
+                removed.extend(self.remove_directory_tree(directory))
+                continue
+            known_files = self.get_files(directory)
+            if directories is None and self.directories.get(directory) == directory_mtime:
+                stack.extend(self.subdirectories.get(directory, ()))
+                if trust_directory_mtimes:
+                    continue
+                for name, status in known_files.items():
+                    try:
+                        stat = os.stat(os.path.join(dirpath, name))
+                    except OSError:
+                        removed.append(os.path.join(directory, name))
+                    else:
+                        if (stat.st_mtime, stat.st_size) != status[:2]:
+                            touched.append((directory, name, stat.st_mtime, stat.st_size, status[2]))
+            else:
+                found_subdirectories = set()
+                for entry in _scandir(dirpath):
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirectory = os.path.join(directory, entry.name)
+                            found_subdirectories.add(subdirectory)
+                            if directories is None or subdirectory not in self.directories:
+                                stack.append(subdirectory)
+                    elif compiled_pattern.match(entry.name):
+                        stat = entry.stat()
+                        status = known_files.pop(entry.name, None)
+                        if status is None or (stat.st_mtime, stat.st_size) != status[:2]:
+                            touched.append((directory, entry.name, stat.st_mtime, stat.st_size,
+                                            status[2] if status else None))
+                removed.extend(os.path.join(directory, name) for name in known_files)
+                for subdirectory in self.subdirectories.get(directory, set()) - found_subdirectories:
+                    removed.extend(self.remove_directory_tree(subdirectory))
+                self.set_directory_mtime(directory, directory_mtime)
+        self.connection.executemany("DELETE FROM files WHERE directory=? AND name=?",
+                                    (os.path.split(relative_filepath) for relative_filepath in removed))
+        changed = []
+        if touched:
+            pool = ThreadPool(hashing_threads)
+            try:
+                md5sums = pool.map(lambda item: _md5sum(os.path.join(root, item[0], item[1])), touched)
+            finally:
+                pool.close()
+            hashed = [(item, md5sum) for item, md5sum in zip(touched, md5sums) if md5sum is not None]
+            for (directory, name, mtime, size, old_md5sum), md5sum in hashed:
+                if old_md5sum != md5sum:
+                    changed.append((mtime, os.path.join(directory, name)))
+            self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                        (item[:4] + (md5sum,) for item, md5sum in hashed))
+        self.connection.commit()
+        changed.sort()
+        return [relative_filepath for __, relative_filepath in changed], removed
+
+
+def find_changed_files(root, diff_file, pattern="", trust_directory_mtimes=False):
     """Returns the files changed or removed since the last run of this
     function.  The files are given as a list of absolute paths.  Changed files
     are files which have been added or modified.  If a file was moved, the new
@@ -111,16 +365,28 @@ def find_changed_files(root, diff_file, pattern=""):
     modification status of the last run only refers to file paths relative to
     ``root``.
 
+    The modification status is kept in an SQLite database (see `FileIndex`).
+    Files whose size and modification time haven't changed are not read.  The
+    others are hashed in parallel, and only if their content has changed, they
+    are returned as changed.
+
     :param root: absolute root path of the files to be scanned
-    :param diff_file: path to a writable pickle file which contains the
+    :param diff_file: path to a writable SQLite file which contains the
         modification status of all files of the last run; it is created if it
-        doesn't exist yet
+        doesn't exist yet.  Pickle files of older versions of this function are
+        converted.
     :param pattern: Regular expression for filenames (without path) that should
         be scanned.  By default, all files are scanned.
+    :param trust_directory_mtimes: whether directories whose modification time
+        hasn't changed are skipped completely.  This makes scanning huge trees
+        much faster.  But then, files which are modified in place (rather than
+        being replaced by a new file) are not detected.  This is usually fine
+        for measurement data, which is written once.
 
     :type root: unicode
     :type diff_file: unicode
     :type pattern: unicode
+    :type trust_directory_mtimes: bool
 
     :return:
       files changed, files removed
@@ -128,49 +394,143 @@ def find_changed_files(root, diff_file, pattern=""):
     :rtype: list of str, list of str
     """
     compiled_pattern = re.compile(pattern, re.IGNORECASE)
-    if os.path.exists(diff_file):
-        statuses, last_pattern = pickle.load(open(diff_file, "rb"))
-        if last_pattern != pattern:
-            for relative_filepath in [relative_filepath for relative_filepath in statuses
-                                      if not compiled_pattern.match(os.path.basename(relative_filepath))]:
-                del statuses[relative_filepath]
-    else:
-        statuses, last_pattern = {}, None
-    touched = []
-    found = set()
-    for dirname, __, filenames in os.walk(root):
-        for filename in filenames:
-            if compiled_pattern.match(filename):
-                filepath = os.path.join(dirname, filename)
-                relative_filepath = os.path.relpath(filepath, root)
-                found.add(relative_filepath)
-                mtime = os.path.getmtime(filepath)
-                status = statuses.setdefault(relative_filepath, [None, None])
-                if mtime != status[0]:
-                    status[0] = mtime
-                    touched.append(filepath)
-    removed = set(statuses) - found
-    for relative_filepath in removed:
-        del statuses[relative_filepath]
-    removed = [os.path.join(root, relative_filepath) for relative_filepath in removed]
-    changed = []
-    timestamps = {}
-    if touched:
-        xargs_process = subprocess.Popen(["xargs", "-0", "md5sum"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        xargs_output = xargs_process.communicate(b"\0".join(touched))[0]
-        if xargs_process.returncode != 0:
-            raise subprocess.CalledProcessError(xargs_process.returncode, "xargs")
-        for line in xargs_output.splitlines():
-            md5sum, __, filepath = line.partition(b"  ")
-            status = statuses[os.path.relpath(filepath, root)]
-            if md5sum != status[1]:
-                status[1] = md5sum
-                changed.append(filepath)
-                timestamps[filepath] = status[0]
-    changed.sort(key=lambda filepath: timestamps[filepath])
-    if touched or removed or last_pattern != pattern:
-        pickle.dump((statuses, pattern), open(diff_file, "wb"), pickle.HIGHEST_PROTOCOL)
-    return changed, removed
+    index = FileIndex(diff_file)
+    try:
+        if index.get_pattern() != pattern:
+            index.remove_non_matching(compiled_pattern)
+            index.set_pattern(pattern)
+        changed, removed = index.scan(root, compiled_pattern, trust_directory_mtimes=trust_directory_mtimes)
+    finally:
+        index.close()
+    return [os.path.join(root, path) for path in changed], [os.path.join(root, path) for path in removed]
+
+
+class _Inotify(object):
+    """Minimal ctypes wrapper around Linux' inotify.  It only reports which of
+    the watched directories have changed.
+    """
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE, IN_DELETE_SELF, \
+        IN_MOVE_SELF = 0x2, 0x4, 0x8, 0x40, 0x80, 0x100, 0x200, 0x400, 0x800
+    IN_Q_OVERFLOW, IN_IGNORED = 0x4000, 0x8000
+    mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self):
+        import ctypes, ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self.get_errno = ctypes.get_errno
+        self.watches = {}
+        self.watched_directories = set()
+
+    def add_watch(self, path, directory):
+        watch_descriptor = self.libc.inotify_add_watch(self.fd, path.encode(sys.getfilesystemencoding()), self.mask)
+        if watch_descriptor < 0:
+            raise OSError(self.get_errno(), "inotify_add_watch failed for {0}".format(path))
+        self.watches[watch_descriptor] = directory
+        self.watched_directories.add(directory)
+
+    def read_changed_directories(self, timeout):
+        """Waits for events and returns the directories they occured in.
+
+        :return:
+          the changed directories, or ``None`` if the event queue overflowed
+          and everything must be scanned
+
+        :rtype: set of str or NoneType
+        """
+        directories = set()
+        while select.select([self.fd], [], [], timeout)[0]:
+            buffer_ = os.read(self.fd, 65536)
+            position = 0
+            while position < len(buffer_):
+                watch_descriptor, mask, __, length = struct.unpack_from("iIII", buffer_, position)
+                position += 16 + length
+                if mask & self.IN_Q_OVERFLOW:
+                    return None
+                if watch_descriptor in self.watches:
+                    if mask & self.IN_IGNORED:
+                        self.watched_directories.discard(self.watches.pop(watch_descriptor))
+                    else:
+                        directories.add(self.watches[watch_descriptor])
+            # Collect further events for a short while, so that files which
+            # are still being written are processed in one go.
+            timeout = 1
+        return directories
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_changed_files(root, diff_file, pattern="", poll_interval=600):
+    """Generator for the files changed or removed below ``root``.  It works
+    like `find_changed_files` but doesn't terminate.  After an initial scan,
+    it waits for changes and yields them.  On Linux, it uses inotify, so that
+    only directories with events are scanned again.  Note that every directory
+    needs an inotify watch, so you may have to increase
+    :file:`/proc/sys/fs/inotify/max_user_watches`.  Elsewhere, or if inotify
+    fails, the whole tree is scanned every ``poll_interval`` seconds.  A full
+    scan is done every ``poll_interval`` seconds anyway.
+
+    For example::
+
+        for changed, removed in watch_changed_files(root, diff_file):
+            process(changed, removed)
+
+    :param root: absolute root path of the files to be scanned
+    :param diff_file: path to a writable SQLite file which contains the
+        modification status of all files; see `find_changed_files`
+    :param pattern: Regular expression for filenames (without path) that should
+        be scanned.  By default, all files are scanned.
+    :param poll_interval: number of seconds between full scans
+
+    :type root: unicode
+    :type diff_file: unicode
+    :type pattern: unicode
+    :type poll_interval: float
+
+    :return:
+      yields files changed, files removed; these lists are never both empty
+
+    :rtype: iterator of (list of str, list of str)
+    """
+    compiled_pattern = re.compile(pattern, re.IGNORECASE)
+    index = FileIndex(diff_file)
+    try:
+        inotify = _Inotify()
+    except (OSError, AttributeError):
+        logging.warning("inotify not available, falling back to polling.")
+        inotify = None
+    try:
+        if index.get_pattern() != pattern:
+            index.remove_non_matching(compiled_pattern)
+            index.set_pattern(pattern)
+        directories = None
+        while True:
+            changed, removed = index.scan(root, compiled_pattern, directories)
+            if inotify:
+                try:
+                    for directory in index.directories:
+                        if directory not in inotify.watched_directories:
+                            inotify.add_watch(os.path.join(root, directory), directory)
+                except OSError as error:
+                    logging.warning("{0}, falling back to polling.".format(error))
+                    inotify.close()
+                    inotify = None
+            if changed or removed:
+                yield [os.path.join(root, path) for path in changed], [os.path.join(root, path) for path in removed]
+            if inotify:
+                directories = inotify.read_changed_directories(poll_interval)
+                if directories is not None and not directories:
+                    directories = None
+            else:
+                time.sleep(poll_interval)
+                directories = None
+    finally:
+        if inotify:
+            inotify.close()
+        index.close()
 
 
 def defer_files(diff_file, filepaths):
@@ -185,9 +545,9 @@ def defer_files(diff_file, filepaths):
 
     If a filepath is not found in the diff file, this is ignored.
 
-    :param diff_file: path to a writable pickle file which contains the
-        modification status of all files of the last run; it is created if it
-        doesn't exist yet
+    :param diff_file: path to a writable SQLite file which contains the
+        modification status of all files of the last run; see
+        `find_changed_files`
     :param filepaths: all relative paths that should be removed from the diff
         file; they are relative to the root that was used when creating the
         diff file;  see `find_changed_files`
@@ -195,12 +555,239 @@ def defer_files(diff_file, filepaths):
     :type diff_file: str
     :type filepaths: iterable of str
     """
-    statuses, pattern = pickle.load(open(diff_file, "rb"))
-    twelve_weeks_ago = time.time() - 12 * 7 * 24 * 3600
-    for filepath in filepaths:
-        if filepath in statuses and statuses[filepath][0] > twelve_weeks_ago:
-            del statuses[filepath]
-    pickle.dump((statuses, pattern), open(diff_file, "wb"), pickle.HIGHEST_PROTOCOL)
+    index = FileIndex(diff_file)
+    try:
+        twelve_weeks_ago = time.time() - 12 * 7 * 24 * 3600
+        for filepath in filepaths:
+            directory, name = os.path.split(filepath)
+            deleted = index.connection.execute("DELETE FROM files WHERE directory=? AND name=? AND mtime>?",
+                                               (directory, name, twelve_weeks_ago)).rowcount
+            if deleted:
+                # Make sure that the directory is listed again.
+                index.connection.execute("UPDATE directories SET mtime=NULL WHERE path=?", (directory,))
+        index.connection.commit()
+    finally:
+        index.close()
+
+
+def _timed_parse(parse, filepath):
+    """Calls ``parse`` in a worker process of `CrawlerRunner`.  Exceptions are
+    returned rather than raised, so that one broken file doesn't stop the
+    crawler.
+    """
+    start = time.time()
+    try:
+        sample_name, data = parse(filepath)
+    except Exception:
+        return filepath, None, traceback.format_exc(), time.time() - start
+    return filepath, (sample_name, data), None, time.time() - start
+
+
+def resolve_sample_names(sample_names):
+    """Looks up many sample names in the database at once.  Names which are
+    not found, or which are ambiguous aliases, are missing in the result.  The
+    sample IDs are cached in `jb_remote.sample_ids`.
+
+    :param sample_names: the names of the samples
+
+    :type sample_names: iterable of unicode
+
+    :return:
+      mapping of the found sample names to their IDs
+
+    :rtype: dict mapping unicode to int
+    """
+    return sample_ids.lookup(sample_names)
+
+
+class CrawlerRunner(object):
+    """Runs a crawler as a pipeline of three stages which work in parallel:
+
+    1. Parsing of the data files in a pool of processes.
+    2. Looking up the sample names of the parsed files, many at a time.
+    3. Submitting the resulting `jb_remote` objects to the server.
+
+    Between stages 2 and 3, there is a bounded queue, so that the parsers
+    cannot run away from the server.  The crawler author only provides a parse
+    function and a function mapping the parsed data to `jb_remote` objects.
+    For example::
+
+        def parse(filepath):
+            header = read_header(filepath)
+            return header["sample"], header
+
+        def build(filepath, header, sample_id):
+            measurement = PDSMeasurement()
+            measurement.sample_id = sample_id
+            ...
+            return [measurement]
+
+        runner = CrawlerRunner("pds_crawler", parse, build)
+        changed, removed = find_changed_files(root, diff_file)
+        failed = runner.run(changed)
+        defer_files(diff_file, [os.path.relpath(filepath, root) for filepath in failed])
+
+    ``parse`` is executed in other processes, so it must be a module-level
+    function, and its result must be picklable.  The objects returned by
+    ``build`` are submitted in the given order, and the files are processed in
+    the order given to `run`.
+
+    :ivar statistics: For every stage (``"parse"``, ``"resolve"``,
+      ``"submit"``), the number of items processed, the number of errors, and
+      the seconds spent in this stage.  For the parse stage, the time is the
+      sum over all processes.
+
+    :type statistics: dict mapping str to dict mapping str to int or float
+    """
+
+    def __init__(self, name, parse, build, create_sample=None, parsing_processes=None, batch_size=50,
+                 queue_size=100):
+        """
+        :param name: the name of the crawler; it is used for the `PIDLock`
+        :param parse: function which takes the path to a data file and returns
+            the sample name and the parsed data
+        :param build: function which takes the path to the data file, the
+            parsed data, and the sample ID, and returns the `jb_remote` objects
+            to be submitted
+        :param create_sample: function which takes the sample name and the
+            parsed data, creates the sample in the database, and returns its
+            ID; it is called if a sample doesn't exist yet.  If not given,
+            files of unknown samples are considered failed.
+        :param parsing_processes: number of parsing processes; defaults to the
+            number of CPUs
+        :param batch_size: number of sample names looked up at once
+        :param queue_size: maximal number of files waiting for submission
+
+        :type name: str
+        :type parse: callable
+        :type build: callable
+        :type create_sample: callable or NoneType
+        :type parsing_processes: int or NoneType
+        :type batch_size: int
+        :type queue_size: int
+        """
+        self.name, self.parse, self.build, self.create_sample = name, parse, build, create_sample
+        self.parsing_processes, self.batch_size, self.queue_size = parsing_processes, batch_size, queue_size
+        self.sample_ids = {}
+        self.failed = []
+        self.lock = threading.Lock()
+        self.statistics = {stage: {"items": 0, "errors": 0, "seconds": 0.0} for stage in ("parse", "resolve", "submit")}
+
+    def _count(self, stage, items=0, errors=0, seconds=0):
+        with self.lock:
+            statistics = self.statistics[stage]
+            statistics["items"] += items
+            statistics["errors"] += errors
+            statistics["seconds"] += seconds
+
+    def _fail(self, stage, filepath, message):
+        logging.error("{0} failed for {1}: {2}".format(stage, filepath, message))
+        with self.lock:
+            self.failed.append(filepath)
+        self._count(stage, errors=1)
+
+    def _resolve(self, batch, submit_queue):
+        start = time.time()
+        missing_names = {sample_name for __, sample_name, __ in batch} - set(self.sample_ids)
+        try:
+            self.sample_ids.update(resolve_sample_names(missing_names))
+        except Exception as error:
+            for filepath, __, __ in batch:
+                self._fail("resolve", filepath, error)
+        else:
+            self._count("resolve", items=len(batch), seconds=time.time() - start)
+            for item in batch:
+                submit_queue.put(item)
+
+    def _submit_all(self, submit_queue):
+        while True:
+            item = submit_queue.get()
+            if item is None:
+                break
+            filepath, sample_name, data = item
+            start = time.time()
+            try:
+                sample_id = self.sample_ids.get(sample_name)
+                if sample_id is None:
+                    if self.create_sample is None:
+                        self._fail("submit", filepath, "sample {0} not found".format(sample_name))
+                        continue
+                    sample_id = self.sample_ids[sample_name] = self.create_sample(sample_name, data)
+                for jb_remote_object in self.build(filepath, data, sample_id):
+                    jb_remote_object.submit()
+            except Exception as error:
+                if isinstance(error, JuliaBaseError):
+                    # The cached sample ID may be stale, e.g. because the
+                    # sample was deleted or merged.  Look it up again next time.
+                    sample_ids.discard(sample_name)
+                    self.sample_ids.pop(sample_name, None)
+                self._fail("submit", filepath, traceback.format_exc())
+            else:
+                self._count("submit", items=1, seconds=time.time() - start)
+
+    def run(self, filepaths):
+        """Processes the given data files.  Errors in single files are logged
+        and don't stop the crawler.  If another instance of the crawler is
+        running, nothing is done.
+
+        :param filepaths: the paths to the data files
+
+        :type filepaths: iterable of str
+
+        :return:
+          the paths of the files which could not be processed, e.g. for
+          `defer_files`; ``None`` if another instance of the crawler is
+          running
+
+        :rtype: list of str or NoneType
+        """
+        with PIDLock(self.name) as locked:
+            if not locked:
+                return None
+            self.failed = []
+            submit_queue = queue.Queue(self.queue_size)
+            submitter = threading.Thread(target=self._submit_all, args=(submit_queue,))
+            submitter.start()
+            pool = multiprocessing.Pool(self.parsing_processes)
+            try:
+                batch = []
+                for filepath, result, error, seconds in pool.imap(_Parser(self.parse), filepaths):
+                    if error:
+                        self._fail("parse", filepath, error)
+                        continue
+                    self._count("parse", items=1, seconds=seconds)
+                    sample_name, data = result
+                    batch.append((filepath, sample_name, data))
+                    if len(batch) >= self.batch_size:
+                        self._resolve(batch, submit_queue)
+                        batch = []
+                self._resolve(batch, submit_queue)
+            finally:
+                pool.close()
+                submit_queue.put(None)
+                submitter.join()
+            self.log_statistics()
+            return self.failed
+
+    def log_statistics(self):
+        """Writes the throughput of all stages to the log.
+        """
+        for stage in ("parse", "resolve", "submit"):
+            statistics = self.statistics[stage]
+            logging.info("{0}: {1} items, {2} errors, {3:.1f} s ({4:.1f} items/s)".format(
+                stage, statistics["items"], statistics["errors"], statistics["seconds"],
+                statistics["items"] / statistics["seconds"] if statistics["seconds"] else 0))
+
+
+class _Parser(object):
+    """Picklable wrapper around the parse function of a `CrawlerRunner`.
+    """
+
+    def __init__(self, parse):
+        self.parse = parse
+
+    def __call__(self, filepath):
+        return _timed_parse(self.parse, filepath)
 
 
 def send_error_mail(from_, subject, text, html=None):
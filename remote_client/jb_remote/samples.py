@@ -19,16 +19,130 @@
 
 from __future__ import absolute_import, unicode_literals, division
 
-import json
+import json, time, os, atexit, threading, functools
+from .six.moves import urllib
 from .common import connection, primary_keys, comma_separated_ids, double_urlquote, format_timestamp, parse_timestamp, logging
+from . import settings
 
 
-__all__ = ["TemporaryMySamples", "Sample", "Result", "User"]
+__all__ = ["TemporaryMySamples", "Sample", "Result", "User", "sample_ids"]
 
 
 primary_keys.components.add("external_operators=*")
 
 
+class SampleIDs(object):
+    """Cache mapping sample names to sample IDs.  Entries expire after
+    ``settings.SAMPLE_IDS_TTL`` seconds.  If ``settings.SAMPLE_IDS_CACHE_PATH``
+    is set, the cache is stored in this file when the program exits, and read
+    from it when it is used for the first time.  This way, e.g. a crawler
+    which re-imports known samples doesn't need to look them up at all.  It
+    is a singleton, and thread-safe.
+
+    Samples which are added or renamed through :py:meth:`Sample.submit` are
+    updated automatically.  However, the cache cannot know about samples which
+    were renamed or deleted by others.  If their names are given to other
+    samples, the old IDs are returned until they expire.  Therefore, the TTL
+    should be short.
+    """
+
+    chunk_size = 200
+    """Maximal number of sample names looked up with one request.
+    """
+
+    def __init__(self):
+        self.ids = None
+        self.lock = threading.RLock()
+
+    def _load(self):
+        if self.ids is None:
+            self.ids = {}
+            if settings.SAMPLE_IDS_CACHE_PATH:
+                try:
+                    with open(settings.SAMPLE_IDS_CACHE_PATH) as cache_file:
+                        self.ids = {name: tuple(value) for name, value in json.load(cache_file).items()}
+                except (IOError, ValueError):
+                    pass
+                atexit.register(self.save)
+
+    def save(self):
+        """Writes the cache to ``settings.SAMPLE_IDS_CACHE_PATH``, if set.  This
+        is done automatically when the program exits.  Since every process
+        writes to its own temporary file and renames it atomically, concurrent
+        programs don't corrupt the file; the last one wins.
+        """
+        if settings.SAMPLE_IDS_CACHE_PATH and self.ids is not None:
+            with self.lock:
+                now = time.time()
+                ids = {name: value for name, value in self.ids.items() if now - value[1] < settings.SAMPLE_IDS_TTL}
+            temporary_path = "{0}.{1}.tmp".format(settings.SAMPLE_IDS_CACHE_PATH, os.getpid())
+            with open(temporary_path, "w") as cache_file:
+                json.dump(ids, cache_file)
+            os.rename(temporary_path, settings.SAMPLE_IDS_CACHE_PATH)
+
+    def update(self, ids):
+        """Inserts sample IDs into the cache.
+
+        :param ids: mapping of sample names to sample IDs
+
+        :type ids: dict mapping unicode to int
+        """
+        with self.lock:
+            self._load()
+            now = time.time()
+            for name, id_ in ids.items():
+                self.ids[name] = (id_, now)
+
+    def discard(self, name):
+        """Removes a sample name from the cache, e.g. because the sample was
+        renamed.  If the name is not in the cache, nothing happens.
+
+        :param name: the sample name
+
+        :type name: unicode
+        """
+        with self.lock:
+            self._load()
+            self.ids.pop(name, None)
+
+    def lookup(self, names):
+        """Returns the IDs of the given samples.  All names which are not in
+        the cache are looked up in the database, with as few requests as
+        possible.  Names which are not found, or which are ambiguous aliases,
+        are missing in the result.
+
+        :param names: the sample names
+
+        :type names: iterable of unicode
+
+        :return:
+          mapping of the found sample names to their IDs
+
+        :rtype: dict mapping unicode to int
+        """
+        result = {}
+        missing_names = []
+        with self.lock:
+            self._load()
+            now = time.time()
+            for name in set(names):
+                value = self.ids.get(name)
+                if value and now - value[1] < settings.SAMPLE_IDS_TTL:
+                    result[name] = value[0]
+                else:
+                    missing_names.append(name)
+        for i in range(0, len(missing_names), self.chunk_size):
+            chunk = missing_names[i:i + self.chunk_size]
+            found = connection.open("primary_keys?samples=" +
+                                    ",".join(urllib.parse.quote_plus(name) for name in chunk))["samples"]
+            found = {name: id_ for name, id_ in found.items() if not isinstance(id_, list)}
+            self.update(found)
+            result.update(found)
+        return result
+
+sample_ids = SampleIDs()
+
+
 class TemporaryMySamples(object):
     """Context manager for adding samples to the “My Samples” list
     temporarily.  This is used when editing or adding processes.  In order to
@@ -44,6 +158,9 @@ class TemporaryMySamples(object):
     added to “My Samples”.  After having execuded this code, those samples that
     hadn't been on “My Samples” already are removed from “My Samples”.  This
     way, the “My Samples” list is unchanged eventually.
+
+    Within a :py:class:`~jb_remote.common.Batch`, the samples are passed to
+    the server together with the batched requests instead.
     """
 
     def __init__(self, sample_ids):
@@ -56,7 +173,11 @@ class TemporaryMySamples(object):
         self.sample_ids = sample_ids if isinstance(sample_ids, (list, tuple, set)) else [sample_ids]
 
     def __enter__(self):
-        self.changed_sample_ids = connection.open("change_my_samples", {"add": comma_separated_ids(self.sample_ids)})
+        if connection.batch is not None:
+            connection.batch.add_to_my_samples(self.sample_ids)
+            self.changed_sample_ids = None
+        else:
+            self.changed_sample_ids = connection.open("change_my_samples", {"add": comma_separated_ids(self.sample_ids)})
 
     def __exit__(self, type_, value, tb):
         if self.changed_sample_ids:
@@ -87,9 +208,10 @@ class Sample(object):
             self.tags = data["tags"]
             self.topic = data["topic"]
             self.processes = dict((key, value) for key, value in data.items() if key.startswith("process "))
+            self.original_name = self.name
         else:
             self.id = self.name = self.current_location = self.currently_responsible_person = self.purpose = self.tags = \
-                self.topic = None
+                self.topic = self.original_name = None
         self.edit_description = None
         self.edit_important = True
 
@@ -110,12 +232,28 @@ class Sample(object):
             data["topic"] = primary_keys["topics"][self.topic]
         if self.id:
             connection.open("samples/by_id/{0}/edit/".format(self.id), data)
+            if self.original_name and self.original_name != self.name:
+                sample_ids.discard(self.original_name)
             logging.info("Edited sample {0}.".format(self.name))
         else:
-            self.id = connection.open("add_sample", data)
+            self.id = connection.open("add_sample", data, result_callback=self._set_id)
             logging.info("Added sample {0}.".format(self.name))
+        if self.id:
+            self._set_id(self.id)
         return self.id
 
+    def _set_id(self, id_):
+        """Sets the ID of the sample after it was added, and stores it in
+        `sample_ids`.  Within a :py:class:`~jb_remote.common.Batch`, this is
+        called when the chunk containing the sample has been sent.
+
+        :param id_: the ID of the sample
+
+        :type id_: int
+        """
+        self.id, self.original_name = id_, self.name
+        sample_ids.update({self.name: id_})
+
     def add_to_my_samples(self, user=None):
         data = {"add": self.id}
         if user:
@@ -212,7 +350,7 @@ class Result(object):
                 connection.open("results/{0}/edit/".format(self.id), data)
                 logging.info("Edited result {0}.".format(self.id))
             else:
-                self.id = connection.open("results/add/", data)
+                self.id = connection.open("results/add/", data, result_callback=functools.partial(setattr, self, "id"))
                 logging.info("Added result {0}.".format(self.id))
         return self.id
 
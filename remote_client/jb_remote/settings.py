@@ -39,6 +39,10 @@ from __future__ import absolute_import, unicode_literals, division
 # Must end in "/".
 ROOT_URL = None
 TESTSERVER_ROOT_URL = "https://demo.juliabase.org/"
+MAX_CONCURRENT_REQUESTS = 4
+PRIMARY_KEYS_TTL = 3600
+SAMPLE_IDS_TTL = 3600
+SAMPLE_IDS_CACHE_PATH = None
 
 SMTP_SERVER = "mailrelay.example.com:587"
 # If not empty, TLS is used.
@@ -36,9 +36,8 @@ characters.
 
 from __future__ import absolute_import, unicode_literals
 from jb_remote import six
-from jb_remote.six.moves import urllib
 
-import re, logging, datetime, os
+import re, logging, datetime, os, functools
 from jb_remote import *
 
 
@@ -84,6 +83,9 @@ class ClusterToolDeposition(object):
         if not self.operator:
             self.operator = connection.username
         if self.id is None and self.number is None:
+            if connection.batch is not None:
+                # The next free number depends on the queued depositions.
+                connection.batch.flush()
             self.number = connection.open("next_deposition_number/C")
         data = {"number": self.number,
                 "operator": primary_keys["users"][self.operator],
@@ -99,7 +101,8 @@ class ClusterToolDeposition(object):
                 connection.open("cluster_tool_depositions/{0}/edit/".format(self.number), data)
                 logging.info("Edited cluster tool deposition {0}.".format(self.number))
             else:
-                self.id = connection.open("cluster_tool_depositions/add/", data)
+                self.id = connection.open("cluster_tool_depositions/add/", data,
+                                          result_callback=functools.partial(setattr, self, "id"))
                 logging.info("Added cluster tool deposition {0}.".format(self.number))
         return self.id
 
@@ -243,7 +246,8 @@ class PDSMeasurement(object):
                 connection.open("pds_measurements/{0}/edit/".format(self.number), data)
                 logging.info("Edited PDS measurement {0}.".format(self.number))
             else:
-                self.id = connection.open("pds_measurements/add/", data)
+                self.id = connection.open("pds_measurements/add/", data,
+                                          result_callback=functools.partial(setattr, self, "id"))
                 logging.info("Added PDS measurement {0}.".format(self.number))
         return self.id
 
@@ -292,7 +296,7 @@ class Substrate(object):
             if self.id:
                 connection.open("substrates/{0}/edit/".format(self.id), data)
             else:
-                self.id = connection.open("substrates/add/", data)
+                self.id = connection.open("substrates/add/", data, result_callback=functools.partial(setattr, self, "id"))
         return self.id
 
 
@@ -314,6 +318,30 @@ name_pattern = re.compile(r"\d\d[A-Z]-\d{3,4}([-A-Za-z_/][-A-Za-z_/0-9#()]*)?"
                           r"|(\d\d-[A-Z]{2}[A-Z0-9]{0,2}|[A-Z]{2}[A-Z0-9]{2})-[-A-Za-z_/0-9#()]+")
 allowed_character_pattern = re.compile("[-A-Za-z_/0-9#()]")
 
+def normalize_sample_name(sample_name):
+    """Returns the sample name as it is stored in the database.  If the sample
+    name doesn't fit into the naming scheme, a legacy sample name accoring to
+    ``{short_year}-LGCY-...`` is generated.
+
+    :param sample_name: the name of the sample
+
+    :type sample_name: unicode
+
+    :return:
+      the normalized sample name
+
+    :rtype: unicode
+    """
+    if not name_pattern.match(sample_name):
+        # Build a legacy name with the ``{short_year}-LGCY-`` prefix.
+        allowed_sample_name_characters = []
+        for character in sample_name:
+            if allowed_character_pattern.match(character):
+                allowed_sample_name_characters.append(character)
+        sample_name = "{}-LGCY-{}".format(str(datetime.datetime.now().year)[2:], "".join(allowed_sample_name_characters)[:30])
+    return sample_name
+
+
 def get_sample(sample_name):
     """Looks up a sample name in the database, and returns its ID.  (No full
     `Sample` instance is returned to spare ressources.  Mostly, only the ID is
@@ -324,6 +352,9 @@ def get_sample(sample_name):
     If the sample name doesn't fit into the naming scheme, a legacy sample name
     accoring to ``{short_year}-LGCY-...`` is generated.
 
+    Known sample names are taken from `jb_remote.sample_ids`, so that repeated
+    lookups don't cause any requests.
+
     :param sample_name: the name of the sample
 
     :type sample_name: unicode
@@ -337,16 +368,9 @@ def get_sample(sample_name):
         newly created sample and substrate for your convenience.  See the
         documentation of this exception class for more information.
     """
-
-    if not name_pattern.match(sample_name):
-        # Build a legacy name with the ``{short_year}-LGCY-`` prefix.
-        allowed_sample_name_characters = []
-        for character in sample_name:
-            if allowed_character_pattern.match(character):
-                allowed_sample_name_characters.append(character)
-        sample_name = "{}-LGCY-{}".format(str(datetime.datetime.now().year)[2:], "".join(allowed_sample_name_characters)[:30])
-    sample_id = connection.open("primary_keys?samples=" + urllib.parse.quote_plus(sample_name))["samples"].get(sample_name)
-    if sample_id is not None and not isinstance(sample_id, list):
+    sample_name = normalize_sample_name(sample_name)
+    sample_id = sample_ids.lookup([sample_name]).get(sample_name)
+    if sample_id is not None:
         return sample_id
     else:
         new_sample = Sample()
@@ -354,6 +378,29 @@ def get_sample(sample_name):
         raise SampleNotFound(new_sample)
 
 
+def get_samples(sample_names):
+    """Looks up many sample names in the database at once.  This is much faster
+    than calling `get_sample` for each of them because only the names which
+    are not yet in `jb_remote.sample_ids` are looked up, and with as few
+    requests as possible.
+
+    :param sample_names: the names of the samples; they are normalized like in
+      `get_sample`
+
+    :type sample_names: iterable of unicode
+
+    :return:
+      mapping of the given sample names to their IDs; names which were not
+      found are missing
+
+    :rtype: dict mapping unicode to int
+    """
+    normalized_names = {sample_name: normalize_sample_name(sample_name) for sample_name in sample_names}
+    ids = sample_ids.lookup(normalized_names.values())
+    return {sample_name: ids[normalized_name] for sample_name, normalized_name in normalized_names.items()
+            if normalized_name in ids}
+
+
 class SolarsimulatorMeasurement(object):
 
     def __init__(self, process_id=None):
@@ -401,7 +448,8 @@ class SolarsimulatorMeasurement(object):
                 connection.open("solarsimulator_measurements/{0}/edit/".format(self.id) + query_string, data)
                 logging.info("Edited solarsimulator measurement {0}.".format(self.id))
             else:
-                self.id = connection.open("solarsimulator_measurements/add/", data)
+                self.id = connection.open("solarsimulator_measurements/add/", data,
+                                          result_callback=functools.partial(setattr, self, "id"))
                 logging.info("Added solarsimulator measurement {0}.".format(self.id))
         return self.id
 
@@ -460,7 +508,7 @@ class Structuring(object):
                 connection.open("structurings/{0}/edit/".format(self.id), data)
                 logging.info("Edited structuring {0}.".format(self.id))
             else:
-                self.id = connection.open("structurings/add/", data)
+                self.id = connection.open("structurings/add/", data, result_callback=functools.partial(setattr, self, "id"))
                 logging.info("Added structuring {0}.".format(self.id))
         return self.id
 
@@ -513,6 +561,9 @@ class FiveChamberDeposition(object):
         if not self.operator:
             self.operator = connection.username
         if self.number is None:
+            if connection.batch is not None:
+                # The next free number depends on the queued depositions.
+                connection.batch.flush()
             self.number = connection.open("next_deposition_number/S")
         data = {"number": self.number,
                 "operator": primary_keys["users"][self.operator],
@@ -530,7 +581,8 @@ class FiveChamberDeposition(object):
                 connection.open("5-chamber_depositions/{0}/edit/".format(self.number), data)
                 logging.info("Edited 5-chamber deposition {0}.".format(self.number))
             else:
-                self.id = connection.open("5-chamber_depositions/add/", data)
+                self.id = connection.open("5-chamber_depositions/add/", data,
+                                          result_callback=functools.partial(setattr, self, "id"))
                 logging.info("Added 5-chamber deposition {0}.".format(self.number))
         return self.id
 
@@ -54,6 +54,9 @@ class SamplesConfig(AppConfig):
         for name_format, properties in settings.SAMPLE_NAME_FORMATS.items():
             properties.setdefault("verbose_name", name_format)
 
+        import jb_common.search
+        jb_common.search.build_search_schema()
+
     def build_menu(self, menu, request):
         """Contribute to the menu.  See :py:mod:`jb_common.nav_menu` for further
         information.
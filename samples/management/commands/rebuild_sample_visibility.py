@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``rebuild_sample_visibility``.  It
+recomputes the precomputed visibility of all sample names from scratch, see
+:py:mod:`samples.utils.visibility`.  This is only necessary if the database
+was changed without sending signals, e.g. by raw SQL::
+
+    ./manage.py rebuild_sample_visibility
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+import samples.models
+from samples.utils import visibility
+
+
+class Command(BaseCommand):
+    args = ""
+    help = "Recomputes the visibility of all sample names."
+
+    def handle(self, *args, **kwargs):
+        visibility.update_visibility(samples.models.Sample.objects.all())
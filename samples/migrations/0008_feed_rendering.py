@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0007_feeddeletedprocess_feeddeletedsample'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedentry',
+            name='rendered',
+            field=models.TextField(blank=True, editable=False, verbose_name='rendered entry'),
+        ),
+        migrations.AddField(
+            model_name='userdetails',
+            name='feed_timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='feed last modified'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations, transaction, DatabaseError
+
+
+def create_trigram_indices(schema_editor):
+    """Tries to create the ``pg_trgm`` indices on the names of samples and
+    aliases.  Returns whether this was successful.
+    """
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            schema_editor.execute('CREATE INDEX samples_sample_name_trgm ON samples_sample '
+                                  'USING gin (UPPER("name"::text) gin_trgm_ops)')
+            schema_editor.execute('CREATE INDEX samples_samplealias_name_trgm ON samples_samplealias '
+                                  'USING gin (UPPER("name"::text) gin_trgm_ops)')
+    except DatabaseError:
+        return False
+    return True
+
+
+def build_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql" and create_trigram_indices(schema_editor):
+        return
+    Sample = apps.get_model("samples", "Sample")
+    SampleAlias = apps.get_model("samples", "SampleAlias")
+    SampleNameNgram = apps.get_model("samples", "SampleNameNgram")
+    names = {}
+    for sample_id, name in Sample.objects.values_list("id", "name").iterator():
+        names.setdefault(sample_id, []).append(name)
+    for sample_id, name in SampleAlias.objects.values_list("sample_id", "name").iterator():
+        names.setdefault(sample_id, []).append(name)
+    batch = []
+    for sample_id, sample_names in names.items():
+        ngrams = set()
+        for name in sample_names:
+            name = name.lower()
+            ngrams.update(name[i:i + 3] for i in range(len(name) - 2))
+        batch.extend(SampleNameNgram(ngram=ngram, sample_id=sample_id) for ngram in ngrams)
+        if len(batch) >= 10000:
+            SampleNameNgram.objects.bulk_create(batch)
+            batch = []
+    SampleNameNgram.objects.bulk_create(batch)
+
+
+def drop_trigram_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS samples_sample_name_trgm")
+        schema_editor.execute("DROP INDEX IF EXISTS samples_samplealias_name_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0008_feed_rendering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleNameNgram',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('ngram', models.CharField(max_length=3, verbose_name='n-gram')),
+                ('sample', models.ForeignKey(related_name='name_ngrams', verbose_name='sample', to='samples.Sample', on_delete=models.CASCADE)),
+            ],
+            options={
+                'verbose_name': 'sample name n-gram',
+                'verbose_name_plural': 'sample name n-grams',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='samplenamengram',
+            unique_together=set([('ngram', 'sample')]),
+        ),
+        migrations.RunPython(build_name_index, drop_trigram_indices),
+    ]
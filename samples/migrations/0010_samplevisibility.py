@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+def populate_visibilities(apps, schema_editor):
+    Sample = apps.get_model("samples", "Sample")
+    Clearance = apps.get_model("samples", "Clearance")
+    SampleVisibility = apps.get_model("samples", "SampleVisibility")
+    public_samples = Sample.objects.filter(models.Q(topic__isnull=True) | models.Q(topic__confidential=False))
+    visibilities = {(sample_id, None) for sample_id in public_samples.values_list("id", flat=True).iterator()}
+    confidential_samples = Sample.objects.filter(topic__confidential=True)
+    visibilities.update(confidential_samples.filter(topic__members__isnull=False).
+                        values_list("id", "topic__members").iterator())
+    visibilities.update(confidential_samples.values_list("id", "currently_responsible_person").iterator())
+    visibilities.update(Clearance.objects.filter(sample__topic__confidential=True).values_list("sample", "user").iterator())
+    SampleVisibility.objects.bulk_create((SampleVisibility(sample_id=sample_id, user_id=user_id)
+                                          for sample_id, user_id in visibilities), batch_size=10000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('samples', '0009_samplenamengram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleVisibility',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('sample', models.ForeignKey(related_name='visibilities', verbose_name='sample', to='samples.Sample', on_delete=models.CASCADE)),
+                ('user', models.ForeignKey(related_name='visible_samples', verbose_name='user', blank=True, to=settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE)),
+            ],
+            options={
+                'verbose_name': 'sample visibility',
+                'verbose_name_plural': 'sample visibilities',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='samplevisibility',
+            unique_together=set([('user', 'sample')]),
+        ),
+        migrations.RunPython(populate_visibilities, migrations.RunPython.noop),
+    ]
@@ -42,11 +42,12 @@ from django.template import defaultfilters, Context, TemplateDoesNotExist
 from django.template.loader import render_to_string
 import django.core.urlresolvers
 from django.conf import settings
-from django.db import models
-from django.core.cache import cache
-from jb_common.utils.base import get_really_full_name, cache_key_locked, format_enumeration, camel_case_to_underscores
+from django.db import models, connection
+from jb_common.utils.base import get_really_full_name, bump_cache_generation, bump_cache_generations, \
+    format_enumeration, camel_case_to_underscores
 from jb_common.models import Topic, PolymorphicModel, Department
 import samples.permissions
+import samples.utils.fragments
 from jb_common import search
 from samples.data_tree import DataNode, DataItem
 
@@ -204,7 +205,8 @@ class Process(PolymorphicModel):
         verbose_name_plural = _("processes")
 
     def save(self, *args, **kwargs):
-        """Saves the instance and clears stalled cache items.
+        """Saves the instance and expires its cache items by bumping its cache
+        generation.
 
         :param with_relations: If ``True`` (default), also touch the related
             samples.  Should be set to ``False`` if called from another
@@ -212,14 +214,9 @@ class Process(PolymorphicModel):
 
         :type with_relations: bool
         """
-        keys_list_key = "process-keys:{0}".format(self.id)
-        with cache_key_locked("process-lock:{0}".format(self.id)):
-            keys = cache.get(keys_list_key)
-            if keys:
-                cache.delete_many(keys)
-            cache.delete(keys_list_key)
         with_relations = kwargs.pop("with_relations", True)
         super(Process, self).save(*args, **kwargs)
+        bump_cache_generation("process-generation:{0}".format(self.id))
         if with_relations:
             for sample in self.samples.all():
                 sample.save(with_relations=False)
@@ -451,6 +448,9 @@ class Process(PolymorphicModel):
         calculated for another user and simply adapt it to the current one.
         This is important because this is a frequent use case.
 
+        You needn't care about expiring the cache items: The current cache
+        generation of the process is appended to this key by the caller.
+
         :param user_settings_hash: hash over all settings which affect the
             rendering of processes, e. g. language
         :param local_context: the local sample context; currently, this is only
@@ -518,6 +518,11 @@ class Process(PolymorphicModel):
             context["name"] = name[:1].upper() + name[1:]
         if hasattr(self, "get_sample_position_context"):
             context = self.get_sample_position_context(user, context)
+        if "html_body" not in context:
+            cache_key = self.get_cache_key(user.jb_user_details.get_data_hash(), old_context)
+            fragments = samples.utils.fragments.get_fragments(self, cache_key) if cache_key else None
+            if fragments:
+                context.update(fragments)
         if "html_body" not in context:
             context["html_body"] = render_to_string(
                 "samples/show_" + camel_case_to_underscores(self.__class__.__name__) + ".html", context)
@@ -535,6 +540,8 @@ class Process(PolymorphicModel):
                             format(camel_case_to_underscores(self.__class__.__name__)), context)
                 except TemplateDoesNotExist:
                     context["extended_html_body"] = None
+            if cache_key:
+                samples.utils.fragments.store_fragments(self, cache_key, context)
         if "operator" not in context:
             context["operator"] = self.external_operator or self.operator
         if "timestamp" not in context:
@@ -788,50 +795,23 @@ class Sample(models.Model):
                        ("rename_samples", _("Can rename samples from his/her department")))
 
     def save(self, *args, **kwargs):
-        """Saves the instance and clears stalled cache items.
+        """Saves the instance and expires its cache items by bumping its cache
+        generation.
 
         It also touches all ancestors and children and the associated split
-        processes.
+        processes, see `touch_genealogy`.
 
-        :param with_relations: If ``True`` (default), also touch the related
-            samples.  Should be set to ``False`` if called from another
-            ``save`` method in order to avoid endless recursion.
-        :param from_split: When walking through the decendents, this is set to
-            the originating split so that the child sample knows which of its
-            splits should be followed, too.  Thus, only the timestamp of
-            ``from_split`` is actually used.  It must be ``None`` (default)
-            when this method is called from outside this method, or while
-            walking through the ancestors.
+        :param with_relations: If ``True`` (default), also touch the sample
+            series of the sample.  Should be set to ``False`` if called from
+            another ``save`` method in order to avoid endless recursion.
 
         :type with_relations: bool
-        :type from_split: `SampleSplit` or NoneType
         """
-        keys_list_key = "sample-keys:{0}".format(self.pk)
-        with cache_key_locked("sample-lock:{0}".format(self.pk)):
-            keys = cache.get(keys_list_key)
-            if keys:
-                cache.delete_many(keys)
-            cache.delete(keys_list_key)
         with_relations = kwargs.pop("with_relations", True)
-        from_split = kwargs.pop("from_split", None)
         super(Sample, self).save(*args, **kwargs)
-        UserDetails.objects.filter(user__in=self.watchers.all()).update(my_samples_list_timestamp=django.utils.timezone.now())
         if with_relations:
-            for series in self.series.all():
-                series.save()
-        # Now we touch the decendents ...
-        if from_split:
-            splits = SampleSplit.objects.filter(parent=self, timestamp__gt=from_split.timestamp)
-        else:
-            splits = SampleSplit.objects.filter(parent=self)
-        for split in splits:
-            split.save(with_relations=False)
-            for child in split.pieces.all():
-                child.save(from_split=split, with_relations=False)
-        # ... and the ancestors
-        if not from_split and self.split_origin:
-            self.split_origin.save(with_relations=False)
-            self.split_origin.parent.save(with_relations=False)
+            SampleSeries.objects.filter(samples=self).update(last_modified=django.utils.timezone.now())
+        touch_genealogy(self)
 
     def __str__(self):
         """Here, I realise the peculiar naming scheme of provisional sample
@@ -924,8 +904,7 @@ class Sample(models.Model):
 
         :rtype: `SampleSplit` or NoneType
         """
-        for process in self.processes.order_by("-timestamp"):
-            process = process.actual_instance
+        for process in self.processes.order_by("-timestamp").resolve_actual_instances():
             if isinstance(process, SampleSplit):
                 return process
             if not isinstance(process, Result):
@@ -985,8 +964,8 @@ class Sample(models.Model):
         if self.split_origin:
             ancestor_data = self.split_origin.parent.get_data(only_processes=True)
             data.update(ancestor_data)
-        data.update(("process #{}".format(process.id), process.actual_instance.get_data())
-                    for process in self.processes.all())
+        data.update(("process #{}".format(process.id), process.get_data())
+                    for process in self.processes.resolve_actual_instances())
         return data
 
     def get_data_for_table_export(self):
@@ -1010,8 +989,8 @@ class Sample(models.Model):
             if self.split_origin:
                 ancestor_data = self.split_origin.parent.get_data_for_table_export()
                 data_node.children.extend(ancestor_data.children)
-            data_node.children.extend(process.actual_instance.get_data_for_table_export()
-                                  for process in self.processes.order_by("timestamp").iterator())
+            data_node.children.extend(process.get_data_for_table_export()
+                                      for process in self.processes.order_by("timestamp").resolve_actual_instances())
         return data_node
 
     @classmethod
@@ -1066,6 +1045,110 @@ class Sample(models.Model):
             return super(Sample, self).delete(*args, **kwargs)
 
 
+def get_ancestor_ids(sample):
+    """Returns the IDs of the sample and all of its ancestors, i.e. the parents
+    of the sample splits the sample descends from.  Where the database backend
+    supports it, this is done with one recursive query.  Otherwise, one query
+    per generation is needed.
+
+    :param sample: the sample whose ancestors should be found
+
+    :type sample: `Sample`
+
+    :return:
+      the IDs of the sample, its parent, its grandparent etc, up to the root
+      of the split tree
+
+    :rtype: list of int
+    """
+    if not sample.split_origin_id:
+        return [sample.pk]
+    if connection.vendor in ("postgresql", "sqlite"):
+        quote_name = connection.ops.quote_name
+        sample_options, split_options = Sample._meta, SampleSplit._meta
+        query = """WITH RECURSIVE ancestry(sample_id, split_id, generation) AS (
+                       SELECT {sample_id}, {split_origin_id}, 0 FROM {sample_table} WHERE {sample_id} = %s
+                     UNION ALL
+                       SELECT s.{sample_id}, s.{split_origin_id}, a.generation + 1
+                       FROM ancestry a JOIN {split_table} sp ON sp.{split_id} = a.split_id
+                                       JOIN {sample_table} s ON s.{sample_id} = sp.{parent_id})
+                   SELECT sample_id FROM ancestry ORDER BY generation""".format(
+                       sample_table=quote_name(sample_options.db_table),
+                       sample_id=quote_name(sample_options.pk.column),
+                       split_origin_id=quote_name(sample_options.get_field("split_origin").column),
+                       split_table=quote_name(split_options.db_table),
+                       split_id=quote_name(split_options.pk.column),
+                       parent_id=quote_name(split_options.get_field("parent").column))
+        with connection.cursor() as cursor:
+            cursor.execute(query, [sample.pk])
+            return [row[0] for row in cursor.fetchall()]
+    ancestor_ids = [sample.pk]
+    split_origin_id = sample.split_origin_id
+    while split_origin_id:
+        parent_id, split_origin_id = SampleSplit.objects.filter(pk=split_origin_id). \
+            values_list("parent_id", "parent__split_origin_id").get()
+        ancestor_ids.append(parent_id)
+    return ancestor_ids
+
+
+def get_ancestry(sample):
+    """Returns the sample and all of its ancestors as model instances, see
+    `get_ancestor_ids`.  The sample splits the samples descend from are
+    fetched, too.  Altogether, this needs two queries on database backends
+    supporting recursive queries.
+
+    :param sample: the sample whose ancestors should be found
+
+    :type sample: `Sample`
+
+    :return:
+      the sample, its parent, its grandparent etc, up to the root of the split
+      tree; for all of them, ``split_origin`` is already available without
+      further queries
+
+    :rtype: list of `Sample`
+    """
+    ancestor_ids = get_ancestor_ids(sample)
+    ancestors = Sample.objects.select_related("split_origin").in_bulk(ancestor_ids)
+    return [ancestors[ancestor_id] for ancestor_id in ancestor_ids]
+
+
+def touch_genealogy(sample):
+    """Touches the whole family of a sample, i.e. all samples and sample
+    splits in the split tree the sample belongs to, and expires their cache
+    items.  This is necessary because data sheets contain the processes of the
+    ancestors, and sample splits show the names of the pieces.  The sample
+    itself is touched, too, and the “My Samples” lists of all watchers of the
+    family are marked as changed.
+
+    Instead of saving every member of the family, the family is collected with
+    one query per generation of descendants, and then updated in bulk.  Note that no
+    ``save()`` methods or save signals are called for the relatives.
+
+    :param sample: the sample whose family should be touched; it must have been
+        saved already
+
+    :type sample: `Sample`
+    """
+    root_id = get_ancestor_ids(sample)[-1]
+    sample_ids, split_ids = {root_id}, set()
+    generation = [root_id]
+    while generation:
+        pieces = Sample.objects.filter(split_origin__parent__in=generation).values_list("pk", "split_origin_id")
+        generation = []
+        for piece_id, split_id in pieces:
+            generation.append(piece_id)
+            split_ids.add(split_id)
+        sample_ids.update(generation)
+    now = django.utils.timezone.now()
+    Sample.objects.filter(pk__in=sample_ids - {sample.pk}).update(last_modified=now)
+    if split_ids:
+        Process.objects.filter(pk__in=split_ids).update(last_modified=now)
+    UserDetails.objects.filter(user__my_samples__in=sample_ids).update(my_samples_list_timestamp=now)
+    bump_cache_generations(["sample-generation:{0}".format(sample_id) for sample_id in sample_ids] +
+                           ["process-generation:{0}".format(split_id) for split_id in split_ids])
+
+
 @python_2_unicode_compatible
 class SampleAlias(models.Model):
     """Model for former names of samples.  If a sample gets renamed (for
@@ -1095,6 +1178,22 @@ class SampleAlias(models.Model):
         return self.name
 
 
+class SampleNameNgram(models.Model):
+    """Model for the trigrams of the names and alias names of samples.  This
+    is an index for fast substring searches in sample names on databases
+    which don't have an index for this themselves.  On PostgreSQL, the
+    trigram indices of the ``pg_trgm`` extension are used instead, and this
+    table stays empty.  See :py:mod:`samples.utils.name_index`.
+    """
+    ngram = models.CharField(_("n-gram"), max_length=3)
+    sample = models.ForeignKey(Sample, models.CASCADE, verbose_name=_("sample"), related_name="name_ngrams")
+
+    class Meta:
+        unique_together = (("ngram", "sample"),)
+        verbose_name = _("sample name n-gram")
+        verbose_name_plural = _("sample name n-grams")
+
+
 @python_2_unicode_compatible
 class SampleSplit(Process):
     """A process where a sample is split into many child samples.  The sample
@@ -1191,6 +1290,23 @@ class Clearance(models.Model):
         return _("clearance of {sample} for {user}").format(sample=self.sample, user=self.user)
 
 
+class SampleVisibility(models.Model):
+    """Model for the precomputed visibility of sample names.  A row with an
+    empty ``user`` means that everyone may see the sample's name, because it is
+    not in a confidential topic.  Otherwise, there is one row for every user who
+    may see it by topic membership, responsibility, or clearance.  The table is
+    maintained by signal listeners; see :py:mod:`samples.utils.visibility`.
+    """
+    sample = models.ForeignKey(Sample, models.CASCADE, verbose_name=_("sample"), related_name="visibilities")
+    user = models.ForeignKey(django.contrib.auth.models.User, models.CASCADE, null=True, blank=True,
+                             verbose_name=_("user"), related_name="visible_samples")
+
+    class Meta:
+        unique_together = ("user", "sample")
+        verbose_name = _("sample visibility")
+        verbose_name_plural = _("sample visibilities")
+
+
 @python_2_unicode_compatible
 class SampleClaim(models.Model):
         # Translators: someone who assert a claim to samples
@@ -1596,6 +1712,12 @@ class UserDetails(models.Model):
     """This timestamp denotes when My Samples were changed most recently.  It
     is used for expiring sample datasheet caching.
     """
+    feed_timestamp = models.DateTimeField(_("feed last modified"), default=django.utils.timezone.now)
+    """This timestamp denotes when the newsfeed of the user was changed most
+    recently, i.e. when a feed entry was added or the preferences affecting
+    the feed were changed.  It is used for answering conditional requests of
+    feed readers.
+    """
     my_samples_list_timestamp = models.DateTimeField(_("My Samples list last modified"), auto_now_add=True)
     """This timestamp denotes when the My Samples list was changed most recently.
     In contrast to ``my_samples_timestamp``, this also includes things like
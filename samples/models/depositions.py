@@ -32,6 +32,7 @@ from django.utils.translation import ugettext_lazy as _, ugettext
 import django.core.urlresolvers
 from django.db import models
 from jb_common import search
+from jb_common.models import PolymorphicModel, resolve_actual_instances
 from samples.models import PhysicalProcess, fields_to_data_items, remove_data_item
 from samples.data_tree import DataNode, DataItem
 
@@ -90,20 +91,14 @@ class Deposition(PhysicalProcess):
 
         :rtype: list of `Layer`.
         """
-        layers = []
         try:
             all_layers = self.layers.all()
         except AttributeError:
-            pass
-        else:
-            for layer in all_layers:
-                try:
-                    # For deposition systems with polymorphic layers
-                    layer = layer.actual_instance
-                except AttributeError:
-                    pass
-                layers.append(layer)
-        return layers
+            return []
+        if issubclass(all_layers.model, PolymorphicModel):
+            # For deposition systems with polymorphic layers
+            return resolve_actual_instances(all_layers)
+        return list(all_layers)
 
     def get_data(self):
         """Extract the data of the deposition as a dictionary, ready to be used for
@@ -58,6 +58,18 @@ class FeedEntry(PolymorphicModel):
     sha1_hash = models.CharField(_("SHA1 hex digest"), max_length=40, blank=True, editable=False)
     """You'll never calculate the SHA-1 hash yourself.  It is done in
     `save`."""
+    rendered = models.TextField(_("rendered entry"), blank=True, editable=False)
+    """The JSON serialisation of the entry as it is shown in the feed, rendered
+    when the entry was connected with its users.  It is a dictionary with the
+    keys ``"category term"``, ``"category label"``, ``"link"`` (may be
+    ``None``), ``"variants"``, and ``"users"``.  ``"variants"`` is a list of
+    dictionaries with the keys ``"title"`` and ``"content"`` (the HTML), and
+    ``"users"`` maps user IDs (as strings) to the index of their variant.
+    Variants are needed because the entries are rendered in the language of
+    the respective user, and some entries contain user-specific content.  See
+    :py:meth:`samples.utils.views.feed.Reporter`.  If empty, the entry is
+    rendered when the feed is fetched.
+    """
 
     class Meta:
         verbose_name = _("feed entry")
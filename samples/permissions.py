@@ -42,6 +42,7 @@ from __future__ import absolute_import, unicode_literals
 
 import hashlib, re
 from django.db.models import Q
+from django.core.cache import cache
 from django.contrib.contenttypes.models import ContentType
 import django.core.urlresolvers
 from django.utils.translation import ugettext_lazy as _, ugettext
@@ -206,6 +207,9 @@ def get_allowed_physical_processes(user):
 
     :rtype: list of dict mapping str to unicode
     """
+    snapshot = getattr(user, "_permission_snapshot", None)
+    if snapshot is not None and snapshot.allowed_physical_processes is not None:
+        return [add_data.copy() for add_data in snapshot.allowed_physical_processes]
     allowed_physical_processes = []
     for physical_process_class, add_data in get_all_addable_physical_process_models().items():
         if has_permission_to_add_physical_process(user, physical_process_class):
@@ -230,20 +234,40 @@ def get_lab_notebooks(user):
     :rtype: list of dict mapping str to unicode
     """
     lab_notebooks = []
-    for process_class, process in get_all_addable_physical_process_models().items():
-        try:
-            url = django.core.urlresolvers.reverse(
-                process_class._meta.app_label + ":lab_notebook_" + utils.camel_case_to_underscores(process["type"]),
-                kwargs={"year_and_month": ""}, current_app=process_class._meta.app_label)
-        except django.core.urlresolvers.NoReverseMatch:
-            pass
-        else:
-            if has_permission_to_view_lab_notebook(user, process_class):
-                lab_notebooks.append({"label": process["label_plural"], "url": url})
+    for process_class, lab_notebook in get_all_lab_notebooks().items():
+        if has_permission_to_view_lab_notebook(user, process_class):
+            lab_notebooks.append(lab_notebook.copy())
     lab_notebooks.sort(key=lambda process: process["label"].lower())
     return lab_notebooks
 
 
+all_lab_notebooks = None
+def get_all_lab_notebooks():
+    """Get all physical process classes which have a lab notebook.  The URLs of
+    the lab notebooks are determined only once.
+
+    :return:
+      Dictionary mapping all physical process classes with a lab notebook to a
+      dictionary with two keys, namely ``"url"`` with the url to the lab book,
+      and ``"label"`` with the name of the process (starting lowercase).
+
+    :rtype: dict mapping class to dict mapping str to unicode
+    """
+    global all_lab_notebooks
+    if all_lab_notebooks is None:
+        all_lab_notebooks = {}
+        for process_class, process in get_all_addable_physical_process_models().items():
+            try:
+                url = django.core.urlresolvers.reverse(
+                    process_class._meta.app_label + ":lab_notebook_" + utils.camel_case_to_underscores(process["type"]),
+                    kwargs={"year_and_month": ""}, current_app=process_class._meta.app_label)
+            except django.core.urlresolvers.NoReverseMatch:
+                pass
+            else:
+                all_lab_notebooks[process_class] = {"label": process["label_plural"], "url": url}
+    return all_lab_notebooks
+
+
 _topic_manager_permission = None
 def get_topic_manager_permission():
     """Returns the permission object for topic managers.  This caches the database
@@ -274,7 +298,14 @@ def can_edit_any_topics(user):
 
     :rtype: bool
     """
-    return any(has_permission_to_edit_topic(user, topic) for topic in jb_common.models.Topic.objects.all())
+    # This is the condition of `assert_can_edit_topic` expressed as a query.
+    if _has_perm(user, "jb_common.change_topic"):
+        topics = jb_common.models.Topic.objects.all()
+        if not user.is_superuser:
+            topics = topics.filter(Q(members=user) | Q(confidential=False))
+    else:
+        topics = jb_common.models.Topic.objects.filter(members=user, manager=user)
+    return topics.exists()
 
 
 def can_edit_any_external_contacts(user):
@@ -324,6 +355,225 @@ def get_all_adders(process_class):
             filter(Q(groups__permissions=add_permission) | Q(user_permissions=add_permission)).distinct()
 
 
+def get_existing_permissions():
+    """Returns all existing permissions.  This is needed because process classes
+    without an “add” or “view every” permission are not restricted.  The set is
+    the same for all users, so it is stored only once in the cache.  It expires
+    if permissions are added or removed, or after a migration.
+
+    :return:
+      all existing permissions in the form ``(content_type_id, codename)``
+
+    :rtype: frozenset of (int, str)
+    """
+    cache_key = "existing-permissions:{0}".format(utils.get_cache_generation("permissions-generation"))
+    existing_permissions = utils.get_from_cache(cache_key)
+    if existing_permissions is None:
+        existing_permissions = frozenset(Permission.objects.values_list("content_type_id", "codename"))
+        cache.set(cache_key, existing_permissions)
+    return existing_permissions
+
+
+class PermissionSnapshot(object):
+    """Precomputed permission-related data of a user.  Permission checks are
+    done many times when a sample data sheet is personalised for the current
+    user, e.g. for every process.  Without the snapshot, most of them need
+    database queries.  With the snapshot attached to the user (see
+    `get_permission_snapshot`), they become simple lookups.
+
+    The snapshot is stored in the cache.  It expires whenever
+    ``touch_display_settings`` is called for the user, i.e. if their topic
+    memberships or permissions (also through their groups) change, or if their
+    superuser status, department, or “My Samples” change.
+
+    :ivar topic_ids: IDs of the topics the user is a member of
+    :ivar permissions: all permissions of the user, in the form
+      ``"app_label.codename"``
+    :ivar is_topic_manager: whether the user has the topic manager permission
+    :ivar my_sample_ids: IDs of the “My Samples” of the user
+    :ivar existing_permissions: the result of `get_existing_permissions`; it is
+      not stored in the cache together with the snapshot but attached to it
+      by `get_permission_snapshot`
+    :ivar allowed_physical_processes: the result of
+      `get_allowed_physical_processes` for this user
+
+    :type topic_ids: frozenset of int
+    :type permissions: frozenset of str
+    :type is_topic_manager: bool
+    :type my_sample_ids: frozenset of int
+    :type existing_permissions: frozenset of (int, str)
+    :type allowed_physical_processes: list of dict mapping str to unicode
+    """
+
+    def __init__(self, user):
+        """
+        :param user: the user whose permissions should be taken
+
+        :type user: django.contrib.auth.models.User
+        """
+        self.topic_ids = frozenset(user.topics.values_list("id", flat=True))
+        self.permissions = frozenset(user.get_all_permissions())
+        self.is_topic_manager = user.user_permissions.filter(pk=get_topic_manager_permission().pk).exists()
+        self.my_sample_ids = frozenset(user.my_samples.values_list("id", flat=True))
+        self.existing_permissions = get_existing_permissions()
+        self.allowed_physical_processes = None
+
+    def __getstate__(self):
+        """The existing permissions are the same for all users, so they are not
+        stored in the cache with every snapshot.
+        """
+        state = self.__dict__.copy()
+        del state["existing_permissions"]
+        return state
+
+
+def get_permission_snapshot(user):
+    """Returns the permission snapshot of the user, taking it from the cache if
+    possible.  Additionally, the snapshot is attached to the given user
+    instance, so that all permission functions in this module use it from then
+    on.  Thus, only call this for ``request.user`` in views which don't change
+    permissions.
+
+    :param user: the user whose permission snapshot should be returned
+
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the permission snapshot
+
+    :rtype: `PermissionSnapshot`
+    """
+    try:
+        return user._permission_snapshot
+    except AttributeError:
+        pass
+    user_details = user.samples_user_details
+    cache_key = "permission-snapshot:{0}-{1}-{2}-{3}-{4}-{5}-{6}".format(
+        user.pk, user_details.display_settings_timestamp.isoformat(), user_details.my_samples_timestamp.isoformat(),
+        int(user.is_active), int(user.is_superuser), user.jb_user_details.department_id,
+        utils.get_cache_generation("permissions-generation"))
+    snapshot = utils.get_from_cache(cache_key)
+    if snapshot is None:
+        snapshot = PermissionSnapshot(user)
+        user._permission_snapshot = snapshot
+        snapshot.allowed_physical_processes = get_allowed_physical_processes(user)
+        cache.set(cache_key, snapshot)
+    else:
+        snapshot.existing_permissions = get_existing_permissions()
+        user._permission_snapshot = snapshot
+    return snapshot
+
+
+class MainMenuCapabilities(object):
+    """Everything the main menu needs to know about the permissions of a user.
+    Computing it means a permission check for every process class and some
+    queries, so it is built only once and stored in the cache (see
+    `get_main_menu_capabilities`).  It expires together with the
+    `PermissionSnapshot` of the user, and additionally for all users if a topic
+    or an external operator is changed.
+
+    :ivar allowed_physical_processes: the result of
+      `get_allowed_physical_processes`
+    :ivar lab_notebooks: the result of `get_lab_notebooks`
+    :ivar can_add_topic: whether the user can add topics
+    :ivar can_edit_topics: whether the user can edit at least one topic
+    :ivar can_add_external_operator: whether the user can add external
+      operators
+    :ivar has_external_contacts: whether the user can edit at least one
+      external operator
+    :ivar can_rename_samples: whether the user can rename samples
+
+    :type allowed_physical_processes: list of dict mapping str to unicode
+    :type lab_notebooks: list of dict mapping str to unicode
+    :type can_add_topic: bool
+    :type can_edit_topics: bool
+    :type can_add_external_operator: bool
+    :type has_external_contacts: bool
+    :type can_rename_samples: bool
+    """
+
+    def __init__(self, user):
+        """
+        :param user: the user whose capabilities should be taken
+
+        :type user: django.contrib.auth.models.User
+        """
+        get_permission_snapshot(user)
+        self.allowed_physical_processes = get_allowed_physical_processes(user)
+        self.lab_notebooks = get_lab_notebooks(user)
+        self.can_add_topic = has_permission_to_edit_users_topics(user)
+        self.can_edit_topics = can_edit_any_topics(user)
+        self.can_add_external_operator = has_permission_to_add_external_operator(user)
+        self.has_external_contacts = can_edit_any_external_contacts(user)
+        self.can_rename_samples = _has_perm(user, "samples.rename_samples")
+
+
+def get_main_menu_capabilities(user):
+    """Returns the main menu capabilities of the user, taking them from the
+    cache if possible.
+
+    :param user: the user whose main menu capabilities should be returned
+
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the main menu capabilities
+
+    :rtype: `MainMenuCapabilities`
+    """
+    cache_key = "main-menu:{0}-{1}-{2}-{3}-{4}-{5}".format(
+        user.pk, user.samples_user_details.display_settings_timestamp.isoformat(), int(user.is_active),
+        int(user.is_superuser), utils.get_cache_generation("main-menu-generation"),
+        utils.get_cache_generation("permissions-generation"))
+    capabilities = utils.get_from_cache(cache_key)
+    if capabilities is None:
+        capabilities = MainMenuCapabilities(user)
+        cache.set(cache_key, capabilities)
+    return capabilities
+
+
+def _has_perm(user, permission):
+    """Like ``user.has_perm(permission)`` but uses the permission snapshot of
+    the user if available.
+    """
+    snapshot = getattr(user, "_permission_snapshot", None)
+    if snapshot is None:
+        return user.has_perm(permission)
+    return user.is_active and (user.is_superuser or permission in snapshot.permissions)
+
+
+def _permission_exists(user, codename, model_class):
+    """Returns whether the permission `codename` exists for `model_class`.  It
+    uses the permission snapshot of the user if available.
+    """
+    content_type = ContentType.objects.get_for_model(model_class)
+    snapshot = getattr(user, "_permission_snapshot", None)
+    if snapshot is None:
+        return Permission.objects.filter(codename=codename, content_type=content_type).exists()
+    return (content_type.id, codename) in snapshot.existing_permissions
+
+
+def _is_topic_member(user, topic):
+    """Returns whether the user is a member of the topic.  It uses the
+    permission snapshot of the user if available.
+    """
+    snapshot = getattr(user, "_permission_snapshot", None)
+    if snapshot is None:
+        return user in topic.members.all()
+    return topic.id in snapshot.topic_ids
+
+
+def _is_topic_manager(user):
+    """Returns whether the user has the topic manager permission (directly, not
+    through groups).  It uses the permission snapshot of the user if
+    available.
+    """
+    snapshot = getattr(user, "_permission_snapshot", None)
+    if snapshot is None:
+        return get_topic_manager_permission() in user.user_permissions.all()
+    return snapshot.is_topic_manager
+
+
 class PermissionError(Exception):
     """Common class for all permission exceptions.  We have our own exception class
     and don't use Django's `PermissionDenied` because we need additional
@@ -394,7 +644,7 @@ def assert_can_fully_view_sample(user, sample):
     if not sample.topic and sample_department != user_department and not user.is_superuser:
         description = _("You are not allowed to view the sample since the sample doesn't belong to your department.")
         raise PermissionError(user, description, new_topic_would_help=True)
-    if sample.topic and user not in sample.topic.members.all() and currently_responsible_person != user and \
+    if sample.topic and not _is_topic_member(user, sample.topic) and currently_responsible_person != user and \
             not user.is_superuser:
         if sample_department != user_department:
             description = _("You are not allowed to view the sample since you are not in the sample's topic, nor belongs the "
@@ -405,7 +655,7 @@ def assert_can_fully_view_sample(user, sample):
                             "its currently responsible person ({name})."). \
                             format(name=utils.get_really_full_name(currently_responsible_person))
             raise PermissionError(user, description, new_topic_would_help=True)
-        elif not user.has_perm("samples.view_every_sample"):
+        elif not _has_perm(user, "samples.view_every_sample"):
             description = _("You are not allowed to view the sample since you are not in the sample's topic, nor are you "
                             "its currently responsible person ({name}), nor can you view all samples."). \
                             format(name=utils.get_really_full_name(currently_responsible_person))
@@ -429,7 +679,7 @@ def assert_can_rename_sample(user, sample):
     currently_responsible_person = sample.currently_responsible_person
     sample_department = currently_responsible_person.jb_user_details.department or NoDepartment()
     user_department = user.jb_user_details.department or NoDepartment()
-    if ((not user.has_perm("samples.rename_samples") or sample_department != user_department)
+    if ((not _has_perm(user, "samples.rename_samples") or sample_department != user_department)
         and not sample_name_format(sample.name) in get_renamable_name_formats()) \
        and not user.is_superuser:
         description = _("You are not allowed to rename the sample.")
@@ -516,9 +766,9 @@ def assert_can_add_physical_process(user, process_class):
     :raises PermissionError: if the user is not allowed to add a process.
     """
     codename = "add_{0}".format(process_class.__name__.lower())
-    if Permission.objects.filter(codename=codename, content_type=ContentType.objects.get_for_model(process_class)).exists():
+    if _permission_exists(user, codename, process_class):
         permission = "{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename)
-        if not user.has_perm(permission):
+        if not _has_perm(user, permission):
             description = _("You are not allowed to add {process_plural_name} because you don't have the "
                             "permission “{permission}”.").format(
                 process_plural_name=process_class._meta.verbose_name_plural, permission=translate_permission(permission))
@@ -544,14 +794,14 @@ def assert_can_edit_physical_process(user, process):
     process_class = process.content_type.model_class()
     codename = "change_{0}".format(process_class.__name__.lower())
     has_edit_all_permission = \
-        user.has_perm("{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename))
+        _has_perm(user, "{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename))
     codename = "add_{0}".format(process_class.__name__.lower())
-    if Permission.objects.filter(codename=codename, content_type=ContentType.objects.get_for_model(process_class)).exists():
+    if _permission_exists(user, codename, process_class):
         has_add_permission = \
-            user.has_perm("{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename))
+            _has_perm(user, "{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename))
     else:
         has_add_permission = True
-    if (not has_add_permission or process.operator != user) and not (has_add_permission and not process.finished) and \
+    if (not has_add_permission or process.operator_id != user.id) and not (has_add_permission and not process.finished) and \
             not has_edit_all_permission and not user.is_superuser:
         description = _("You are not allowed to edit the process “{process}” because you are not the operator "
                         "of this process.").format(process=process)
@@ -627,8 +877,8 @@ def assert_can_view_lab_notebook(user, process_class):
     """
     codename = "view_every_{0}".format(process_class.__name__.lower())
     permission_name_to_view_all = "{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename)
-    if Permission.objects.filter(codename=codename, content_type=ContentType.objects.get_for_model(process_class)).exists():
-        has_view_all_permission = user.has_perm(permission_name_to_view_all)
+    if _permission_exists(user, codename, process_class):
+        has_view_all_permission = _has_perm(user, permission_name_to_view_all)
     else:
         has_view_all_permission = user.is_superuser
     if not has_view_all_permission:
@@ -639,6 +889,24 @@ def assert_can_view_lab_notebook(user, process_class):
         raise PermissionError(user, description)
 
 
+def _can_view_every_process(user, process_class):
+    """Returns whether the user may view all processes of the given class.  If
+    there is no “view every” permission for the class, only superusers may.
+
+    :return:
+      whether the user may view all processes of this class, the name of the
+      “view every” permission
+
+    :rtype: bool, str
+    """
+    codename = "view_every_{0}".format(process_class.__name__.lower())
+    permission_name_to_view_all = "{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename)
+    if _permission_exists(user, codename, process_class):
+        return _has_perm(user, permission_name_to_view_all), permission_name_to_view_all
+    else:
+        return user.is_superuser, permission_name_to_view_all
+
+
 def assert_can_view_physical_process(user, process):
     """Tests whether the user can view a physical process (i.e. deposition,
     measurement, etching process, clean room work etc).  You can view a process
@@ -658,13 +926,8 @@ def assert_can_view_physical_process(user, process):
         process.
     """
     process_class = process.content_type.model_class()
-    codename = "view_every_{0}".format(process_class.__name__.lower())
-    permission_name_to_view_all = "{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename)
-    if Permission.objects.filter(codename=codename, content_type=ContentType.objects.get_for_model(process_class)).exists():
-        has_view_all_permission = user.has_perm(permission_name_to_view_all)
-    else:
-        has_view_all_permission = user.is_superuser
-    if not has_view_all_permission and process.operator != user and \
+    has_view_all_permission, permission_name_to_view_all = _can_view_every_process(user, process_class)
+    if not has_view_all_permission and process.operator_id != user.id and \
             not any(has_permission_to_fully_view_sample(user, sample) for sample in process.samples.all()) and \
             not samples.models.Clearance.objects.filter(user=user, processes=process).exists():
         description = _("You are not allowed to view the process “{process}” because neither you have the "
@@ -729,8 +992,8 @@ def assert_can_add_result_process(user, sample_or_series):
     :raises PermissionError: if the user is not allowed to add the result
         process to the sample or series
     """
-    if sample_or_series.currently_responsible_person != user and sample_or_series.topic and \
-             user not in sample_or_series.topic.members.all() and not user.is_superuser:
+    if sample_or_series.currently_responsible_person_id != user.id and sample_or_series.topic and \
+             not _is_topic_member(user, sample_or_series.topic) and not user.is_superuser:
         if isinstance(sample_or_series, samples.models.Sample):
             description = _("You are not allowed to add the result to {sample_or_series} because neither are you the "
                             "currently responsible person for this sample, nor are you a member of its topic.").format(
@@ -759,9 +1022,8 @@ def assert_can_edit_sample(user, sample):
     if not sample.topic and sample_department != user_department and not user.is_superuser:
         description = _("You are not allowed to edit the sample since the sample doesn't belong to your department.")
         raise PermissionError(user, description, new_topic_would_help=True)
-    topic_manager_permission = get_topic_manager_permission()
     if sample.topic and currently_responsible_person != user and not user.is_superuser and not \
-        (user in sample.topic.members.all() and topic_manager_permission in user.user_permissions.all()):
+        (_is_topic_member(user, sample.topic) and _is_topic_manager(user)):
         description = _("You are not allowed to edit the sample “{name}” (including splitting, declaring dead, and deleting) "
                         "because you are not the currently responsible person for this sample.").format(name=sample)
         raise PermissionError(user, description)
@@ -953,6 +1215,92 @@ def assert_can_view_feed(hash_value, user):
             raise PermissionError(None, description)
 
 
+def get_viewable_instances(user, instances):
+    """Returns those of the given samples, sample series, physical processes,
+    and results which the user may view.  This is equivalent to calling
+    ``has_permission_to_fully_view_sample``,
+    ``has_permission_to_view_sample_series``,
+    ``has_permission_to_view_physical_process``, and
+    ``has_permission_to_view_result_process`` for each of them, but it needs
+    only a handful of queries for all instances together, because the related
+    samples, sample series, and clearances are fetched in bulk, and the
+    permissions are taken from the user's `PermissionSnapshot`.  Thus, call it
+    only for ``request.user``.
+
+    :param user: the user whose permissions should be checked
+    :param instances: the instances to be checked; instances of other classes
+      are never viewable
+
+    :type user: django.contrib.auth.models.User
+    :type instances: list of ``models.Model``
+
+    :return:
+      the viewable instances, in the same order as `instances`
+
+    :rtype: list of ``models.Model``
+    """
+    get_permission_snapshot(user)
+    sample_ids, sample_series_ids, process_ids, result_ids = set(), set(), set(), set()
+    for instance in instances:
+        if isinstance(instance, samples.models.Sample):
+            sample_ids.add(instance.pk)
+        elif isinstance(instance, samples.models.SampleSeries):
+            sample_series_ids.add(instance.pk)
+        elif isinstance(instance, samples.models.Result):
+            result_ids.add(instance.pk)
+            process_ids.add(instance.pk)
+        elif isinstance(instance, samples.models.PhysicalProcess):
+            process_ids.add(instance.pk)
+
+    def can_view_sample(sample):
+        if sample.pk not in viewable_samples:
+            viewable_samples[sample.pk] = has_permission_to_fully_view_sample(user, sample)
+        return viewable_samples[sample.pk]
+
+    def can_view_sample_series(sample_series):
+        return sample_series.currently_responsible_person_id == user.id or \
+            _is_topic_member(user, sample_series.topic) or user.is_superuser
+
+    viewable_samples = {}
+    sample_related = ("topic", "currently_responsible_person__jb_user_details__department")
+    for sample in samples.models.Sample.objects.filter(pk__in=sample_ids).select_related(*sample_related):
+        can_view_sample(sample)
+    viewable_sample_series = {sample_series.pk for sample_series
+                              in samples.models.SampleSeries.objects.filter(pk__in=sample_series_ids).select_related("topic")
+                              if can_view_sample_series(sample_series)}
+    processes_with_viewable_samples = set()
+    for connection in samples.models.Sample.processes.through.objects.filter(process__in=process_ids). \
+            select_related(*("sample__" + path for path in sample_related)):
+        if connection.process_id not in processes_with_viewable_samples and can_view_sample(connection.sample):
+            processes_with_viewable_samples.add(connection.process_id)
+    for connection in samples.models.SampleSeries.results.through.objects.filter(result__in=result_ids). \
+            select_related("sampleseries__topic"):
+        if can_view_sample_series(connection.sampleseries):
+            processes_with_viewable_samples.add(connection.result_id)
+    cleared_processes = set(samples.models.Clearance.processes.through.objects.
+                            filter(clearance__user=user, process__in=process_ids).values_list("process", flat=True))
+    can_view_every_process = {}
+    viewable_instances = []
+    for instance in instances:
+        if isinstance(instance, samples.models.Sample):
+            viewable = viewable_samples.get(instance.pk, False)
+        elif isinstance(instance, samples.models.SampleSeries):
+            viewable = instance.pk in viewable_sample_series
+        elif isinstance(instance, (samples.models.Result, samples.models.PhysicalProcess)):
+            viewable = instance.operator_id == user.id or instance.pk in processes_with_viewable_samples or \
+                instance.pk in cleared_processes
+            if not viewable and not isinstance(instance, samples.models.Result):
+                process_class = instance.content_type.model_class()
+                if process_class not in can_view_every_process:
+                    can_view_every_process[process_class] = _can_view_every_process(user, process_class)[0]
+                viewable = can_view_every_process[process_class]
+        else:
+            viewable = False
+        if viewable:
+            viewable_instances.append(instance)
+    return viewable_instances
+
+
 # Now, I inject the ``has_permission_to_...`` functions into this module for
 # for every ``assert_can_...`` function found here.
 
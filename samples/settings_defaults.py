@@ -39,6 +39,7 @@ INITIALS_FORMATS = {"user": {"pattern": r"[A-Z]{2,4}|[A-Z]{2,3}\d|[A-Z]{2}\d{2}"
                     }
 MERGE_CLEANUP_FUNCTION = ""
 NAME_PREFIX_TEMPLATES = []
+PLOT_RENDERING_PROCESSES = 0
 SAMPLE_NAME_FORMATS = {"provisional": {"possible_renames": {"default"}},
                        "default":     {"pattern": r"[-A-Za-z_/0-9#()]*"}}
 THUMBNAIL_WIDTH = 400
@@ -20,7 +20,8 @@
 
 """The samples database app.  This module contains the signal listeners.  Most
 of them are for cache expiring, but `expire_feed_entries` cleans up the feed
-entries queue.
+entries queue, `warm_process_fragments` maintains the fragment store, and
+`schedule_thumbnail` pre-renders plot thumbnails.
 
 
 Caching in JuliaBase-Samples
@@ -37,7 +38,7 @@ Goals
 
 We need caching of the most-accessed pages, especially if they are costly to
 generate, too.  These are the samples view, the sample series view, and the
-main menu page.  We implement a three-level cache:
+main menu page.  We implement a four-level cache:
 
 1. The browser cache.  It is activated with ``last_modified`` functions for all
    three views.  If the page hasn't been modified since the user has last
@@ -56,7 +57,13 @@ main menu page.  We implement a three-level cache:
 3. The processes cache.  Every process may be cached so that a sample or sample
    series view may be built from cached items.
 
-These three levels are tried from top to bottom.
+4. The fragment store.  The rendered HTML of every process is additionally
+   stored on disk below ``CACHE_ROOT`` (see :py:mod:`samples.utils.fragments`)
+   so that it survives restarts of the cache server and cache evictions.  Its
+   items contain the ``last_modified`` timestamp of the process in their names,
+   so they never need to be invalidated explicitly.
+
+These four levels are tried from top to bottom.
 
 
 Cache invalidation
@@ -80,8 +87,10 @@ strategy for this.  I myself made a big table with paper and pencil.
 The best approach is to have in mind the six models that need to be “touched”
 in order to delete cache items or to update a last-modified timestamp:
 
-1. ``Sample``.  This contains both a ``last_modified`` timestamp and a list of
-   cache items.
+1. ``Sample``.  This contains both a ``last_modified`` timestamp and a cache
+   generation counter.  The latter is part of the keys of all cache items
+   derived from the sample.  Saving the sample increments it, so that these
+   items are not found anymore and age out of the cache.
 
 2. ``Process``.  The same as with ``Sample``.
 
@@ -168,14 +177,19 @@ from __future__ import absolute_import, unicode_literals
 
 import datetime, hashlib
 from django.db.models import signals
+import django.apps
+import django.core.signals
 import django.utils.timezone
 from django.dispatch import receiver
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group, Permission
 import django.contrib.contenttypes.management
 from django.contrib.contenttypes.models import ContentType
 from jb_common import models as jb_common_app
 import jb_common.signals
+import jb_common.utils.base
+from django.utils import translation
 from samples import models as samples_app
+from samples.utils import fragments, plot_rendering, name_index, visibility
 
 
 @receiver(signals.m2m_changed, sender=samples_app.Sample.watchers.through)
@@ -449,6 +463,41 @@ def touch_display_settings_by_group_or_permission(sender, instance, action, reve
             instance.samples_user_details.touch_display_settings()
 
 
+@receiver(signals.m2m_changed, sender=Group.permissions.through)
+def touch_display_settings_by_group_permissions(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Touch the sample settings of all users in groups the permissions of which
+    have changed.  This expires their permission snapshots and main menus, see
+    :py:func:`samples.permissions.get_permission_snapshot`.
+    """
+    if reverse:
+        # `instance` is a permission
+        if action == "pre_clear":
+            users = User.objects.filter(groups__permissions=instance)
+        elif action in ["post_add", "post_remove"]:
+            users = User.objects.filter(groups__pk__in=pk_set)
+        else:
+            return
+    else:
+        # `instance` is a group
+        if action in ["pre_clear", "post_add", "post_remove"]:
+            users = instance.user_set.all()
+        else:
+            return
+    for user in users.distinct():
+        user.samples_user_details.touch_display_settings()
+
+
+@receiver(signals.post_save, sender=Permission)
+@receiver(signals.post_delete, sender=Permission)
+@receiver(signals.post_migrate)
+def expire_existing_permissions(sender, **kwargs):
+    """Expires the cached set of existing permissions, and with it all permission
+    snapshots and main menus.  Note that migrations create permissions without
+    sending ``post_save`` signals.
+    """
+    jb_common.utils.base.bump_cache_generation("permissions-generation")
+
+
 @receiver(jb_common.signals.maintain)
 def expire_feed_entries(sender, **kwargs):
     """Deletes all feed entries which are older than six weeks.
@@ -456,3 +505,250 @@ def expire_feed_entries(sender, **kwargs):
     now = django.utils.timezone.now()
     six_weeks_ago = now - datetime.timedelta(weeks=6)
     samples_app.FeedEntry.objects.filter(timestamp__lt=six_weeks_ago).delete()
+
+
+sample_feed_entry_models = (samples_app.FeedNewSamples, samples_app.FeedMovedSamples, samples_app.FeedCopiedMySamples,
+                            samples_app.FeedEditedSamples)
+"""Feed entry models which are about samples and become phony as soon as all
+of their samples have been deleted.
+"""
+
+
+@receiver(signals.pre_delete, sender=samples_app.Sample)
+def remember_sample_feed_entries(sender, instance, **kwargs):
+    """Remembers the feed entries about a sample which is about to be deleted,
+    so that `delete_orphaned_feed_entries` can check them afterwards.
+    """
+    instance._feed_entry_ids = set()
+    for model in sample_feed_entry_models:
+        instance._feed_entry_ids.update(model.objects.filter(samples=instance).values_list("id", flat=True))
+
+
+@receiver(signals.post_delete, sender=samples_app.Sample)
+def delete_orphaned_feed_entries(sender, instance, **kwargs):
+    """Deletes the feed entries about a deleted sample which are not about any
+    other sample, because they are phony and their links are dead.  The feeds
+    of their users are marked as modified.
+    """
+    feed_entry_ids = getattr(instance, "_feed_entry_ids", None)
+    if feed_entry_ids:
+        orphaned_entry_ids = set()
+        for model in sample_feed_entry_models:
+            orphaned_entry_ids.update(model.objects.filter(id__in=feed_entry_ids, samples=None).
+                                      values_list("id", flat=True))
+        if orphaned_entry_ids:
+            samples_app.UserDetails.objects.filter(user__feed_entries__in=orphaned_entry_ids). \
+                update(feed_timestamp=django.utils.timezone.now())
+            samples_app.FeedEntry.objects.filter(id__in=orphaned_entry_ids).delete()
+
+
+@receiver(signals.post_delete, sender=samples_app.Process)
+def delete_process_fragments(sender, instance, **kwargs):
+    """Removes the HTML fragments of deleted processes from the fragment store.
+    """
+    fragments.delete_fragments(instance.id)
+
+
+def schedule_thumbnail(sender, instance, raw, **kwargs):
+    """Pre-renders the thumbnail of a physical process after it has been saved,
+    so that it is ready when the sample data sheet is visited.  See
+    :py:mod:`samples.utils.plot_rendering`.  This listener is only connected
+    with the physical process classes which have plots at all, see below.
+    """
+    if not raw and instance.finished:
+        plot_rendering.schedule_thumbnail(instance)
+
+for model in django.apps.apps.get_models():
+    if issubclass(model, samples_app.PhysicalProcess) and plot_rendering.has_plots(model):
+        signals.post_save.connect(schedule_thumbnail, sender=model)
+
+
+@receiver(django.core.signals.request_finished)
+def submit_scheduled_thumbnails(sender, **kwargs):
+    """Submits the thumbnail renders which were deferred until the transaction
+    of the request was committed.
+    """
+    plot_rendering.submit_scheduled_thumbnails()
+
+
+@receiver(django.core.signals.request_started)
+@receiver(django.core.signals.got_request_exception)
+def discard_scheduled_thumbnails(sender, **kwargs):
+    """Discards deferred thumbnail renders, because the transaction of the
+    request was rolled back, or because they were scheduled outside a request.
+    """
+    plot_rendering.discard_scheduled_thumbnails()
+
+
+@receiver(signals.pre_save, sender=samples_app.Sample)
+def check_sample_visibility(sender, instance, raw, **kwargs):
+    """Marks the sample if its topic or its currently responsible person is
+    about to change, so that `update_sample_visibility` knows that the
+    visibility of its name must be updated.
+    """
+    if not raw and instance.pk:
+        try:
+            old_instance = samples_app.Sample.objects.only("topic", "currently_responsible_person").get(pk=instance.pk)
+        except samples_app.Sample.DoesNotExist:
+            return
+        instance._visibility_changed = old_instance.topic_id != instance.topic_id or \
+            old_instance.currently_responsible_person_id != instance.currently_responsible_person_id
+
+
+@receiver(signals.post_save, sender=samples_app.Sample)
+def update_sample_visibility(sender, instance, created, raw, **kwargs):
+    """Updates the precomputed visibility of the sample's name for new samples,
+    and for samples whose topic or currently responsible person has changed.
+    Samples loaded from fixtures are always updated, because their old state
+    is unknown.  See :py:mod:`samples.utils.visibility`.
+    """
+    if raw or created or getattr(instance, "_visibility_changed", False):
+        visibility.update_visibility(samples_app.Sample.objects.filter(pk=instance.pk))
+        instance._visibility_changed = False
+
+
+@receiver(signals.post_save, sender=jb_common_app.Topic)
+def update_visibility_by_topic(sender, instance, raw, **kwargs):
+    """Updates the precomputed visibility of the names of all samples in the
+    topic if its “confidential” status has changed.  Whether this is the case
+    is found out by looking for rows which make the samples visible to
+    everyone.  For topics loaded from fixtures, this is not reliable because
+    their samples may have been loaded before them, so they are always
+    updated.
+    """
+    samples = samples_app.Sample.objects.filter(topic=instance)
+    if raw:
+        visibility.update_visibility(samples)
+    else:
+        visible_to_everyone = samples_app.SampleVisibility.objects.filter(sample__topic=instance, user=None).exists()
+        if visible_to_everyone == instance.confidential:
+            visibility.update_visibility(samples)
+
+
+@receiver(signals.m2m_changed, sender=jb_common_app.Topic.members.through)
+def update_visibility_by_topic_memberships(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Updates the precomputed visibility of the names of the samples in
+    confidential topics for users who have joined or left these topics.
+    """
+    if reverse:
+        # `instance` is a user
+        if action in ["post_add", "post_remove"]:
+            visibility.update_visibility(samples_app.Sample.objects.filter(topic__in=pk_set, topic__confidential=True),
+                                         {instance.pk})
+        elif action == "post_clear":
+            visibility.update_visibility(samples_app.Sample.objects.filter(visibilities__user=instance), {instance.pk})
+    else:
+        # `instance` is a topic
+        if instance.confidential:
+            samples = samples_app.Sample.objects.filter(topic=instance)
+            if action in ["post_add", "post_remove"]:
+                visibility.update_visibility(samples, pk_set)
+            elif action == "post_clear":
+                visibility.update_visibility(samples)
+
+
+@receiver(signals.post_save, sender=samples_app.Clearance)
+def add_visibility_by_clearance(sender, instance, created, raw, **kwargs):
+    """Makes the name of a confidential sample visible to a user who has got a
+    clearance for it.
+    """
+    if created or raw:
+        visibility.update_visibility(samples_app.Sample.objects.filter(pk=instance.sample_id), {instance.user_id})
+
+
+@receiver(signals.post_delete, sender=samples_app.Clearance)
+def remove_visibility_by_clearance(sender, instance, **kwargs):
+    """Hides the name of a confidential sample from a user whose clearance for
+    it was deleted, unless the user may see it for another reason.
+    """
+    visibility.update_visibility(samples_app.Sample.objects.filter(pk=instance.sample_id), {instance.user_id},
+                                 only_remove=True)
+
+
+@receiver(signals.post_migrate, sender=django.apps.apps.get_app_config("samples"))
+def add_missing_visibilities(sender, **kwargs):
+    """Computes the visibility of the names of all samples which don't have any
+    yet.  This is needed because during data migrations, no signals are sent.
+    Every sample has at least one visibility row, so this catches exactly the
+    samples which were never seen by the signal listeners.  It runs only once
+    per migration, namely for the samples app.
+    """
+    visibility.update_visibility(samples_app.Sample.objects.filter(visibilities=None))
+
+
+@receiver(signals.post_save, sender=jb_common_app.Topic)
+@receiver(signals.post_delete, sender=jb_common_app.Topic)
+@receiver(signals.post_save, sender=samples_app.ExternalOperator)
+@receiver(signals.post_delete, sender=samples_app.ExternalOperator)
+@receiver(signals.m2m_changed, sender=samples_app.ExternalOperator.contact_persons.through)
+def expire_main_menu_capabilities(sender, **kwargs):
+    """Expires the cached main menu capabilities of all users, because whether
+    they can edit any topic or external operator may have changed.  See
+    :py:class:`samples.permissions.MainMenuCapabilities`.
+    """
+    jb_common.utils.base.bump_cache_generation("main-menu-generation")
+
+
+@receiver(signals.post_save, sender=samples_app.Sample)
+def update_sample_name_ngrams(sender, instance, raw, **kwargs):
+    """Updates the trigrams of the name and the alias names of a sample in the
+    name index.  Since saving an alias also saves its sample, this covers new
+    aliases, too.  See :py:mod:`samples.utils.name_index`.
+
+    Samples loaded from fixtures are indexed, too, because the trigrams only
+    depend on the sample's own name and its aliases already in the database.
+    """
+    if not name_index.has_trigram_index():
+        name_index.update_sample(instance)
+
+
+@receiver(signals.post_save, sender=samples_app.SampleAlias)
+def add_alias_name_ngrams(sender, instance, raw, **kwargs):
+    """Adds the trigrams of an alias loaded from a fixture to the name index.
+    Aliases saved normally are covered by `update_sample_name_ngrams`, but
+    fixtures don't call the ``save()`` method, which saves the sample, too.
+    """
+    if raw and not name_index.has_trigram_index():
+        try:
+            sample = samples_app.Sample.objects.get(pk=instance.sample_id)
+        except samples_app.Sample.DoesNotExist:
+            # The sample is loaded later and will take the alias into account.
+            return
+        name_index.update_sample(sample)
+
+
+@receiver(signals.post_delete, sender=samples_app.SampleAlias)
+def remove_alias_name_ngrams(sender, instance, **kwargs):
+    """Removes the trigrams of a deleted alias from the name index, unless they
+    are still needed by the sample's name or other aliases.
+    """
+    if not name_index.has_trigram_index():
+        try:
+            sample = samples_app.Sample.objects.get(pk=instance.sample_id)
+        except samples_app.Sample.DoesNotExist:
+            return
+        name_index.update_sample(sample, only_remove=True)
+
+
+@receiver(jb_common.signals.maintain)
+def warm_process_fragments(sender, **kwargs):
+    """Renders the HTML fragments of all processes which were changed during the
+    last day into the fragment store, so that the first visitors of the sample
+    data sheets in the morning don't have to wait for it.  The fragments are
+    rendered for the operator of the process and every sample the process is
+    connected with.  Besides, fragments of processes that don't exist anymore
+    are removed from the store.
+    """
+    stored_process_ids = fragments.get_stored_process_ids()
+    existing_process_ids = set(samples_app.Process.objects.filter(id__in=stored_process_ids).
+                               values_list("id", flat=True))
+    for process_id in stored_process_ids - existing_process_ids:
+        fragments.delete_fragments(process_id)
+    one_day_ago = django.utils.timezone.now() - datetime.timedelta(days=1)
+    processes = samples_app.Process.objects.filter(last_modified__gte=one_day_ago, finished=True)
+    for process in processes.resolve_actual_instances():
+        user = process.operator
+        with translation.override(user.jb_user_details.language):
+            for sample in process.samples.all():
+                process.get_context_for_user(user, {"sample": sample, "original_sample": sample,
+                                                    "latest_descendant": None, "cutoff_timestamp": None})
@@ -148,6 +148,7 @@ urlpatterns = [
     url(r"^logout_remote_client$", json_client.logout_remote_client),
     url(r"^add_alias$", json_client.add_alias),
     url(r"^change_my_samples$", json_client.change_my_samples),
+    url(r"^bulk_submit$", json_client.bulk_submit),
 
     url(r"^qr_code$", sample.qr_code, name="qr_code"),
     url(r"^data_matrix_code$", sample.data_matrix_code, name="data_matrix_code"),
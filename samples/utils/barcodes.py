@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Local generation of QR and Data Matrix codes.  No external service is
+contacted, so that labels can be printed also in offline networks.
+
+QR codes are encoded with the encoder shipped with ReportLab.  Data Matrix codes
+(ECC 200, square symbols up to 48×48 modules, ASCII encodation) are encoded by
+this module itself.
+
+A code is returned as a *matrix*, i.e. a tuple of rows, each of which is a
+tuple of booleans (``True`` means dark), without the quiet zone.  Matrices are
+cached in Django's cache, so that e.g. the code of a sample ID is computed only
+once.  They can be drawn onto a ReportLab canvas with `draw_matrix`, or
+converted to PNG with `matrix_to_png`.
+"""
+
+from __future__ import absolute_import, unicode_literals, division
+import django.utils.six as six
+
+import hashlib
+import PIL.Image
+from reportlab.graphics.barcode import qrencoder
+from jb_common.utils.base import get_from_cache
+from django.core.cache import cache
+
+
+def _get_cached_matrix(kind, data, encoder):
+    """Returns a code matrix from the cache, or encodes it and stores it in the
+    cache.
+
+    :param kind: name of the code type, e.g. ``"qr"``
+    :param data: the data to be encoded
+    :param encoder: callable which takes the data and returns the matrix
+
+    :type kind: str
+    :type data: unicode
+    :type encoder: callable
+
+    :return:
+      the code matrix
+
+    :rtype: tuple of tuple of bool
+    """
+    key = "barcode:{0}:{1}".format(kind, hashlib.sha1(data.encode("utf-8")).hexdigest())
+    rows = get_from_cache(key)
+    if rows is None:
+        matrix = encoder(data)
+        cache.set(key, ["".join("1" if module else "0" for module in row) for row in matrix])
+        return matrix
+    return tuple(tuple(module == "1" for module in row) for row in rows)
+
+
+def _encode_qr_code(data):
+    code = qrencoder.QRCode(None, qrencoder.QRErrorCorrectLevel.H)
+    code.addData(data)
+    code.make()
+    size = code.getModuleCount()
+    return tuple(tuple(bool(code.isDark(row, column)) for column in range(size)) for row in range(size))
+
+
+def qr_code(data):
+    """Returns the QR code of the given data.  The error correction level is
+    “H”.
+
+    :param data: the data to be encoded
+
+    :type data: unicode
+
+    :return:
+      the code matrix
+
+    :rtype: tuple of tuple of bool
+    """
+    return _get_cached_matrix("qr", data, _encode_qr_code)
+
+
+_data_matrix_sizes = [
+    # symbol size, data region size, number of data regions per side, data
+    # codewords, error correction codewords
+    (10, 8, 1, 3, 5), (12, 10, 1, 5, 7), (14, 12, 1, 8, 10), (16, 14, 1, 12, 12), (18, 16, 1, 18, 14),
+    (20, 18, 1, 22, 18), (22, 20, 1, 30, 20), (24, 22, 1, 36, 24), (26, 24, 1, 44, 28), (32, 14, 2, 62, 36),
+    (36, 16, 2, 86, 42), (40, 18, 2, 114, 48), (44, 20, 2, 144, 56), (48, 22, 2, 174, 68)]
+
+_gf_exp = [0] * 512
+_gf_log = [0] * 256
+_value = 1
+for _i in range(255):
+    _gf_exp[_i] = _gf_exp[_i + 255] = _value
+    _gf_log[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x12d
+del _i, _value
+
+
+def _gf_multiply(x, y):
+    return _gf_exp[_gf_log[x] + _gf_log[y]] if x and y else 0
+
+
+def _reed_solomon(codewords, number):
+    """Computes the Reed-Solomon error correction codewords for Data Matrix.
+
+    :param codewords: the data codewords
+    :param number: the number of error correction codewords
+
+    :type codewords: list of int
+    :type number: int
+
+    :return:
+      the error correction codewords
+
+    :rtype: list of int
+    """
+    generator = [1]
+    for i in range(1, number + 1):
+        factor = _gf_exp[i]
+        generator = [coefficient ^ _gf_multiply(previous, factor)
+                     for coefficient, previous in zip(generator + [0], [0] + generator)]
+    result = [0] * number
+    for codeword in codewords:
+        feedback = codeword ^ result[0]
+        result = result[1:] + [0]
+        for i in range(number):
+            result[i] ^= _gf_multiply(generator[i + 1], feedback)
+    return result
+
+
+def _data_matrix_codewords(data):
+    """Encodes the data into Data Matrix codewords using ASCII encodation.
+    Characters not in ISO 8859-1 are encoded as UTF-8 bytes.
+
+    :param data: the data to be encoded
+
+    :type data: unicode
+
+    :return:
+      the codewords, without padding
+
+    :rtype: list of int
+    """
+    try:
+        data = data.encode("iso-8859-1")
+    except UnicodeEncodeError:
+        data = data.encode("utf-8")
+    data = bytearray(data)
+    codewords = []
+    i = 0
+    while i < len(data):
+        if 48 <= data[i] <= 57 and i + 1 < len(data) and 48 <= data[i + 1] <= 57:
+            codewords.append(130 + (data[i] - 48) * 10 + data[i + 1] - 48)
+            i += 2
+            continue
+        if data[i] < 128:
+            codewords.append(data[i] + 1)
+        else:
+            codewords.extend((235, data[i] - 127))
+        i += 1
+    return codewords
+
+
+def _place_modules(codewords, rows, columns):
+    """Places the bits of the codewords in the mapping matrix, following the
+    algorithm of ISO/IEC 16022, Annex F.
+
+    :param codewords: all codewords of the symbol, including error correction
+    :param rows: number of rows of the mapping matrix
+    :param columns: number of columns of the mapping matrix
+
+    :type codewords: list of int
+    :type rows: int
+    :type columns: int
+
+    :return:
+      the mapping matrix
+
+    :rtype: list of list of bool
+    """
+    matrix = [[None] * columns for __ in range(rows)]
+
+    def module(row, column, index, bit):
+        if row < 0:
+            row += rows
+            column += 4 - ((rows + 4) % 8)
+        if column < 0:
+            column += columns
+            row += 4 - ((columns + 4) % 8)
+        matrix[row][column] = bool(codewords[index] & (1 << (8 - bit)))
+
+    def place(positions, index):
+        for bit, (row, column) in enumerate(positions, 1):
+            module(row, column, index, bit)
+
+    def utah(row, column, index):
+        place([(row - 2, column - 2), (row - 2, column - 1), (row - 1, column - 2), (row - 1, column - 1),
+               (row - 1, column), (row, column - 2), (row, column - 1), (row, column)], index)
+
+    corners = [
+        [(rows - 1, 0), (rows - 1, 1), (rows - 1, 2), (0, columns - 2), (0, columns - 1), (1, columns - 1),
+         (2, columns - 1), (3, columns - 1)],
+        [(rows - 3, 0), (rows - 2, 0), (rows - 1, 0), (0, columns - 4), (0, columns - 3), (0, columns - 2),
+         (0, columns - 1), (1, columns - 1)],
+        [(rows - 3, 0), (rows - 2, 0), (rows - 1, 0), (0, columns - 2), (0, columns - 1), (1, columns - 1),
+         (2, columns - 1), (3, columns - 1)],
+        [(rows - 1, 0), (rows - 1, columns - 1), (0, columns - 3), (0, columns - 2), (0, columns - 1),
+         (1, columns - 3), (1, columns - 2), (1, columns - 1)]]
+    index = 0
+    row, column = 4, 0
+    while True:
+        if row == rows and column == 0:
+            place(corners[0], index)
+            index += 1
+        if row == rows - 2 and column == 0 and columns % 4:
+            place(corners[1], index)
+            index += 1
+        if row == rows - 2 and column == 0 and columns % 8 == 4:
+            place(corners[2], index)
+            index += 1
+        if row == rows + 4 and column == 2 and not columns % 8:
+            place(corners[3], index)
+            index += 1
+        while True:
+            if row < rows and column >= 0 and matrix[row][column] is None:
+                utah(row, column, index)
+                index += 1
+            row -= 2
+            column += 2
+            if row < 0 or column >= columns:
+                break
+        row += 1
+        column += 3
+        while True:
+            if row >= 0 and column < columns and matrix[row][column] is None:
+                utah(row, column, index)
+                index += 1
+            row += 2
+            column -= 2
+            if row >= rows or column < 0:
+                break
+        row += 3
+        column += 1
+        if row >= rows and column >= columns:
+            break
+    if matrix[rows - 1][columns - 1] is None:
+        matrix[rows - 1][columns - 1] = matrix[rows - 2][columns - 2] = True
+        matrix[rows - 1][columns - 2] = matrix[rows - 2][columns - 1] = False
+    return matrix
+
+
+def _encode_data_matrix(data):
+    codewords = _data_matrix_codewords(data)
+    for size, region_size, regions, data_codewords, error_codewords in _data_matrix_sizes:
+        if len(codewords) <= data_codewords:
+            break
+    else:
+        raise ValueError("Data too long for a Data Matrix code.")
+    if len(codewords) < data_codewords:
+        codewords.append(129)
+        while len(codewords) < data_codewords:
+            pad = 129 + (149 * (len(codewords) + 1)) % 253 + 1
+            codewords.append(pad - 254 if pad > 254 else pad)
+    codewords += _reed_solomon(codewords, error_codewords)
+    mapping = _place_modules(codewords, region_size * regions, region_size * regions)
+    symbol = [[False] * size for __ in range(size)]
+    for row in range(size):
+        region_row, row_in_region = divmod(row, region_size + 2)
+        for column in range(size):
+            region_column, column_in_region = divmod(column, region_size + 2)
+            if column_in_region == 0 or row_in_region == region_size + 1:
+                module = True
+            elif row_in_region == 0:
+                module = column_in_region % 2 == 0
+            elif column_in_region == region_size + 1:
+                module = row_in_region % 2 == 1
+            else:
+                module = mapping[region_row * region_size + row_in_region - 1][
+                    region_column * region_size + column_in_region - 1]
+            symbol[row][column] = module
+    return tuple(tuple(row) for row in symbol)
+
+
+def data_matrix(data):
+    """Returns the Data Matrix code (ECC 200) of the given data.
+
+    :param data: the data to be encoded
+
+    :type data: unicode
+
+    :return:
+      the code matrix
+
+    :rtype: tuple of tuple of bool
+
+    :raises ValueError: if the data is too long
+    """
+    return _get_cached_matrix("data-matrix", data, _encode_data_matrix)
+
+
+def draw_matrix(canvas, matrix, x, y, size):
+    """Draws a code matrix onto a ReportLab canvas.  Adjacent dark modules in a
+    row are drawn as one rectangle.  No quiet zone is added.
+
+    :param canvas: the ReportLab canvas
+    :param matrix: the code matrix
+    :param x: horizontal coordinate of the lower left corner
+    :param y: vertical coordinate of the lower left corner
+    :param size: width and height of the code
+
+    :type canvas: ``reportlab.pdfgen.canvas.Canvas``
+    :type matrix: tuple of tuple of bool
+    :type x: float
+    :type y: float
+    :type size: float
+    """
+    module_size = size / len(matrix)
+    canvas.saveState()
+    canvas.setFillColorRGB(0, 0, 0)
+    for i, row in enumerate(matrix):
+        top = y + size - (i + 1) * module_size
+        start = None
+        for j, module in enumerate(row + (False,)):
+            if module and start is None:
+                start = j
+            elif not module and start is not None:
+                canvas.rect(x + start * module_size, top, (j - start) * module_size, module_size, stroke=0, fill=1)
+                start = None
+    canvas.restoreState()
+
+
+def matrix_to_png(matrix, module_size=4, quiet_zone=2):
+    """Converts a code matrix to a PNG image.
+
+    :param matrix: the code matrix
+    :param module_size: the width and height of one module in pixels
+    :param quiet_zone: the width of the white border in modules
+
+    :type matrix: tuple of tuple of bool
+    :type module_size: int
+    :type quiet_zone: int
+
+    :return:
+      the PNG image
+
+    :rtype: bytes
+    """
+    size = len(matrix) + 2 * quiet_zone
+    image = PIL.Image.new("1", (size, size), 1)
+    pixels = image.load()
+    for i, row in enumerate(matrix):
+        for j, module in enumerate(row):
+            if module:
+                pixels[j + quiet_zone, i + quiet_zone] = 0
+    image = image.resize((size * module_size, size * module_size))
+    output = six.BytesIO()
+    image.save(output, "png")
+    return output.getvalue()
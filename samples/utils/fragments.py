@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Persistent store for the rendered HTML fragments of processes.  Rendering
+the ``show_…`` templates of processes is expensive, and the results in the
+Django cache are lost if the cache is restarted or evicts them.  Therefore,
+the fragments ``html_body``, ``short_html_body``, and ``extended_html_body``
+are additionally stored as JSON files below ``CACHE_ROOT``.
+
+The filename contains the process' cache key (see
+:py:meth:`samples.models.Process.get_cache_key`, which includes the hash of the
+user settings) and the ``last_modified`` timestamp of the process.  Thus, a
+fragment file never becomes stale; it simply is not found anymore after the
+process was changed.  Outdated files of the same cache key are removed when the
+new ones are written.
+
+All of this is dispensable: If anything goes wrong with the file system, the
+fragments are simply rendered again.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os, glob, json, hashlib, shutil, uuid
+from django.conf import settings
+from django.utils.safestring import mark_safe
+from jb_common.utils.base import mkdirs
+
+
+fragment_keys = ("html_body", "short_html_body", "extended_html_body")
+"""Keys of the process context which are saved in the fragment store.
+"""
+
+
+def _fragments_directory(process_id):
+    return os.path.join(settings.CACHE_ROOT, "process_fragments", str(process_id))
+
+
+def _fragments_path(process, cache_key):
+    """Returns the path to the fragments file of a process.
+
+    :param process: the process
+    :param cache_key: the cache key of the process context, as returned by
+        :py:meth:`samples.models.Process.get_cache_key`
+
+    :type process: `samples.models.Process`
+    :type cache_key: str
+
+    :return:
+      the absolute path to the fragments file, and the glob pattern matching
+      all fragments files of this cache key (i.e. also outdated ones)
+
+    :rtype: str, str
+    """
+    key_hash = hashlib.sha1(cache_key.encode("utf-8")).hexdigest()
+    directory = _fragments_directory(process.id)
+    filename = "{0}-{1}.json".format(key_hash, process.last_modified.strftime("%Y%m%d%H%M%S%f"))
+    return os.path.join(directory, filename), os.path.join(directory, key_hash + "-*.json")
+
+
+def get_fragments(process, cache_key):
+    """Reads the rendered HTML fragments of a process from the store.
+
+    :param process: the process
+    :param cache_key: the cache key of the process context, as returned by
+        :py:meth:`samples.models.Process.get_cache_key`
+
+    :type process: `samples.models.Process`
+    :type cache_key: str
+
+    :return:
+      the fragments, ready to be inserted into the process context, or
+      ``None`` if there are no up-to-date fragments in the store
+
+    :rtype: dict mapping str to str, or NoneType
+    """
+    path = _fragments_path(process, cache_key)[0]
+    try:
+        with open(path) as fragments_file:
+            fragments = json.load(fragments_file)
+    except (IOError, OSError, ValueError):
+        return None
+    return {key: mark_safe(fragments[key]) if fragments.get(key) is not None else None for key in fragment_keys}
+
+
+def store_fragments(process, cache_key, context):
+    """Writes the rendered HTML fragments of a process to the store.  The file
+    is written atomically, so that concurrent readers never see a half-written
+    file.
+
+    :param process: the process
+    :param cache_key: the cache key of the process context, as returned by
+        :py:meth:`samples.models.Process.get_cache_key`
+    :param context: the process context containing the rendered fragments
+
+    :type process: `samples.models.Process`
+    :type cache_key: str
+    :type context: dict mapping str to ``object``
+    """
+    path, pattern = _fragments_path(process, cache_key)
+    temporary_path = "{0}.{1}.tmp".format(path, uuid.uuid4().hex)
+    try:
+        mkdirs(path)
+        with open(temporary_path, "w") as fragments_file:
+            json.dump({key: context.get(key) for key in fragment_keys}, fragments_file)
+        os.rename(temporary_path, path)
+        for outdated_path in glob.glob(pattern):
+            if outdated_path != path:
+                os.unlink(outdated_path)
+    except (IOError, OSError):
+        try:
+            os.unlink(temporary_path)
+        except OSError:
+            pass
+
+
+def delete_fragments(process_id):
+    """Removes all fragments of a process from the store.
+
+    :param process_id: the ID of the process
+
+    :type process_id: int
+    """
+    shutil.rmtree(_fragments_directory(process_id), ignore_errors=True)
+
+
+def get_stored_process_ids():
+    """Returns the IDs of all processes which have fragments in the store.
+
+    :return:
+      the process IDs
+
+    :rtype: set of int
+    """
+    try:
+        filenames = os.listdir(os.path.join(settings.CACHE_ROOT, "process_fragments"))
+    except OSError:
+        return set()
+    return {int(filename) for filename in filenames if filename.isdigit()}
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Index for substring searches in sample names and alias names.  A plain
+``name__icontains`` lookup cannot use an ordinary B-tree index, so with many
+samples, every search is a sequential scan.
+
+On PostgreSQL, migration 0009 creates GIN indices with the ``pg_trgm``
+extension on the upper-cased names of samples and aliases.  These are exactly
+the expressions Django uses for ``icontains``, so PostgreSQL uses the indices
+without further ado.
+
+On all other databases (or if ``pg_trgm`` is not available), the trigrams of
+all sample and alias names are stored in the table of
+:py:class:`samples.models.SampleNameNgram`.  It is kept up to date by signal
+listeners in :py:mod:`samples.signals`.  A search first determines the
+candidate samples which have all trigrams of the search pattern, and then
+checks only these with ``icontains``.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from django.db import connection
+from django.db.models import Q, Count, Case, When, Value, IntegerField
+import samples.models
+
+
+ngram_length = 3
+
+trigram_index_names = ("samples_sample_name_trgm", "samples_samplealias_name_trgm")
+
+_trigram_index_available = None
+
+def has_trigram_index():
+    """Returns whether the database has trigram indices on the names of samples
+    and aliases.  The result is cached for the lifetime of the process.
+
+    :return:
+      whether the ``pg_trgm`` indices are available
+
+    :rtype: bool
+    """
+    global _trigram_index_available
+    if _trigram_index_available is None:
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM pg_indexes WHERE indexname = ANY(%s)", [list(trigram_index_names)])
+                _trigram_index_available = cursor.fetchone()[0] == len(trigram_index_names)
+        else:
+            _trigram_index_available = False
+    return _trigram_index_available
+
+
+def get_ngrams(name):
+    """Returns the trigrams of a name.  They are case-insensitive.
+
+    :param name: the name of a sample or an alias, or a search pattern
+
+    :type name: str
+
+    :return:
+      all trigrams of the name; it is empty if the name is shorter than three
+      characters
+
+    :rtype: set of str
+    """
+    name = name.lower()
+    return {name[i:i + ngram_length] for i in range(len(name) - ngram_length + 1)}
+
+
+def update_sample(sample, only_remove=False):
+    """Brings the stored trigrams of a sample up to date with its current name
+    and alias names.
+
+    :param sample: the sample whose trigrams should be updated
+    :param only_remove: whether only trigrams which are not needed anymore
+      should be deleted; this is necessary if the sample may be in the middle
+      of being deleted
+
+    :type sample: `samples.models.Sample`
+    :type only_remove: bool
+    """
+    current_ngrams = get_ngrams(sample.name)
+    for alias in sample.aliases.values_list("name", flat=True):
+        current_ngrams |= get_ngrams(alias)
+    stored_ngrams = set(samples.models.SampleNameNgram.objects.filter(sample=sample).values_list("ngram", flat=True))
+    obsolete_ngrams = stored_ngrams - current_ngrams
+    if obsolete_ngrams:
+        samples.models.SampleNameNgram.objects.filter(sample=sample, ngram__in=obsolete_ngrams).delete()
+    if not only_remove:
+        samples.models.SampleNameNgram.objects.bulk_create(
+            samples.models.SampleNameNgram(ngram=ngram, sample=sample) for ngram in current_ngrams - stored_ngrams)
+
+
+def find_samples(base_query, pattern, aliases=False, limit=None):
+    """Searches for samples the name of which contains the given pattern.  The
+    search is case-insensitive.  The results are ranked: First the exact
+    matches, then the samples whose name starts with the pattern, and then the
+    rest, each group sorted by name.
+
+    :param base_query: the samples which may be found at all, typically the
+      result of :py:func:`samples.utils.views.restricted_samples_query`
+    :param pattern: the substring to be searched for
+    :param aliases: whether also the alias names should be searched
+    :param limit: the maximal number of returned samples; if ``None``, all
+      found samples are returned
+
+    :type base_query: QuerySet
+    :type pattern: str
+    :type aliases: bool
+    :type limit: int or NoneType
+
+    :return:
+      the found samples, whether there were more than ``limit`` results
+
+    :rtype: list of `samples.models.Sample`, bool
+    """
+    matches = Q(name__icontains=pattern)
+    if aliases:
+        matches |= Q(id__in=samples.models.SampleAlias.objects.filter(name__icontains=pattern).values("sample"))
+    found_samples = base_query.filter(matches)
+    pattern_ngrams = get_ngrams(pattern)
+    if pattern_ngrams and not has_trigram_index():
+        candidates = samples.models.SampleNameNgram.objects.filter(ngram__in=pattern_ngrams).values("sample"). \
+                     annotate(matches=Count("id")).filter(matches=len(pattern_ngrams)).values("sample")
+        found_samples = found_samples.filter(id__in=candidates)
+    found_samples = found_samples.annotate(rank=Case(When(name__iexact=pattern, then=Value(0)),
+                                                     When(name__istartswith=pattern, then=Value(1)),
+                                                     default=Value(2), output_field=IntegerField())). \
+                                                     order_by("rank", "name")
+    if limit is None:
+        return list(found_samples), False
+    found_samples = list(found_samples[:limit + 1])
+    return found_samples[:limit], len(found_samples) > limit
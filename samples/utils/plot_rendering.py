@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Rendering of plots in a pool of worker processes.  Matplotlib rendering is
+CPU-bound and slow, so it must not block the threads of the web server.
+Therefore, plots and thumbnails are rendered by a `multiprocessing.Pool` and
+stored as files below ``CACHE_ROOT``, at the relative paths returned by
+:py:meth:`samples.models.PhysicalProcess.calculate_plot_locations`.  Whether
+such a file is still up-to-date is decided by
+:py:func:`jb_common.utils.base.is_update_necessary`.
+
+A render which is in flight is marked in the cache, so that concurrent requests
+– also of other web server processes – don't render the same plot a second
+time.
+
+The size of the pool is given by the setting ``PLOT_RENDERING_PROCESSES``.  If
+it is ``0`` (the default), plots are rendered synchronously in the current
+process, and thumbnails are not pre-rendered.  The same pool rasterises PDFs
+for :py:mod:`samples.utils.thumbnails`.
+"""
+
+from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
+
+import os, time, uuid, threading, multiprocessing
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connections, transaction
+from django.utils import translation
+from django.utils.translation import ugettext
+from jb_common.utils.base import is_update_necessary, mkdirs
+
+
+rendering_lease = 300
+"""Number of seconds after which the in-flight marker of a render expires.
+This way, a crashed worker cannot block the rendering of a plot forever.
+"""
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_inherited_connections = []
+_scheduled_renders = threading.local()
+_placeholders = {}
+
+
+def _initialize_worker():
+    """Initialises a freshly forked worker process.  The database and cache
+    connections inherited from the web server process must not be used by the
+    worker, because they are shared with the parent.  Closing them would close
+    them for the parent, too, so the worker merely forgets them (keeping a
+    reference, so that they are not closed by the garbage collector).  Django
+    then opens new connections on demand.
+    """
+    for connection in connections.all():
+        _inherited_connections.append(connection.connection)
+        connection.connection = None
+    for cache_ in caches.all():
+        cache_.close()
+
+
+def get_pool():
+    """Returns the pool of rendering processes.  It is created on first use.
+    If the current process was forked after the pool was created, a new pool is
+    created, because a pool cannot be shared between processes.  The pool is
+    also used by :py:mod:`samples.utils.thumbnails` for rasterising PDFs.
+
+    :return:
+      the pool of rendering processes, or ``None`` if
+      ``PLOT_RENDERING_PROCESSES`` is ``0``
+
+    :rtype: ``multiprocessing.Pool`` or ``NoneType``
+    """
+    global _pool, _pool_pid
+    if settings.PLOT_RENDERING_PROCESSES == 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Matplotlib is known to leak memory, hence ``maxtasksperchild``.
+            _pool = multiprocessing.Pool(settings.PLOT_RENDERING_PROCESSES, _initialize_worker, maxtasksperchild=100)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def generate_plot(process, plot_id, thumbnail, datafile_name):
+    """Generates a plot or its thumbnail with Matplotlib.
+
+    :param process: the process the plot belongs to
+    :param plot_id: the plot_id of the image.  This is mostly ``""`` because
+        most measurement models have only one graphics.
+    :param thumbnail: whether we generate a PNG thumbnail instead of a PDF plot
+    :param datafile_name: the name(s) of the data file(s), as returned by
+        :py:meth:`samples.models.PhysicalProcess.get_datafile_name`
+
+    :type process: `samples.models.PhysicalProcess`
+    :type plot_id: unicode
+    :type thumbnail: bool
+    :type datafile_name: unicode or list of unicode
+
+    :return:
+      the content of the plot file
+
+    :rtype: bytes
+
+    :raises samples.utils.plots.PlotError: if the plot could not be generated
+    :raises ValueError: if the data file contains invalid data
+    """
+    output = six.BytesIO()
+    if thumbnail:
+        figure = Figure(frameon=False, figsize=(4, 3))
+        canvas = FigureCanvasAgg(figure)
+        axes = figure.add_subplot(111)
+        axes.set_position((0.17, 0.16, 0.78, 0.78))
+        axes.grid(True)
+        process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=True)
+        canvas.print_figure(output, dpi=settings.THUMBNAIL_WIDTH / 4, format="png")
+    else:
+        figure = Figure()
+        canvas = FigureCanvasAgg(figure)
+        axes = figure.add_subplot(111)
+        axes.grid(True)
+        axes.set_title(six.text_type(process))
+        process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=False)
+        # FixMe: Activate this line with Matplotlib 1.1.0.
+#            figure.tight_layout()
+        canvas.print_figure(output, format="pdf")
+    return output.getvalue()
+
+
+def _render_to_file(process, plot_id, thumbnail, datafile_name, destination, language, marker_key=None):
+    """Generates a plot and writes it atomically to ``destination``.  This is
+    the task executed by the worker processes.  The in-flight marker is removed
+    in any case, so that a failed render can be retried.
+
+    :param process: the process the plot belongs to
+    :param plot_id: the plot_id of the image
+    :param thumbnail: whether we generate a thumbnail instead of a PDF plot
+    :param datafile_name: the name(s) of the data file(s)
+    :param destination: the absolute path of the plot file
+    :param language: the language code to use for labels in the plot
+    :param marker_key: cache key of the in-flight marker of this render
+
+    :type process: `samples.models.PhysicalProcess`
+    :type plot_id: unicode
+    :type thumbnail: bool
+    :type datafile_name: unicode or list of unicode
+    :type destination: str
+    :type language: str
+    :type marker_key: str or NoneType
+    """
+    try:
+        with translation.override(language):
+            content = generate_plot(process, plot_id, thumbnail, datafile_name)
+        temporary_path = "{0}.{1}.tmp".format(destination, uuid.uuid4().hex)
+        mkdirs(destination)
+        try:
+            with open(temporary_path, "wb") as outfile:
+                outfile.write(content)
+            os.rename(temporary_path, destination)
+        except:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+    finally:
+        if marker_key:
+            cache.delete(marker_key)
+
+
+def _get_destination_and_source_files(process, plot_id, thumbnail):
+    """Returns the paths of the plot file and the data files of a plot.
+
+    :param process: the process the plot belongs to
+    :param plot_id: the plot_id of the image
+    :param thumbnail: whether we want the thumbnail instead of the PDF plot
+
+    :type process: `samples.models.PhysicalProcess`
+    :type plot_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      the absolute path to the plot file, the data file name(s) as returned by
+      :py:meth:`samples.models.PhysicalProcess.get_datafile_name`, and the
+      list of the data file names; the latter two are ``None`` if the process
+      has no such plot
+
+    :rtype: str, unicode or list of unicode or NoneType, list of unicode or
+      NoneType
+    """
+    plot_filepath = process.calculate_plot_locations(plot_id)["thumbnail_file" if thumbnail else "plot_file"]
+    destination = os.path.join(settings.CACHE_ROOT, plot_filepath)
+    try:
+        datafile_name = process.get_datafile_name(plot_id)
+    except NotImplementedError:
+        datafile_name = None
+    if datafile_name is None:
+        return destination, None, None
+    return destination, datafile_name, datafile_name if isinstance(datafile_name, list) else [datafile_name]
+
+
+def render_plot(process, plot_id, thumbnail, timestamps, timeout):
+    """Makes sure that the plot file of a process is up-to-date.  If it is not,
+    it is rendered in the pool, and this function waits for at most
+    ``timeout`` seconds for the render to finish.  If another request is
+    already rendering it, this function waits for that render instead.
+
+    :param process: the process the plot belongs to
+    :param plot_id: the plot_id of the image.  This is mostly ``""`` because
+        most measurement models have only one graphics.
+    :param thumbnail: whether we want the thumbnail instead of the PDF plot
+    :param timestamps: timestamps of the database objects the plot depends on
+    :param timeout: maximal number of seconds to wait for the render
+
+    :type process: `samples.models.PhysicalProcess`
+    :type plot_id: unicode
+    :type thumbnail: bool
+    :type timestamps: list of datetime.datetime
+    :type timeout: float
+
+    :return:
+      the absolute path to the plot file if it is up-to-date, or ``None`` if
+      it is still being rendered
+
+    :rtype: str or NoneType
+
+    :raises samples.utils.plots.PlotError: if the plot could not be generated
+    :raises ValueError: if the data file contains invalid data
+    :raises OSError: if one of the data files is not found
+    """
+    destination, datafile_name, datafile_names = _get_destination_and_source_files(process, plot_id, thumbnail)
+    if not is_update_necessary(destination, datafile_names, timestamps):
+        return destination
+    if settings.PLOT_RENDERING_PROCESSES == 0:
+        _render_to_file(process, plot_id, thumbnail, datafile_name, destination, translation.get_language())
+        return destination
+    marker_key = "plot-rendering:" + destination
+    if cache.add(marker_key, True, rendering_lease):
+        result = get_pool().apply_async(_render_to_file, (process, plot_id, thumbnail, datafile_name, destination,
+                                                          translation.get_language(), marker_key))
+        try:
+            result.get(timeout)
+        except multiprocessing.TimeoutError:
+            return None
+    else:
+        deadline = time.time() + timeout
+        while cache.get(marker_key) is not None:
+            if time.time() > deadline:
+                return None
+            time.sleep(0.1)
+        if is_update_necessary(destination, datafile_names, timestamps):
+            return None
+    return destination
+
+
+def _submit_thumbnail(process):
+    """Starts rendering the thumbnail of a process in the pool without waiting
+    for it.  Nothing happens if the thumbnail is up-to-date or already in
+    flight.  Any error is silently ignored; it will show up when the thumbnail
+    is requested.
+
+    :param process: the process whose thumbnail should be rendered
+
+    :type process: `samples.models.PhysicalProcess`
+    """
+    destination, datafile_name, datafile_names = _get_destination_and_source_files(process, "", thumbnail=True)
+    try:
+        if datafile_name is None or not is_update_necessary(destination, datafile_names, [process.last_modified]):
+            return
+    except OSError:
+        return
+    marker_key = "plot-rendering:" + destination
+    if cache.add(marker_key, True, rendering_lease):
+        get_pool().apply_async(_render_to_file, (process, "", True, datafile_name, destination,
+                                                 translation.get_language(), marker_key))
+
+
+def has_plots(process_class):
+    """Returns whether the given process class offers plots at all, i.e.
+    whether it overrides ``get_datafile_name``.
+
+    :param process_class: the process class
+
+    :type process_class: class (decendant of `samples.models.Process`)
+
+    :return:
+      whether processes of this class may have plots
+
+    :rtype: bool
+    """
+    # Local import because the models may use this module some day.
+    import samples.models
+    return six.get_unbound_function(process_class.get_datafile_name) is not \
+        six.get_unbound_function(samples.models.Process.get_datafile_name)
+
+
+def schedule_thumbnail(process):
+    """Pre-renders the default thumbnail of a process in the background.  This
+    is called after a process was saved, so that the thumbnail is ready when the
+    sample data sheet is visited.  The worker processes read from the database
+    with their own connections.  Therefore, if we are within a transaction, the
+    render is deferred until the end of the request, i.e. after the commit (see
+    `submit_scheduled_thumbnails`).
+
+    :param process: the process whose thumbnail should be rendered
+
+    :type process: `samples.models.PhysicalProcess`
+    """
+    if settings.PLOT_RENDERING_PROCESSES == 0 or not has_plots(type(process)):
+        return
+    if transaction.get_connection().in_atomic_block:
+        if not hasattr(_scheduled_renders, "processes"):
+            _scheduled_renders.processes = {}
+        _scheduled_renders.processes[process.pk] = process
+    else:
+        _submit_thumbnail(process)
+
+
+def submit_scheduled_thumbnails():
+    """Submits all renders scheduled by `schedule_thumbnail` in the current
+    thread to the pool.
+    """
+    processes = getattr(_scheduled_renders, "processes", {})
+    _scheduled_renders.processes = {}
+    for process in processes.values():
+        _submit_thumbnail(process)
+
+
+def discard_scheduled_thumbnails():
+    """Discards all renders scheduled by `schedule_thumbnail` in the current
+    thread, e.g. because the transaction was rolled back.
+    """
+    _scheduled_renders.processes = {}
+
+
+def get_placeholder():
+    """Returns the placeholder image which is served instead of a thumbnail
+    which is still being rendered.  It is generated on first use for every
+    language.
+
+    :return:
+      the content of the PNG placeholder image
+
+    :rtype: bytes
+    """
+    language = translation.get_language()
+    if language not in _placeholders:
+        output = six.BytesIO()
+        figure = Figure(frameon=False, figsize=(4, 3))
+        canvas = FigureCanvasAgg(figure)
+        figure.text(0.5, 0.5, ugettext("The plot is being generated …"), color="gray",
+                    horizontalalignment="center", verticalalignment="center")
+        canvas.print_figure(output, dpi=settings.THUMBNAIL_WIDTH / 4, format="png")
+        _placeholders[language] = output.getvalue()
+    return _placeholders[language]
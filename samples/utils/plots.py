@@ -20,7 +20,11 @@
 
 from __future__ import absolute_import, unicode_literals, division
 
-import codecs
+import os, codecs, glob, hashlib, uuid
+import numpy
+from django.conf import settings
+import django.utils.six as six
+from jb_common.utils.base import mkdirs
 
 
 class PlotError(Exception):
@@ -31,6 +35,165 @@ class PlotError(Exception):
     pass
 
 
+def _sidecar_path(filename, parser, args):
+    """Returns the path to the sidecar file of parsed data.
+
+    :param filename: full path to the data file
+    :param parser: the function that parses the data file
+    :param args: further arguments of ``parser``
+
+    :type filename: str
+    :type parser: callable
+    :type args: tuple
+
+    :return:
+      the absolute path to the sidecar file, and the glob pattern matching all
+      sidecar files of this data file and parser (i.e. also outdated ones)
+
+    :rtype: str, str
+
+    :raises OSError: if the data file doesn't exist
+    """
+    mtime = os.path.getmtime(filename)
+    key = repr((filename, parser.__module__, parser.__name__, args))
+    key_hash = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    directory = os.path.join(settings.CACHE_ROOT, "plot_data", key_hash[:2])
+    return os.path.join(directory, "{0}-{1!r}.npy".format(key_hash, mtime)), os.path.join(directory, key_hash + "-*.npy")
+
+
+def get_cached_columns(filename, parser, *args):
+    """Returns the columns of a data file, parsed by ``parser``.  The parsed
+    columns are stored in a ``.npy`` sidecar file below ``CACHE_ROOT``, whose
+    name contains the modification time of the data file.  Thus, repeated
+    renders of plots of the same data file skip the parsing.  The returned
+    arrays are copies, so the caller may modify them.
+
+    :param filename: full path to the data file
+    :param parser: module-level function which is called with ``filename`` and
+        ``args`` and returns the columns as a two-dimensional array (or a list
+        of one-dimensional arrays of equal length)
+    :param args: further arguments of ``parser``; they must have a stable
+        ``repr``
+
+    :type filename: str
+    :type parser: callable
+    :type args: tuple
+
+    :return:
+      List of all columns.
+
+    :rtype: list of ``numpy.ndarray``
+
+    :raises PlotError: if the data file could not be read or parsed
+    """
+    try:
+        path, pattern = _sidecar_path(filename, parser, args)
+    except OSError:
+        raise PlotError("datafile could not be opened")
+    try:
+        return list(numpy.load(path))
+    except (IOError, OSError, ValueError):
+        pass
+    columns = numpy.asarray(parser(filename, *args), dtype=float)
+    temporary_path = "{0}.{1}.tmp".format(path, uuid.uuid4().hex)
+    try:
+        mkdirs(path)
+        with open(temporary_path, "wb") as outfile:
+            numpy.save(outfile, columns)
+        os.rename(temporary_path, path)
+        for outdated_path in glob.glob(pattern):
+            if outdated_path != path:
+                os.unlink(outdated_path)
+    except (IOError, OSError):
+        try:
+            os.unlink(temporary_path)
+        except OSError:
+            pass
+    return list(columns)
+
+
+def parse_columns(lines, columns, separator=None, comments=None):
+    """Parses selected columns of lines of numbers in bulk.  Decimal commas are
+    converted to decimal points, and cells which are not numbers become NaN.
+    Empty lines are skipped.
+
+    :param lines: the lines of the data file containing the data
+    :param columns: the columns that should be read
+    :param separator: the separator which separates the values from each
+        other; ``None`` means whitespace
+    :param comments: the character that starts a comment, or ``None``
+
+    :type lines: list of unicode
+    :type columns: list of int
+    :type separator: str or None
+    :type comments: str or None
+
+    :return:
+      two-dimensional array containing the columns
+
+    :rtype: ``numpy.ndarray``
+
+    :raises PlotError: if the data contains too few columns
+    """
+    content = "\n".join(lines)
+    if separator != ",":
+        content = content.replace(",", ".")
+    try:
+        data = numpy.genfromtxt(six.BytesIO(content.encode("ascii", "replace")), delimiter=separator,
+                                usecols=columns, comments=comments, dtype=float)
+    except (ValueError, IndexError):
+        raise PlotError("datafile contained too few columns")
+    return data.reshape(-1, len(columns)).T
+
+
+def _read_lines(filename):
+    """Reads a data file in the encoding of the measurement PCs.
+
+    :param filename: full path to the data file
+
+    :type filename: str
+
+    :return:
+      the lines of the file, without line endings
+
+    :rtype: list of unicode
+
+    :raises PlotError: if the data file could not be read
+    """
+    try:
+        with codecs.open(filename, encoding="cp1252") as datafile:
+            return datafile.read().splitlines()
+    except IOError:
+        raise PlotError("datafile could not be opened")
+
+
+def _parse_beginning_at_line_number(filename, columns, start_line_number, end_line_number, separator):
+    """Parser for `read_plot_file_beginning_at_line_number`, to be used with
+    `get_cached_columns`.  See there for the parameters.
+    """
+    lines = _read_lines(filename)[start_line_number - 1:end_line_number]
+    return parse_columns(lines, columns, separator)
+
+
+def _parse_beginning_after_start_value(filename, columns, start_value, end_value, separator):
+    """Parser for `read_plot_file_beginning_after_start_value`, to be used
+    with `get_cached_columns`.  See there for the parameters.
+    """
+    lines = _read_lines(filename)
+    for i, line in enumerate(lines):
+        if line.lower().startswith(start_value.lower()):
+            lines = lines[i + 1:]
+            break
+    else:
+        lines = []
+    if end_value:
+        for i, line in enumerate(lines):
+            if line.lower().startswith(end_value):
+                lines = lines[:i]
+                break
+    return parse_columns(lines, columns, separator)
+
+
 def read_plot_file_beginning_at_line_number(filename, columns, start_line_number, end_line_number=None, separator=None):
     """Read a datafile and returns the content of selected columns beginning at
     start_line_number.  You shouldn't use this function directly. Use the
@@ -51,39 +214,16 @@ def read_plot_file_beginning_at_line_number(filename, columns, start_line_number
     :type separator: str or None
 
     :return:
-      List of all columns.  Every column is represented as a list of floating
+      List of all columns.  Every column is represented as an array of floating
       point values.
 
-    :rtype: list of list of float
+    :rtype: list of ``numpy.ndarray``
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
         unparseble data)
     """
-    start_values = False
-    try:
-        datafile = codecs.open(filename, encoding="cp1252")
-    except IOError:
-        raise PlotError("datafile could not be opened")
-    result = [[] for i in range(len(columns))]
-    for line_number, line in enumerate(datafile, start=1):
-        if start_values:
-            if end_line_number and line_number > end_line_number:
-                break
-            if not line.strip():
-                continue
-            cells = line.strip().split(separator)
-            for column, result_array in zip(columns, result):
-                try:
-                    value = float(cells[column].replace(",", "."))
-                except IndexError:
-                    raise PlotError("datafile contained too few columns")
-                except ValueError:
-                    value = float("nan")
-                result_array.append(value)
-        elif line_number == start_line_number - 1:
-            start_values = True
-    datafile.close()
-    return result
+    return get_cached_columns(filename, _parse_beginning_at_line_number, tuple(columns), start_line_number,
+                              end_line_number, separator)
 
 
 def read_plot_file_beginning_after_start_value(filename, columns, start_value, end_value="", separator=None):
@@ -107,36 +247,47 @@ def read_plot_file_beginning_after_start_value(filename, columns, start_value, e
     :type separator: str or None
 
     :return:
-      List of all columns.  Every column is represented as a list of floating
+      List of all columns.  Every column is represented as an array of floating
       point values.
 
-    :rtype: list of list of float
+    :rtype: list of ``numpy.ndarray``
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
         unparseble data)
     """
-    start_values = False
-    try:
-        datafile = codecs.open(filename, encoding="cp1252")
-    except IOError:
-        raise PlotError("datafile could not be opened")
-    result = [[] for i in range(len(columns))]
-    for line in datafile:
-        if start_values:
-            if end_value and line.lower().startswith(end_value):
-                break
-            if not line.strip():
-                continue
-            cells = line.strip().split(separator)
-            for column, result_array in zip(columns, result):
-                try:
-                    value = float(cells[column].replace(",", "."))
-                except IndexError:
-                    raise PlotError("datafile contained too few columns")
-                except ValueError:
-                    value = float("nan")
-                result_array.append(value)
-        elif line.lower().startswith(start_value.lower()):
-            start_values = True
-    datafile.close()
-    return result
+    return get_cached_columns(filename, _parse_beginning_after_start_value, tuple(columns), start_value, end_value,
+                              separator)
+
+
+def _parse_with_comments(filename, columns, comments, separator):
+    """Parser for `read_plot_file`, to be used with `get_cached_columns`.  See
+    there for the parameters.
+    """
+    return parse_columns(_read_lines(filename), columns, separator, comments)
+
+
+def read_plot_file(filename, columns, comments="#", separator=None):
+    """Read a datafile and return the content of selected columns.  Lines
+    starting with ``comments`` are ignored.
+
+    :param filename: full path to the data file
+    :param columns: the columns that should be read.
+    :param comments: the character that starts a comment
+    :param separator: the separator which separates the values from each
+        other.  Default is ``None``
+
+    :type filename: str
+    :type columns: list of int
+    :type comments: str
+    :type separator: str or None
+
+    :return:
+      List of all columns.  Every column is represented as an array of floating
+      point values.
+
+    :rtype: list of ``numpy.ndarray``
+
+    :raises PlotError: if something wents wrong with interpreting the file (I/O,
+        unparseble data)
+    """
+    return get_cached_columns(filename, _parse_with_comments, tuple(columns), comments, separator)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Generation of thumbnails for result images and other graphics.  PNG and
+JPEG images are scaled in-process with Pillow.  PDFs are rasterised by a
+Ghostscript subprocess, one per PDF.  By default, it is started by the current
+process.  If ``PLOT_RENDERING_PROCESSES`` is not ``0``, the worker pool of
+:py:mod:`samples.utils.plot_rendering` starts it instead, so that the web
+server process doesn't have to spawn it.
+
+Thumbnails of result images are stored as files below ``CACHE_ROOT``, at the
+relative path ``get_image_locations()["thumbnail_file"]``.
+"""
+
+from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
+
+import os, uuid, subprocess
+import PIL.Image
+from django.conf import settings
+import jb_common.utils.blobs
+from jb_common.utils.base import is_update_necessary, mkdirs
+from samples.utils import plot_rendering
+
+
+def _rasterize_pdf(content, resolution):
+    """Rasterises the first page of a PDF with Ghostscript.  This is executed
+    in a worker process of the pool, if there is one.
+
+    :param content: the PDF
+    :param resolution: the resolution in dpi
+
+    :type content: bytes
+    :type resolution: float
+
+    :return:
+      the PNG image
+
+    :rtype: bytes
+
+    :raises subprocess.CalledProcessError: if Ghostscript failed
+    """
+    process = subprocess.Popen(["gs", "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pngalpha", "-r{0}".format(resolution),
+                                "-dEPSCrop", "-dFirstPage=1", "-dLastPage=1", "-sOutputFile=-", "-"],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output = process.communicate(content)[0]
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, "gs")
+    return output
+
+
+def rasterize_pdf(content, resolution):
+    """Rasterises the first page of a PDF.  If there is a pool of worker
+    processes (see :py:func:`samples.utils.plot_rendering.get_pool`), this is
+    done there.  In any case, the current thread blocks until it is done.
+
+    :param content: the PDF
+    :param resolution: the resolution in dpi
+
+    :type content: bytes
+    :type resolution: float
+
+    :return:
+      the PNG image
+
+    :rtype: bytes
+
+    :raises subprocess.CalledProcessError: if Ghostscript failed
+    """
+    pool = plot_rendering.get_pool()
+    return pool.apply(_rasterize_pdf, (content, resolution)) if pool else _rasterize_pdf(content, resolution)
+
+
+def scale_image(content, width, image_format):
+    """Scales a bitmap image down so that it fits into a square of the given
+    width.  Images which are smaller already are not enlarged.
+
+    :param content: the PNG or JPEG image
+    :param width: the maximal width and height of the result in pixels
+    :param image_format: the format of the result; ``"png"`` or ``"jpeg"``
+
+    :type content: bytes
+    :type width: int
+    :type image_format: str
+
+    :return:
+      the scaled image
+
+    :rtype: bytes
+
+    :raises IOError: if the image could not be read
+    """
+    image = PIL.Image.open(six.BytesIO(content))
+    if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail((width, width), PIL.Image.ANTIALIAS)
+    output = six.BytesIO()
+    image.save(output, image_format)
+    return output.getvalue()
+
+
+def _write_atomically(path, content):
+    temporary_path = "{0}.{1}.tmp".format(path, uuid.uuid4().hex)
+    mkdirs(path)
+    with open(temporary_path, "wb") as outfile:
+        outfile.write(content)
+    os.rename(temporary_path, path)
+
+
+def generate_result_thumbnail(result):
+    """Generates the thumbnail of the image of a result and stores it below
+    ``CACHE_ROOT``.  The first page of PDFs is rasterised with twice the needed
+    resolution (for A4 pages) and then scaled down with Pillow for better
+    quality.
+
+    :param result: the result process; it must have an image
+
+    :type result: `samples.models.Result`
+
+    :return:
+      the absolute path to the thumbnail file
+
+    :rtype: str
+
+    :raises IOError: if the image could not be read
+    :raises subprocess.CalledProcessError: if the PDF could not be rasterised
+    """
+    image_locations = result.get_image_locations()
+    image_file = jb_common.utils.blobs.storage.open(image_locations["image_file"], "r")
+    try:
+        content = image_file.read()
+    finally:
+        image_file.close()
+    if result.image_type == "pdf":
+        content = rasterize_pdf(content, 2 * settings.THUMBNAIL_WIDTH / (210 / 25.4))
+    thumbnail_format = "jpeg" if result.image_type == "jpeg" else "png"
+    thumbnail_path = os.path.join(settings.CACHE_ROOT, image_locations["thumbnail_file"])
+    _write_atomically(thumbnail_path, scale_image(content, settings.THUMBNAIL_WIDTH, thumbnail_format))
+    return thumbnail_path
+
+
+def get_result_thumbnail(result):
+    """Returns the thumbnail of the image of a result.  It is generated if it
+    doesn't exist yet or is outdated.
+
+    :param result: the result process; it must have an image
+
+    :type result: `samples.models.Result`
+
+    :return:
+      the absolute path to the thumbnail file
+
+    :rtype: str
+
+    :raises IOError: if the image could not be read
+    :raises subprocess.CalledProcessError: if the PDF could not be rasterised
+    """
+    image_locations = result.get_image_locations()
+    thumbnail_path = os.path.join(settings.CACHE_ROOT, image_locations["thumbnail_file"])
+    if is_update_necessary(thumbnail_path, [image_locations["image_file"]]):
+        generate_result_thumbnail(result)
+    return thumbnail_path
@@ -26,11 +26,10 @@ from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 from django.utils.six.moves import cStringIO as StringIO
 
-import copy, re, csv
-from django.conf import settings
+import copy, re, csv, json
 from django.core.cache import cache
 from django.db.models import Q
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.contrib.contenttypes.models import ContentType
 from django.template import defaultfilters
@@ -38,14 +37,16 @@ from jb_common import mimeparse
 from samples import models, permissions
 from samples.utils import sample_names
 from samples.views.table_export import build_column_group_list, ColumnGroupsForm, \
-    ColumnsForm, generate_table_rows, flatten_tree, OldDataForm, SwitchRowForm
+    ColumnsForm, generate_table_rows, flatten_tree, OldDataForm, SwitchRowForm, \
+    build_column_group_list_from_row_trees, generate_table_rows_lazily
 import jb_common.utils.base
 
 
 __all__ = ("AmbiguityException", "lookup_sample", "convert_id_to_int",
            "successful_response", "remove_samples_from_my_samples", "StructuredSeries", "StructuredTopic",
            "build_structured_sample_list", "extract_preset_sample", "digest_process", "restricted_samples_query",
-           "enforce_clearance", "UnicodeWriter", "table_export", "median", "average")
+           "enforce_clearance", "UnicodeWriter", "table_export", "streaming_table_export", "median",
+           "average")
 
 
 class AmbiguityException(Exception):
@@ -422,16 +423,15 @@ def digest_process(process, user, local_context={}):
     """
     process = process.actual_instance
     cache_key = process.get_cache_key(user.jb_user_details.get_data_hash(), local_context)
+    if cache_key:
+        # The generation makes all cached contexts of the process stale as soon
+        # as the process is saved.
+        cache_key += "-{0}".format(jb_common.utils.base.get_cache_generation("process-generation:{0}".format(process.id)))
     cached_context = jb_common.utils.base.get_from_cache(cache_key) if cache_key else None
     if cached_context is None:
         process_context = process.get_context_for_user(user, local_context)
         if cache_key:
-            keys_list_key = "process-keys:{0}".format(process.id)
-            with jb_common.utils.base.cache_key_locked("process-lock:{0}".format(process.id)):
-                keys = cache.get(keys_list_key, [])
-                keys.append(cache_key)
-                cache.set(keys_list_key, keys, settings.CACHES["default"].get("TIMEOUT", 300) + 10)
-                cache.set(cache_key, process_context)
+            cache.set(cache_key, process_context)
     else:
         cached_context.update(local_context)
         process_context = process.get_context_for_user(user, cached_context)
@@ -457,9 +457,8 @@ def restricted_samples_query(user):
     """
     if user.is_superuser:
         return models.Sample.objects.all().order_by("name")
-    return models.Sample.objects.filter(Q(topic__confidential=False) | Q(topic__members=user) |
-                                        Q(currently_responsible_person=user) | Q(clearances__user=user) |
-                                        Q(topic__isnull=True)).order_by("name").distinct()
+    visible_sample_ids = models.SampleVisibility.objects.filter(Q(user=user) | Q(user__isnull=True)).values("sample")
+    return models.Sample.objects.filter(id__in=visible_sample_ids).order_by("name")
 
 
 def enforce_clearance(user, clearance_processes, destination_user, sample, clearance=None, cutoff_timestamp=None):
@@ -490,8 +489,7 @@ def enforce_clearance(user, clearance_processes, destination_user, sample, clear
         clearance, __ = models.Clearance.objects.get_or_create(user=destination_user, sample=sample)
     base_query = sample.processes.filter(finished=True)
     processes = base_query if not cutoff_timestamp else base_query.filter(timestamp__lte=cutoff_timestamp)
-    for process in processes:
-        process = process.actual_instance
+    for process in processes.resolve_actual_instances():
         if isinstance(process, models.Result) and permissions.has_permission_to_view_result_process(user, process):
             clearance.processes.add(process)
         elif isinstance(process, models.PhysicalProcess) and \
@@ -658,6 +656,84 @@ def table_export(request, data, label_column_heading):
     return (column_groups_form, columns_form, table, switch_row_forms, old_data_form)
 
 
+def streaming_table_export(request, row_trees, name, label_column_heading):
+    """Variant of `table_export` for very large exports.  Neither the data tree
+    nor the table is ever completely in memory.  Instead, the row trees are
+    created twice on the fly: First, for finding the columns, and secondly,
+    for generating the rows, which are sent to the client immediately.
+
+    In contrast to `table_export`, there is no preview and no selection of
+    rows.  All columns are exported, unless the query string contains one or
+    more ``columns`` parameters with the indices of the columns to be exported
+    (the same indices as used by `table_export`).
+
+    The response is CSV, or JSON Lines (one JSON object per row, like the
+    objects in the JSON output of ``table_export``) if
+    ``application/x-ndjson`` is requested by the ``Accept`` header field in the
+    HTTP request.
+
+    :param request: the current HTTP Request object
+    :param row_trees: callable without parameters which returns a new iterable
+        over the row trees (i.e., the children of the root node in
+        `table_export`) every time it is called.  It is called twice.
+    :param name: the name of the exported object, for the filename
+    :param label_column_heading: Description of the very first column with the
+        table row headings, see `generate_table_rows`.
+
+    :type request: HttpRequest
+    :type row_trees: callable returning iterable of `samples.data_tree.DataNode`
+    :type name: unicode
+    :type label_column_heading: unicode
+
+    :return:
+      the streaming HTTP response object
+
+    :rtype: StreamingHttpResponse
+    """
+    requested_mime_type = mimeparse.best_match(["text/csv", "application/x-ndjson"],
+                                               request.META.get("HTTP_ACCEPT", "text/csv"))
+    descriptive_names = set()
+    def prepare_row_trees():
+        for row_tree in row_trees():
+            row_tree.find_unambiguous_names(0)
+            descriptive_names.add(row_tree.descriptive_name)
+            yield row_tree
+    column_groups, columns = build_column_group_list_from_row_trees(prepare_row_trees())
+    try:
+        selected_key_indices = sorted({int(i) for i in request.GET.getlist("columns")})
+    except ValueError:
+        raise Http404("Invalid number in column indices list")
+    if any(i < 0 or i >= len(columns) for i in selected_key_indices):
+        raise Http404("Invalid column index")
+    selected_key_indices = selected_key_indices or list(range(len(columns)))
+    rows = generate_table_rows_lazily(row_trees(), columns, selected_key_indices, any(descriptive_names),
+                                      label_column_heading)
+    if requested_mime_type == "application/x-ndjson":
+        def generate_json_lines():
+            head_row = [six.text_type(heading) for heading in next(rows)]
+            for row in rows:
+                yield json.dumps(dict((head_row[i], cell) for i, cell in enumerate(row) if cell),
+                                 cls=jb_common.utils.base.JSONEncoder) + "\n"
+        response = StreamingHttpResponse(generate_json_lines(), content_type="application/x-ndjson")
+    else:
+        def generate_csv_lines():
+            if six.PY2:
+                writer = UnicodeWriter()
+                buffer_ = writer.stream
+            else:
+                buffer_ = six.StringIO()
+                writer = csv.writer(buffer_, dialect=csv.excel_tab)
+            for row in rows:
+                writer.writerow(row)
+                yield buffer_.getvalue()
+                buffer_.seek(0)
+                buffer_.truncate()
+        response = StreamingHttpResponse(generate_csv_lines(), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = \
+            "attachment; filename=juliabase--{0}.txt".format(defaultfilters.slugify(name))
+    return response
+
+
 def median(numeric_values):
     """Calculates the median from a list of numeric values.
 
@@ -25,12 +25,37 @@ the database was changed in one way or another.
 from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 
+import json
 from django.contrib.contenttypes.models import ContentType
+from django.template import Context, loader
+from django.utils import translation
+import django.utils.timezone
 import jb_common.models
+from jb_common.utils.base import camel_case_to_underscores
 from samples import models, permissions
 
 
-__all__ = ("Reporter",)
+__all__ = ("Reporter", "render_entry")
+
+
+def render_entry(entry, user):
+    """Renders a feed entry for a user in the currently active language.
+
+    :param entry: the feed entry, as its actual instance
+    :param user: the user who receives the entry
+
+    :type entry: `samples.models.FeedEntry`
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the title and the HTML content of the entry
+
+    :rtype: unicode, unicode
+    """
+    template = loader.get_template("samples/" + camel_case_to_underscores(entry.__class__.__name__) + ".html")
+    context_dict = {"entry": entry}
+    context_dict.update(entry.get_additional_template_context(user))
+    return six.text_type(entry.get_metadata()["title"]), template.render(Context(context_dict))
 
 
 class Reporter(object):
@@ -113,10 +138,49 @@ class Reporter(object):
         self.interested_users.discard(self.originator)
         if self.interested_users:
             entry.users = self.interested_users
+            self.__render(entry)
+            models.UserDetails.objects.filter(user__in=self.interested_users). \
+                update(feed_timestamp=django.utils.timezone.now())
         else:
             entry.delete()
         self.interested_users = set()
 
+    def __render(self, entry):
+        """Renders the feed entry for all interested users and stores the result
+        in the entry, so that fetching the feed doesn't need to render
+        anything.  Users with the same language and the same user-specific
+        template context share one rendering.
+
+        :param entry: the feed entry that should be rendered
+
+        :type entry: `samples.models.FeedEntry`
+        """
+        metadata = entry.get_metadata()
+        variants, variant_indices, users = [], {}, {}
+        renderings = {}
+        for user in self.interested_users:
+            try:
+                language = user.jb_user_details.language
+            except jb_common.models.UserDetails.DoesNotExist:
+                language = None
+            try:
+                key = (language, frozenset(entry.get_additional_template_context(user).items()))
+            except TypeError:
+                key = None
+            rendering = renderings.get(key) if key else None
+            if rendering is None:
+                with translation.override(language):
+                    rendering = render_entry(entry, user) + (six.text_type(entry.get_metadata()["category label"]),)
+                if key:
+                    renderings[key] = rendering
+            if rendering not in variant_indices:
+                variant_indices[rendering] = len(variants)
+                variants.append({"title": rendering[0], "content": rendering[1], "category label": rendering[2]})
+            users[str(user.id)] = variant_indices[rendering]
+        entry.rendered = json.dumps({"category term": metadata["category term"], "link": metadata.get("link"),
+                                     "variants": variants, "users": users})
+        models.FeedEntry.objects.filter(pk=entry.pk).update(rendered=entry.rendered)
+
     def __add_interested_users(self, samples, important=True):
         """Add users interested in news about the given samples.  These are
         all users that have one of ``samples`` on their “My Samples” list,
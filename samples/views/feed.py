@@ -23,17 +23,16 @@
 
 from __future__ import absolute_import, unicode_literals
 
-import datetime, time
+import datetime, time, json, hashlib
 import xml.etree.ElementTree as ElementTree
 import django.contrib.auth.models
-from django.template import Context, loader
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _, ugettext
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 from django.conf import settings
 import django.core.urlresolvers
-from jb_common.utils.base import get_really_full_name, camel_case_to_underscores
+from jb_common.utils.base import get_really_full_name, int_or_zero
 from jb_common import __version__
 from samples import permissions, models
 import samples.utils.views as utils
@@ -123,9 +122,62 @@ def format_timestamp(timestamp):
     return timestamp.strftime("%Y-%m-%dT%H:%M:%S") + get_timezone_string(timestamp)
 
 
-@cache_page(600)
+feed_page_size = 50
+"""Maximal number of entries in one page of the feed.  Older entries are
+available through the ``next`` link of the page (:RFC:`5005`).
+"""
+
+
+def _get_feed_user(request, username, user_hash):
+    """Returns the user whose feed is requested, with their
+    ``samples_user_details`` already fetched.  The user is looked up only once
+    per request, because the ETag and the ``Last-Modified`` functions of the
+    conditional request need it, too.
+
+    :param request: the current HTTP Request object
+    :param username: the login name of the user
+    :param user_hash: the secret user hash given in the URL
+
+    :type request: HttpRequest
+    :type username: str
+    :type user_hash: str
+
+    :return:
+      the user whose feed is requested
+
+    :rtype: django.contrib.auth.models.User
+
+    :raises Http404: if the user doesn't exist
+    :raises PermissionError: if the hash is wrong
+    """
+    try:
+        return request._feed_user
+    except AttributeError:
+        user = get_object_or_404(django.contrib.auth.models.User.objects.select_related("samples_user_details"),
+                                 username=username)
+        permissions.assert_can_view_feed(user_hash, user)
+        request._feed_user = user
+        return user
+
+
+def _feed_last_modified(request, username, user_hash):
+    return _get_feed_user(request, username, user_hash).samples_user_details.feed_timestamp
+
+
+def _feed_etag(request, username, user_hash):
+    """Returns the ETag of the feed page.  ``Last-Modified`` has a resolution of
+    one second only, so an entry added in the same second as the last poll
+    would be missed without it.  Therefore, the ETag contains the feed
+    timestamp with its full precision.
+    """
+    feed_timestamp = _get_feed_user(request, username, user_hash).samples_user_details.feed_timestamp
+    return hashlib.sha1("{0}-{1}".format(feed_timestamp.isoformat(), request.GET.get("before", "")).encode()). \
+        hexdigest()
+
+
+@condition(etag_func=_feed_etag, last_modified_func=_feed_last_modified)
 def show(request, username, user_hash):
-    """View which doesn't generate an HTML page but an Atom 1.0 feed with
+    """View which doesn't generate an HTML page but an Atom 1.0 feed with
     current news for the user.
 
     The problem we have to deal with here is that the feed-reading program
@@ -135,6 +187,11 @@ def show(request, username, user_hash):
     to the URL in the query string.  This should be enough security for this
     purpose.
 
+    The feed is paginated with at most `feed_page_size` entries per page.  The
+    query string parameter ``before`` contains the ID of the last entry of
+    the previous page.  If the feed hasn't changed since the last poll, ``304
+    Not Modified`` is returned.
+
     :param request: the current HTTP Request object
     :param username: the login name of the user for which the news should be
         delivered
@@ -150,16 +207,23 @@ def show(request, username, user_hash):
 
     :rtype: HttpResponse
     """
-    user = get_object_or_404(django.contrib.auth.models.User, username=username)
-    permissions.assert_can_view_feed(user_hash, user)
+    user = _get_feed_user(request, username, user_hash)
     feed_absolute_url = request.build_absolute_uri(django.core.urlresolvers.reverse(
         "samples:show_feed", kwargs={"username": username, "user_hash": user_hash}))
+    entries = user.feed_entries.select_related("originator").order_by("-id")
+    if user.samples_user_details.only_important_news:
+        entries = entries.filter(important=True)
+    before = int_or_zero(request.GET.get("before"))
+    if before:
+        entries = entries.filter(id__lt=before)
+    entries = list(entries[:feed_page_size + 1])
+    next_page_entry = entries[feed_page_size - 1] if len(entries) > feed_page_size else None
+    entries = entries[:feed_page_size]
     feed = ElementTree.Element("feed", xmlns="http://www.w3.org/2005/Atom")
     feed.attrib["xml:base"] = request.build_absolute_uri("/")
     ElementTree.SubElement(feed, "id").text = feed_absolute_url
     ElementTree.SubElement(feed, "title").text = \
         _("JuliaBase news for {user_name}").format(user_name=get_really_full_name(user))
-    entries = [entry.actual_instance for entry in user.feed_entries.all()]
     if entries:
         ElementTree.SubElement(feed, "updated").text = format_timestamp(entries[0].timestamp)
     else:
@@ -167,26 +231,39 @@ def show(request, username, user_hash):
     author = ElementTree.SubElement(feed, "author")
     if settings.ADMINS:
         ElementTree.SubElement(author, "name").text, ElementTree.SubElement(author, "email").text = settings.ADMINS[0]
-    ElementTree.SubElement(feed, "link", rel="self", href=feed_absolute_url)
+    ElementTree.SubElement(feed, "link", rel="self",
+                           href=feed_absolute_url + ("?before={0}".format(before) if before else ""))
+    if before:
+        ElementTree.SubElement(feed, "link", rel="first", href=feed_absolute_url)
+    if next_page_entry:
+        ElementTree.SubElement(feed, "link", rel="next", href=feed_absolute_url + "?before={0}".format(next_page_entry.id))
     ElementTree.SubElement(feed, "generator", version=__version__).text = "JuliaBase"
     ElementTree.SubElement(feed, "icon").text = request.build_absolute_uri("/static/juliabase/juliabase_logo.png")
-    only_important = user.samples_user_details.only_important_news
     for entry in entries:
-        if only_important and not entry.important:
-            continue
-        if isinstance(entry, (models.FeedNewSamples, models.FeedMovedSamples, models.FeedCopiedMySamples,
-                              models.FeedEditedSamples)):
-            # Remove orphaned entries (i.e. whose samples have been deleted)
-            # because they are a) phony and b) cause tracebacks.
-            if entry.samples.count() == 0:
-                entry.delete()
-                continue
+        if entry.rendered:
+            rendered = json.loads(entry.rendered)
+            variant = rendered["variants"][rendered["users"].get(str(user.id), 0)]
+            title, content = variant["title"], variant["content"]
+            metadata = {"category term": rendered["category term"], "category label": variant["category label"],
+                        "link": rendered["link"]}
+        else:
+            # Legacy entry which was created before entries were rendered when
+            # they were generated.
+            entry = entry.actual_instance
+            if isinstance(entry, (models.FeedNewSamples, models.FeedMovedSamples, models.FeedCopiedMySamples,
+                                  models.FeedEditedSamples)):
+                # Remove orphaned entries (i.e. whose samples have been
+                # deleted) because they are a) phony and b) cause tracebacks.
+                if entry.samples.count() == 0:
+                    entry.delete()
+                    continue
+            metadata = entry.get_metadata()
+            title, content = utils.render_entry(entry, user)
         entry_element = ElementTree.SubElement(feed, "entry")
         ElementTree.SubElement(entry_element, "id").text = \
             "tag:{0},{1}:{2}".format(request.build_absolute_uri("/").partition("//")[2][:-1],
                                      entry.timestamp.strftime("%Y-%m-%d"), entry.sha1_hash)
-        metadata = entry.get_metadata()
-        ElementTree.SubElement(entry_element, "title").text = metadata["title"]
+        ElementTree.SubElement(entry_element, "title").text = title
         ElementTree.SubElement(entry_element, "updated").text = format_timestamp(entry.timestamp)
         author = ElementTree.SubElement(entry_element, "author")
         ElementTree.SubElement(author, "name").text = get_really_full_name(entry.originator)
@@ -194,14 +271,11 @@ def show(request, username, user_hash):
             ElementTree.SubElement(author, "email").text = entry.originator.email
         category = ElementTree.SubElement(
             entry_element, "category", term=metadata["category term"], label=metadata["category label"])
-        if "link" in metadata:
+        if metadata.get("link"):
             ElementTree.SubElement(entry_element, "link", rel="alternate", href=request.build_absolute_uri(metadata["link"]))
-        template = loader.get_template("samples/" + camel_case_to_underscores(entry.__class__.__name__) + ".html")
-        content = ElementTree.SubElement(entry_element, "content")
-        context_dict = {"entry": entry}
-        context_dict.update(entry.get_additional_template_context(user))
-        content.text = template.render(Context(context_dict))
-        content.attrib["type"] = "html"
+        content_element = ElementTree.SubElement(entry_element, "content")
+        content_element.text = content
+        content_element.attrib["type"] = "html"
 #    indent(feed)
     return HttpResponse("""<?xml version="1.0"?>\n"""
                         """<?xml-stylesheet type="text/xsl" href="/static/samples/xslt/atom2html.xslt"?>\n"""
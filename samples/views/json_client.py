@@ -26,11 +26,16 @@ communication to the remote client happens in JSON format.
 
 from __future__ import absolute_import, unicode_literals
 
-import sys, json
+import sys, json, copy
+from django.db import transaction
 from django.db.utils import IntegrityError
 from django.db.models import Q
 from django.conf import settings
-from django.http import Http404
+from django.http import Http404, QueryDict
+from django.utils.datastructures import MultiValueDict
+from django.utils.six.moves import urllib
+import django.utils.six as six
+import django.core.urlresolvers
 from django.utils.translation import ugettext as _
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
@@ -41,7 +46,8 @@ import django.contrib.auth
 from django.shortcuts import get_object_or_404
 from django.contrib.contenttypes.models import ContentType
 from jb_common.models import Topic
-from jb_common.utils.base import respond_in_json, JSONRequestException, int_or_zero
+from jb_common.utils.base import respond_in_json, JSONRequestException, int_or_zero, deferred_cache_generation_bumps
+from jb_common.middleware import JSONClientMiddleware, HttpResponseUnprocessableEntity
 import samples.utils.views as utils
 from samples.utils import sample_names
 from samples import models, permissions
@@ -375,6 +381,153 @@ def change_my_samples(request):
     return respond_in_json(changed_sample_ids)
 
 
+class _BulkItemFailed(Exception):
+    """Raised in `bulk_submit` if one of the submitted requests failed.  It
+    rolls back the whole bulk submission.
+    """
+
+    def __init__(self, index, request, response):
+        super(_BulkItemFailed, self).__init__()
+        self.index, self.request, self.response = index, request, response
+
+
+def _get_error_response(request, error):
+    """Converts an exception raised by one item of a bulk submission into a
+    JSON error response.  Every exception is converted, including database
+    errors, so that the client learns which item failed.
+
+    :param request: the request of the failed item
+    :param error: the exception raised while processing the item
+
+    :type request: HttpRequest
+    :type error: Exception
+
+    :return:
+      the JSON response containing error code and error message
+
+    :rtype: HttpResponse
+    """
+    if isinstance(error, JSONRequestException):
+        return JSONClientMiddleware().process_exception(request, error)
+    elif isinstance(error, Http404):
+        error_code, error_message = 2, six.text_type(error)
+    elif isinstance(error, permissions.PermissionError):
+        error_code, error_message = 6, six.text_type(error)
+    else:
+        error_code, error_message = 5, "{0}: {1}".format(error.__class__.__name__, error)
+    return HttpResponseUnprocessableEntity(json.dumps((error_code, error_message)), content_type="application/json")
+
+
+def _make_sub_request(request, relative_url, data):
+    """Creates a POST request for one item of a bulk submission.  It is a copy
+    of the current request, with URL and POST data replaced.
+
+    :param request: the current HTTP Request object
+    :param relative_url: the URL of the view relative to the root URL of
+        JuliaBase, like the remote client uses it, possibly with a query string
+    :param data: the POST data
+
+    :type request: HttpRequest
+    :type relative_url: unicode
+    :type data: dict mapping unicode to unicode or list of unicode
+
+    :return:
+      the request, and the resolved view with its arguments
+
+    :rtype: HttpRequest, ``django.core.urlresolvers.ResolverMatch``
+
+    :raises Http404: if ``relative_url`` doesn't point to a view
+    """
+    components = urllib.parse.urlsplit(relative_url)
+    path_info = "/" + components.path.lstrip("/")
+    match = django.core.urlresolvers.resolve(path_info)
+    post_data = QueryDict("", mutable=True)
+    for key, value in data.items():
+        post_data.setlist(key, [six.text_type(item) for item in value] if isinstance(value, list) else
+                          [six.text_type(value)])
+    sub_request = copy.copy(request)
+    sub_request.path = request.path[:len(request.path) - len(request.path_info)] + path_info
+    sub_request.path_info = path_info
+    sub_request.META = dict(request.META, PATH_INFO=path_info, QUERY_STRING=components.query)
+    sub_request.GET = QueryDict(components.query)
+    sub_request.POST = post_data
+    sub_request._files = MultiValueDict()
+    sub_request.resolver_match = match
+    return sub_request, match
+
+
+@login_required
+@require_http_methods(["POST"])
+@ensure_csrf_cookie
+def bulk_submit(request):
+    """Executes many POST requests of the remote client in one go, e.g. the
+    submission of hundreds of measurements.  Every request is passed to its
+    usual view, so the data is validated with the usual forms.  All requests
+    are executed in one database transaction; if one of them fails, none of
+    them is committed.  Cache expiration is done once for the whole bulk.
+
+    :param request: The current HTTP Request object.  It must contain the
+        requests as a JSON list in ``"requests"``.  Every request is a pair of
+        the relative URL (e.g. ``"pds_measurements/add/"``) and the POST data.
+        Moreover, it may contain a comma-separated list of sample IDs in
+        ``"my_samples"``.  These samples are added to “My Samples” while the
+        requests are executed, because many views require this.
+
+    :type request: HttpRequest
+
+    :return:
+      The list of the results of the requests.  If one request failed, its
+      error is returned, with the index of the request prepended to the error
+      message.  Any exception of a request counts as a failure, e.g. a
+      `PermissionError` or an ``IntegrityError``.
+
+    :rtype: HttpResponse
+    """
+    try:
+        requests = json.loads(request.POST["requests"])
+    except KeyError:
+        raise JSONRequestException(3, '"requests" missing')
+    except ValueError:
+        raise JSONRequestException(5, '"requests" is not valid JSON')
+    if not isinstance(requests, list) or \
+       not all(isinstance(item, list) and len(item) == 2 and isinstance(item[1], dict) for item in requests):
+        raise JSONRequestException(5, '"requests" must be a list of URL/data pairs')
+    try:
+        sample_ids = {int(id_) for id_ in request.POST.get("my_samples", "").split(",") if id_}
+    except ValueError:
+        raise Http404("One or more of the sample IDs were invalid.")
+    middleware = JSONClientMiddleware()
+    results = []
+    try:
+        with transaction.atomic(), deferred_cache_generation_bumps():
+            current_my_samples = set(request.user.my_samples.values_list("id", flat=True))
+            samples_to_add = utils.restricted_samples_query(request.user).in_bulk(list(sample_ids - current_my_samples))
+            request.user.my_samples.add(*samples_to_add.values())
+            for i, (relative_url, data) in enumerate(requests):
+                sub_request = request
+                try:
+                    sub_request, match = _make_sub_request(request, relative_url, data)
+                    response = match.func(sub_request, *match.args, **match.kwargs)
+                except Exception as error:
+                    response = _get_error_response(sub_request, error)
+                if response.status_code != 200 or not response["Content-Type"].startswith("application/json"):
+                    raise _BulkItemFailed(i, sub_request, response)
+                results.append(json.loads(response.content.decode("utf-8")))
+            request.user.my_samples.remove(*samples_to_add.values())
+    except _BulkItemFailed as failure:
+        # The error page of a form error must be created outside the rolled
+        # back transaction.
+        response = middleware.process_response(failure.request, failure.response)
+        try:
+            error_code, error_message = json.loads(response.content.decode("utf-8"))
+        except ValueError:
+            error_code, error_message = 5, "HTTP status {}".format(response.status_code)
+        return HttpResponseUnprocessableEntity(
+            json.dumps((error_code, "request #{0}: {1}".format(failure.index, error_message))),
+            content_type="application/json")
+    return respond_in_json(results)
+
+
 def _is_folded(process_id, folded_process_classes, exceptional_processes, switch):
     """Helper routine to determine whether the process is folded or not. Is the switch
     parameter is ``True``, the new status is saved.
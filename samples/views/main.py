@@ -108,21 +108,20 @@ def main_menu(request):
     :rtype: HttpResponse
     """
     my_topics, topicless_samples = utils.build_structured_sample_list(request.user)
-    allowed_physical_processes = permissions.get_allowed_physical_processes(request.user)
-    lab_notebooks = permissions.get_lab_notebooks(request.user)
+    capabilities = permissions.get_main_menu_capabilities(request.user)
     return render(request, "samples/main_menu.html",
                   {"title": _("Main menu"),
                    "my_topics": my_topics,
                    "topicless_samples": topicless_samples,
                    "add_samples_url": django.core.urlresolvers.reverse(settings.ADD_SAMPLES_VIEW),
                    "user_hash": permissions.get_user_hash(request.user),
-                   "can_add_topic": permissions.has_permission_to_edit_users_topics(request.user),
-                   "can_edit_topics": permissions.can_edit_any_topics(request.user),
-                   "can_add_external_operator": permissions.has_permission_to_add_external_operator(request.user),
-                   "has_external_contacts": permissions.can_edit_any_external_contacts(request.user),
-                   "can_rename_samples": request.user.has_perm("samples.rename_samples"),
-                   "physical_processes": allowed_physical_processes,
-                   "lab_notebooks": lab_notebooks})
+                   "can_add_topic": capabilities.can_add_topic,
+                   "can_edit_topics": capabilities.can_edit_topics,
+                   "can_add_external_operator": capabilities.can_add_external_operator,
+                   "has_external_contacts": capabilities.has_external_contacts,
+                   "can_rename_samples": capabilities.can_rename_samples,
+                   "physical_processes": capabilities.allowed_physical_processes,
+                   "lab_notebooks": capabilities.lab_notebooks})
 
 
 class SearchDepositionsForm(forms.Form):
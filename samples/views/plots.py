@@ -24,53 +24,36 @@
 from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 
-import os.path, mimetypes
-from functools import partial
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-from matplotlib.figure import Figure
+import os.path
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 from django.contrib.auth.decorators import login_required
-from django.conf import settings
-from jb_common.utils.base import get_cached_file_content, static_response
+from django.utils.cache import add_never_cache_headers
+from django.utils.translation import ugettext
+from jb_common.utils.base import static_file_response, static_response
 from samples import models, permissions
 import samples.utils.views as utils
+from samples.utils import plot_rendering
 from samples.utils.plots import PlotError
 
 
-def generate_plot(process, plot_id, thumbnail, datafile_name):
-    try:
-        output = six.BytesIO()
-        if thumbnail:
-            figure = Figure(frameon=False, figsize=(4, 3))
-            canvas = FigureCanvasAgg(figure)
-            axes = figure.add_subplot(111)
-            axes.set_position((0.17, 0.16, 0.78, 0.78))
-            axes.grid(True)
-            process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=True)
-            canvas.print_figure(output, dpi=settings.THUMBNAIL_WIDTH / 4, format="png")
-        else:
-            figure = Figure()
-            canvas = FigureCanvasAgg(figure)
-            axes = figure.add_subplot(111)
-            axes.grid(True)
-            axes.set_title(six.text_type(process))
-            process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=False)
-            # FixMe: Activate this line with Matplotlib 1.1.0.
-#                figure.tight_layout()
-            canvas.print_figure(output, format="pdf")
-    except PlotError as e:
-        raise Http404(six.text_type(e) or "Plot could not be generated.")
-    except ValueError as e:
-        raise Http404("Plot could not be generated: " + e.args[0])
-    else:
-        return output.getvalue()
+thumbnail_timeout = 2
+"""Number of seconds a request waits for a thumbnail to be rendered before the
+placeholder image is served.
+"""
+
+plot_timeout = 60
+"""Number of seconds a request waits for a PDF plot to be rendered.
+"""
 
 
 @login_required
 def show_plot(request, process_id, plot_id, thumbnail):
     """Shows a particular plot.  Although its response is a bitmap rather than
     an HTML file, it is served by Django in order to enforce user permissions.
+    The plot is rendered in the background by
+    :py:mod:`samples.utils.plot_rendering`.  If this takes too long, a
+    placeholder is served with the status code 202 (Accepted).
 
     :param request: the current HTTP Request object
     :param process_id: the database ID of the process to show
@@ -91,7 +74,6 @@ def show_plot(request, process_id, plot_id, thumbnail):
     process = get_object_or_404(models.Process, pk=utils.convert_id_to_int(process_id))
     process = process.actual_instance
     permissions.assert_can_view_physical_process(request.user, process)
-    plot_filepath = process.calculate_plot_locations(plot_id)["thumbnail_file" if thumbnail else "plot_file"]
     datafile_name = process.get_datafile_name(plot_id)
     if datafile_name is None:
         raise Http404("No such plot available.")
@@ -100,7 +82,22 @@ def show_plot(request, process_id, plot_id, thumbnail):
     datafile_names = datafile_name if isinstance(datafile_name, list) else [datafile_name]
     if not all(os.path.exists(filename) for filename in datafile_names):
         raise Http404("One of the raw datafiles was not found.")
-    content = get_cached_file_content(plot_filepath, partial(generate_plot, process, plot_id, thumbnail, datafile_name),
-                                      datafile_names, timestamps)
-    return static_response(content, None if thumbnail else process.get_plotfile_basename(plot_id) + ".pdf",
-                           mimetypes.guess_type(plot_filepath))
+    try:
+        plot_filepath = plot_rendering.render_plot(process, plot_id, thumbnail, timestamps,
+                                                   thumbnail_timeout if thumbnail else plot_timeout)
+    except PlotError as e:
+        raise Http404(six.text_type(e) or "Plot could not be generated.")
+    except ValueError as e:
+        raise Http404("Plot could not be generated: " + e.args[0])
+    if plot_filepath is None:
+        if thumbnail:
+            response = static_response(plot_rendering.get_placeholder(), content_type="image/png")
+        else:
+            response = static_response(ugettext("The plot is being generated.  Please try again in a moment.").
+                                       encode("utf-8"), content_type="text/plain; charset=utf-8")
+        response.status_code = 202
+        response["Retry-After"] = 5
+        add_never_cache_headers(response)
+        return response
+    return static_file_response(plot_filepath, None if thumbnail else process.get_plotfile_basename(plot_id) + ".pdf",
+                                request)
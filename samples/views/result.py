@@ -27,9 +27,7 @@
 
 from __future__ import absolute_import, unicode_literals
 
-import os, datetime, json, subprocess
-from functools import partial
-from django.conf import settings
+import datetime, json, subprocess
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 import django.utils.timezone
@@ -39,11 +37,12 @@ from django.utils.translation import ugettext_lazy as _, ugettext, pgettext_lazy
 from django.utils.text import capfirst
 from django.forms.utils import ValidationError
 import django.forms as forms
-from jb_common.utils.base import static_response, static_file_response, get_cached_file_content, help_link
+from jb_common.utils.base import static_file_response, blob_file_response, help_link
 import jb_common.utils.base
 import jb_common.utils.blobs
 from samples import models, permissions
 import samples.utils.views as utils
+from samples.utils import thumbnails
 
 
 def save_image_file(image_data, result, related_data_form):
@@ -86,6 +85,11 @@ def save_image_file(image_data, result, related_data_form):
         destination.write(chunk)
     destination.close()
     result.save()
+    try:
+        thumbnails.generate_result_thumbnail(result)
+    except (IOError, OSError, subprocess.CalledProcessError):
+        # Will be tried again when the thumbnail is requested.
+        pass
 
 
 class ResultForm(utils.ProcessForm):
@@ -588,16 +592,7 @@ def show_image(request, process_id):
     result = get_object_or_404(models.Result, pk=utils.convert_id_to_int(process_id))
     permissions.assert_can_view_result_process(request.user, result)
     image_locations = result.get_image_locations()
-    return static_file_response(jb_common.utils.blobs.storage.export(image_locations["image_file"]),
-                                image_locations["sluggified_filename"])
-
-
-def generate_thumbnail(result, image_filename):
-    image_file = jb_common.utils.blobs.storage.export(image_filename)
-    content = subprocess.check_output(["convert", image_file + ("[0]" if result.image_type == "pdf" else ""),
-                                       "-resize", "{0}x{0}".format(settings.THUMBNAIL_WIDTH), "png:-"])
-    os.unlink(image_file)
-    return content
+    return blob_file_response(image_locations["image_file"], image_locations["sluggified_filename"], request)
 
 
 @login_required
@@ -619,12 +614,7 @@ def show_thumbnail(request, process_id):
     """
     result = get_object_or_404(models.Result, pk=utils.convert_id_to_int(process_id))
     permissions.assert_can_view_result_process(request.user, result)
-    image_locations = result.get_image_locations()
-    image_filename = image_locations["image_file"]
-    thumbnail_file = image_locations["thumbnail_file"]
-    content = get_cached_file_content(thumbnail_file, partial(generate_thumbnail, result, image_filename),
-                                      [image_filename])
-    return static_response(content, content_type="image/png")
+    return static_file_response(thumbnails.get_result_thumbnail(result), request=request)
 
 
 @login_required
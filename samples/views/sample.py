@@ -24,16 +24,12 @@
 
 from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
-from django.utils.six import BytesIO
 
-import hashlib, os.path, time, urllib, json
-import PIL
-import PIL.ImageOps
-from django.conf import settings
+import hashlib, time, json, itertools, base64
+from collections import defaultdict
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
-from django.contrib.staticfiles.storage import staticfiles_storage
 import django.core.urlresolvers
 import django.forms as forms
 from django.core.cache import cache
@@ -46,13 +42,12 @@ from django.views.decorators.http import condition
 from django.utils.text import capfirst
 from django.forms.utils import ValidationError
 import jb_common.search
-from jb_common.signals import storage_changed
 from jb_common.utils.base import format_enumeration, unquote_view_parameters, HttpResponseSeeOther, is_json_requested, \
-    respond_in_json, get_all_models, mkdirs, cache_key_locked, get_from_cache, int_or_zero, help_link
+    respond_in_json, get_all_models, get_cache_generation, get_from_cache, int_or_zero, help_link
 from jb_common.utils.views import UserField, TopicField
 from samples import models, permissions, data_tree
 import samples.utils.views as utils
-from samples.utils import sample_names
+from samples.utils import sample_names, barcodes, name_index
 
 
 class IsMySampleForm(forms.Form):
@@ -337,8 +332,11 @@ class SamplesAndProcesses(object):
 
         :rtype: `SamplesAndProcesses`
         """
+        # Turns most of the permission checks below into simple lookups.
+        permissions.get_permission_snapshot(user)
         sample, clearance = utils.lookup_sample(sample_name, user, with_clearance=True)
-        cache_key = "sample:{0}-{1}".format(sample.pk, user.jb_user_details.get_data_hash())
+        cache_key = "sample:{0}-{1}-{2}".format(sample.pk, get_cache_generation("sample-generation:{0}".format(sample.pk)),
+                                                user.jb_user_details.get_data_hash())
         # The following ``10`` is the expectation value of the number of
         # processes.  To get accurate results, use
         # ``samples.processes.count()`` instead.  However, this would slow down
@@ -346,12 +344,7 @@ class SamplesAndProcesses(object):
         samples_and_processes = get_from_cache(cache_key, hits=10)
         if samples_and_processes is None:
             samples_and_processes = SamplesAndProcesses(sample, clearance, user, post_data)
-            keys_list_key = "sample-keys:{0}".format(sample.pk)
-            with cache_key_locked("sample-lock:{0}".format(sample.pk)):
-                keys = cache.get(keys_list_key, [])
-                keys.append(cache_key)
-                cache.set(keys_list_key, keys, settings.CACHES["default"].get("TIMEOUT", 300) + 10)
-                cache.set(cache_key, samples_and_processes)
+            cache.set(cache_key, samples_and_processes)
             samples_and_processes.remove_noncleared_process_contexts(user, clearance)
         else:
             samples_and_processes.personalize(user, clearance, post_data)
@@ -376,48 +369,64 @@ class SamplesAndProcesses(object):
         self.update_sample_context_for_user(user, clearance, post_data)
         self.process_contexts = []
         self.process_ids = set()
-        def collect_process_contexts(local_context=None):
-            """Constructs the list of process context dictionaries.  This
-            internal helper function directly populates
-            ``self.process_contexts``.  It consists of three parts: First, we
-            ascend through the ancestors of the sample to the first parent.
-            Then, for every ancestor and for the sample itself, the relevant
-            processes are found in form of a QuerySet, paying attention to
-            a possible clearance and to the so-called “cutoff timestamps”.  And
-            finally, we iterate over the QuerySet and get the process
-            context dictionary, possibly from the cache.
-
-            :param local_context: Information about the current sample to
-                process.  This is important when we walk through the ancestors
-                and need to keep track of where we are currently.  In
-                particular, this is used for sample splits because they must
-                know which is the current sample, which is the main sample
-                which will be actually displayed etc.
-
-            :type local_context: dict mapping str to ``object``
-            """
-            if local_context is None:
-                local_context = self.sample_context.copy()
-                local_context.update({"original_sample": sample, "latest_descendant": None, "cutoff_timestamp": None})
-            split = local_context["sample"].split_origin
-            if split:
-                new_local_context = local_context.copy()
-                new_local_context["sample"] = split.parent
-                new_local_context["latest_descendant"] = local_context["sample"]
-                new_local_context["cutoff_timestamp"] = split.timestamp
-                collect_process_contexts(new_local_context)
-            processes = models.Process.objects. \
-                filter(Q(samples=local_context["sample"]) | Q(result__sample_series__samples=local_context["sample"])). \
-                distinct()
-            if local_context["cutoff_timestamp"]:
-                processes = processes.filter(timestamp__lte=local_context["cutoff_timestamp"])
-            for process in processes:
-                process_context = utils.digest_process(process, user, local_context)
-                self.process_contexts.append(process_context)
-                self.process_ids.add(process.id)
-        collect_process_contexts()
+        self.collect_process_contexts(sample, user)
         self.process_lists = []
 
+    def collect_process_contexts(self, sample, user):
+        """Constructs the list of process context dictionaries.  This
+        helper method directly populates ``self.process_contexts``.  It
+        consists of three parts: First, we get the sample and all of its
+        ancestors, together with the local context of each of them.  Then, all
+        relevant processes of all of them are fetched at once.  And finally,
+        for every ancestor and for the sample itself, we iterate over the
+        processes (paying attention to the so-called “cutoff timestamps”) and
+        get the process context dictionary, possibly from the cache.
+
+        The local contexts contain information about the current sample to
+        process.  This is important when we walk through the ancestors and
+        need to keep track of where we are currently.  In particular, this is
+        used for sample splits because they must know which is the current
+        sample, which is the main sample which will be actually displayed etc.
+
+        Altogether, the number of queries doesn't depend on the number of
+        ancestors (unless the database doesn't support recursive queries, see
+        :py:func:`samples.models.get_ancestor_ids`) or processes, except for
+        the processes which are not found in the cache.
+
+        :param sample: the sample to which the processes belong
+        :param user: the currently logged-in user
+
+        :type sample: `samples.models.Sample`
+        :type user: django.contrib.auth.models.User
+        """
+        local_context = self.sample_context.copy()
+        local_context.update({"original_sample": sample, "latest_descendant": None, "cutoff_timestamp": None})
+        local_contexts = [local_context]
+        ancestry = models.get_ancestry(sample)
+        for descendant, ancestor in zip(ancestry, ancestry[1:]):
+            local_context = local_context.copy()
+            local_context.update({"sample": ancestor, "latest_descendant": descendant,
+                                  "cutoff_timestamp": descendant.split_origin.timestamp})
+            local_contexts.append(local_context)
+        ancestor_ids = [ancestor.id for ancestor in ancestry]
+        process_ids_by_sample = defaultdict(set)
+        for sample_id, process_id in itertools.chain(
+                models.Sample.processes.through.objects.filter(sample__in=ancestor_ids).
+                values_list("sample_id", "process_id"),
+                models.SampleSeries.results.through.objects.filter(sampleseries__samples__in=ancestor_ids).
+                values_list("sampleseries__samples", "result_id")):
+            process_ids_by_sample[sample_id].add(process_id)
+        all_process_ids = set().union(*process_ids_by_sample.values())
+        processes = models.Process.objects.filter(id__in=all_process_ids).resolve_actual_instances()
+        for local_context in reversed(local_contexts):
+            process_ids = process_ids_by_sample[local_context["sample"].id]
+            cutoff_timestamp = local_context["cutoff_timestamp"]
+            for process in processes:
+                if process.id in process_ids and (not cutoff_timestamp or process.timestamp <= cutoff_timestamp):
+                    process_context = utils.digest_process(process, user, local_context)
+                    self.process_contexts.append(process_context)
+                    self.process_ids.add(process.id)
+
     def update_sample_context_for_user(self, user, clearance, post_data):
         """Updates the sample data in this data structure according to the
         current user.  If the ``SamplesAndProcesses`` object was taken from the
@@ -442,18 +451,17 @@ class SamplesAndProcesses(object):
         self.user = user
         self.user_details = user.samples_user_details
         sample = self.sample_context["sample"]
-        self.is_my_sample = self.user.my_samples.filter(id__exact=sample.id).exists()
+        self.is_my_sample = sample.id in permissions.get_permission_snapshot(self.user).my_sample_ids
         self.is_my_sample_form = IsMySampleForm(
             prefix=str(sample.pk), initial={"is_my_sample": self.is_my_sample}) if post_data is None \
             else IsMySampleForm(post_data, prefix=str(sample.pk))
         self.sample_context.update({"is_my_sample_form": self.is_my_sample_form, "clearance": clearance})
-        try:
-            # FixMe: calling get_allowed_processes is too expensive
-            get_allowed_processes(self.user, sample)
-            self.sample_context["can_add_process"] = True
-        except permissions.PermissionError:
-            self.sample_context["can_add_process"] = False
         self.sample_context["can_edit"] = permissions.has_permission_to_edit_sample(self.user, sample)
+        # This is equivalent to ``get_allowed_processes`` not raising a
+        # ``PermissionError``, with the cheapest tests first.
+        self.sample_context["can_add_process"] = bool(permissions.get_allowed_physical_processes(self.user)) or \
+            permissions.has_permission_to_add_result_process(self.user, sample) or \
+            self.sample_context["can_edit"] and not sample.is_dead()
         self.sample_context["can_delete"] = permissions.has_permission_to_delete_sample(self.user, sample)
         if self.sample_context["can_edit"] and \
            sample_names.sample_name_format(sample.name) in sample_names.get_renamable_name_formats():
@@ -843,12 +851,8 @@ def search(request):
     if search_samples_form.is_valid():
         name_pattern = search_samples_form.cleaned_data["name_pattern"]
         if name_pattern:
-            if search_samples_form.cleaned_data["aliases"]:
-                found_samples = base_query.filter(Q(name__icontains=name_pattern) | Q(aliases__name__icontains=name_pattern))
-            else:
-                found_samples = base_query.filter(name__icontains=name_pattern)
-            too_many_results = found_samples.count() > max_results
-            found_samples = found_samples[:max_results] if too_many_results else found_samples
+            found_samples, too_many_results = name_index.find_samples(
+                base_query, name_pattern, search_samples_form.cleaned_data["aliases"], max_results)
     my_samples = request.user.my_samples.all()
     if request.method == "POST":
         sample_ids = set(int_or_zero(key.partition("-")[0]) for key, value in request.POST.items()
@@ -877,6 +881,10 @@ def advanced_search(request):
     search, this is a GET requets.  Therefore, this view has two submit
     buttons.
 
+    The results are shown in pages of `max_results` matches.  The export data
+    of the results is only built if the unchanged search is submitted again,
+    i.e. if the user wants to use the table export.
+
     :param request: the current HTTP Request object
 
     :type request: HttpRequest
@@ -890,14 +898,15 @@ def advanced_search(request):
     search_tree = None
     results, add_forms = [], []
     too_many_results = False
+    next_page_url = None
     root_form = jb_common.search.SearchModelForm(model_list, request.GET)
     search_performed = False
     no_permission_message = None
     _search_parameters_hash = hashlib.sha1(json.dumps(sorted(dict((key, value) for key, value in request.GET.items()
-                                    if not "__" in key and key != "_search_parameters_hash").items())).encode("utf-8")).hexdigest()
+                                    if not "__" in key and key not in ["_search_parameters_hash", "before"]).items())).encode("utf-8")).hexdigest()
     column_groups_form = columns_form = table = switch_row_forms = old_data_form = None
     if root_form.is_valid() and root_form.cleaned_data["_model"]:
-        search_tree = get_all_models()[root_form.cleaned_data["_model"]].get_search_tree_node()
+        search_tree = jb_common.search.get_search_tree_node(get_all_models()[root_form.cleaned_data["_model"]])
         parse_tree = root_form.cleaned_data["_model"] == root_form.cleaned_data["_old_model"]
         search_tree.parse_data(request.GET if parse_tree else None, "")
         if search_tree.is_valid():
@@ -905,11 +914,17 @@ def advanced_search(request):
                 base_query = utils.restricted_samples_query(request.user)
             elif search_tree.model_class == models.SampleSeries:
                 base_query = models.SampleSeries.objects.filter(
-                    Q(topic__confidential=False) | Q(topic__members=request.user) |
-                    Q(currently_responsible_person=request.user)).distinct()
+                    Q(topic__confidential=False) | Q(topic__in=request.user.topics.values("pk")) |
+                    Q(currently_responsible_person=request.user))
             else:
                 base_query = None
-            results, too_many_results = jb_common.search.get_search_results(search_tree, max_results, base_query)
+            before = int_or_zero(request.GET.get("before")) or None
+            results, too_many_results = jb_common.search.get_search_results(search_tree, max_results, base_query, before)
+            if too_many_results:
+                query_dict = request.GET.copy()
+                query_dict.pop("_search_parameters_hash", None)
+                query_dict["before"] = min(result.pk for result in results)
+                next_page_url = "?" + query_dict.urlencode()
             if search_tree.model_class == models.Sample:
                 if request.method == "POST":
                     sample_ids = set(int_or_zero(key[2:].partition("-")[0]) for key, value in request.POST.items() if value == "on")
@@ -920,24 +935,11 @@ def advanced_search(request):
                              for sample in results]
             else:
                 add_forms = len(results) * [None]
-            if results and root_form.cleaned_data["_search_parameters_hash"] == _search_parameters_hash:
+            if results and request.method == "GET" and \
+               root_form.cleaned_data["_search_parameters_hash"] == _search_parameters_hash:
                 data_node = data_tree.DataNode(_("search results"))
-                for result in results:
-                    insert = False
-                    if isinstance(result, models.PhysicalProcess) \
-                        and permissions.has_permission_to_view_physical_process(request.user, result):
-                            insert = True
-                    elif isinstance(result, models.Result) \
-                        and permissions.has_permission_to_view_result_process(request.user, result):
-                            insert = True
-                    elif isinstance(result, models.Sample) \
-                        and permissions.has_permission_to_fully_view_sample(request.user, result):
-                            insert = True
-                    elif isinstance(result, models.SampleSeries) \
-                        and permissions.has_permission_to_view_sample_series(request.user, result):
-                            insert = True
-                    if insert:
-                        data_node.children.append(result.get_data_for_table_export())
+                data_node.children = [result.get_data_for_table_export()
+                                      for result in permissions.get_viewable_instances(request.user, results)]
                 if len(data_node.children) == 0:
                     no_permission_message = _("You don't have the permission to see any content of the search results.")
                 else:
@@ -956,6 +958,7 @@ def advanced_search(request):
     content_dict = {"title": capfirst(_("advanced search")), "search_root": root_form, "search_tree": search_tree,
                     "results": list(zip(results, add_forms)), "search_performed": search_performed,
                     "something_to_add": any(add_forms), "too_many_results": too_many_results, "max_results": max_results,
+                    "next_page_url": next_page_url,
                     "column_groups": column_groups_form, "columns": columns_form, "old_data": old_data_form,
                     "rows": list(zip(table, switch_row_forms)) if table else None,
                     "no_permission_message": no_permission_message}
@@ -994,6 +997,19 @@ def export(request, sample_name):
                                                          "backlink": request.GET.get("next", "")})
 
 
+def _code_view(request, title, encoder, template_name):
+    try:
+        data = request.GET["data"]
+    except KeyError:
+        raise Http404('GET parameter "data" missing.')
+    try:
+        png = barcodes.matrix_to_png(encoder(data))
+    except ValueError:
+        raise Http404("Data too long.")
+    return render(request, template_name, {"title": title, "data": data,
+                                           "image_url": "data:image/png;base64," + base64.b64encode(png).decode("ascii")})
+
+
 def qr_code(request):
     """Generates the QR representation of the given data.  The data is given
     in the ``data`` query string parameter.
@@ -1007,11 +1023,7 @@ def qr_code(request):
 
     :rtype: HttpResponse
     """
-    try:
-        data = request.GET["data"]
-    except KeyError:
-        raise Http404('GET parameter "data" missing.')
-    return render(request, "samples/qr_code.html", {"title": _("QR code"), "data": data})
+    return _code_view(request, _("QR code"), barcodes.qr_code, "samples/qr_code.html")
 
 
 def data_matrix_code(request):
@@ -1027,33 +1039,7 @@ def data_matrix_code(request):
 
     :rtype: HttpResponse
     """
-    raise Http404()
-    # FixMe: This non-working currently because it write the dara matrix PNG
-    # into STATIC_ROOT.  It is poorly coded for two reasons: First, STATIC_ROOT
-    # may not exist because another system is serving static content.  And
-    # Secondly, retrieving the actual PNG must also work even if the
-    # corresponding HTML has not been retrieved yet.
-    try:
-        data = request.GET["data"]
-    except KeyError:
-        raise Http404('GET parameter "data" missing.')
-    hash_ = hashlib.sha1()
-    hash_.update(data.encode("utf-8"))
-    filename = hash_.hexdigest() + ".png"
-    filepath = os.path.join(settings.STATIC_ROOT, "data_matrix", filename)
-    url = staticfiles_storage.url("data_matrix/" + filename)
-    if not os.path.exists(filepath):
-        mkdirs(filepath)
-        image = PIL.Image.open(BytesIO(urllib.urlopen(
-                    "http://www.bcgen.com/demo/IDAutomationStreamingDataMatrix.aspx?"
-                    "MODE=3&D={data}&PFMT=6&PT=F&X=0.13&O=0&LM=0".format(data=urlquote_plus(data, safe="/"))).read()))
-        image = image.crop((38, 3, 118, 83))
-        image = PIL.ImageOps.expand(image, border=16, fill=256).convert("1")
-        image.save(filepath)
-        storage_changed.send(data_matrix_code)
-    return render(request, "samples/data_matrix_code.html", {"title": _("Data Matrix code"),
-                                                             "data_matrix_url": url,
-                                                             "data": data})
+    return _code_view(request, _("Data Matrix code"), barcodes.data_matrix, "samples/data_matrix_code.html")
 
 
 class SampleRenameForm(forms.Form):
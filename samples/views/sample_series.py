@@ -339,6 +339,10 @@ def export(request, name):
     return value is not an HTML response.  Note that you must also be allowed
     to see all *samples* in this sample series for the export.
 
+    If the query string contains ``stream=1``, the data is exported directly
+    with :py:func:`samples.utils.views.streaming_table_export`, which is
+    suitable for very large sample series.
+
     :param request: the current HTTP Request object
     :param name: the name of the sample series
 
@@ -355,6 +359,10 @@ def export(request, name):
     for sample in sample_series.samples.all():
         permissions.assert_can_fully_view_sample(request.user, sample)
 
+    if request.GET.get("stream"):
+        return utils.streaming_table_export(
+            request, lambda: (sample.get_data_for_table_export() for sample in sample_series.samples.iterator()),
+            six.text_type(sample_series), _("sample"))
     data = sample_series.get_data_for_table_export()
     result = utils.table_export(request, data, _("sample"))
     if isinstance(result, tuple):
@@ -366,7 +374,8 @@ def export(request, name):
                                                          "columns": columns_form,
                                                          "rows": list(zip(table, switch_row_forms)) if table else None,
                                                          "old_data": old_data_form,
-                                                         "backlink": request.GET.get("next", "")})
+                                                         "backlink": request.GET.get("next", ""),
+                                                         "streaming_url": "?stream=1"})
 
 
 _ = ugettext
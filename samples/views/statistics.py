@@ -50,9 +50,11 @@ def statistics(request):
 
     :rtype: HttpResponse
     """
+    cache_lock_contentions, cache_lock_timeouts = utils.cache_lock_statistics()
     return render(request, "samples/statistics.html",
                   {"title": _("JuliaBase server statistics"),
-                   "cache_hit_rate": int(round((utils.cache_hit_rate() or 0) * 100))})
+                   "cache_hit_rate": int(round((utils.cache_hit_rate() or 0) * 100)),
+                   "cache_lock_contentions": cache_lock_contentions, "cache_lock_timeouts": cache_lock_timeouts})
 
 
 @cache_control(max_age=0)  # This is for language switching
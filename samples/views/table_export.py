@@ -250,7 +250,7 @@ class Column(object):
         """
         for column_group_name in self.column_group_names:
             if column_group_name in row:
-                return row[column_group_name][self.key]
+                return row[column_group_name].get(self.key, "")
         return ""
 
 
@@ -267,6 +267,32 @@ def build_column_group_list(root):
 
     :type root: `DataNode`
 
+    :return:
+      the column groups, the column list
+
+    :rtype: list of `ColumnGroup`, list of `Column`
+    """
+    return build_column_group_list_from_row_trees(root.children)
+
+
+def build_column_group_list_from_row_trees(row_trees):
+    """Extract the column group list and the column list from the row trees.
+    This is the working horse of `build_column_group_list`.  The row trees are
+    walked through only once, and they are not referenced afterwards.  Thus,
+    `row_trees` may be a generator which creates them on the fly, so that they
+    never need to be in memory at the same time.
+
+    If a node has item keys that were not seen with the first node of the same
+    name, they are appended to the column group.  Thus, it is not necessary to
+    call :py:meth:`samples.data_tree.DataNode.complete_items_in_children`
+    before.
+
+    :param row_trees: The row trees.  Their node names must have been made
+        unambiguous already using
+        :py:meth:`samples.data_tree.DataNode.find_unambiguous_names`.
+
+    :type row_trees: iterable of `DataNode`
+
     :return:
       the column groups, the column list
 
@@ -321,30 +347,37 @@ def build_column_group_list(root):
         for column in columns:
             if column.key in duplicates:
                 column.disambig()
+    def add_columns(column_group, node):
+        """Adds the columns for all items of the node to the column group,
+        unless the column group already has them.
+        """
+        name = column_group.name
+        for item in node.items:
+            if item.key in column_group.key_indices:
+                continue
+            i = len(columns)
+            if node.top_level and item.origin:
+                shared_key = (item.origin, item.key)
+                if shared_key in shared_columns:
+                    column_group.key_indices[item.key] = shared_columns[shared_key]
+                    columns[shared_columns[shared_key]].append_name(name)
+                    continue
+                else:
+                    shared_columns[shared_key] = i
+            column_group.key_indices[item.key] = i
+            columns.append(Column(name, item.key))
     columns = []
     column_groups = []
     shared_columns = {}
     position = 0
-    for row, row_tree in enumerate(root.children):
+    for row, row_tree in enumerate(row_trees):
         for node in walk_row_tree(row_tree):
             if row > 0 and node in column_groups:
                 position = column_groups.index(node)
+                add_columns(column_groups[position], node)
             else:
-                name = node.name
-                column_group = ColumnGroup(name)
-                i = len(columns)
-                for item in node.items:
-                    if node.top_level and item.origin:
-                        shared_key = (item.origin, item.key)
-                        if shared_key in shared_columns:
-                            column_group.key_indices[item.key] = shared_columns[shared_key]
-                            columns[shared_columns[shared_key]].append_name(name)
-                            continue
-                        else:
-                            shared_columns[shared_key] = i
-                    column_group.key_indices[item.key] = i
-                    columns.append(Column(name, item.key))
-                    i += 1
+                column_group = ColumnGroup(node.name)
+                add_columns(column_group, node)
                 column_groups.insert(position, column_group)
             position += 1
     disambig_key_names(columns)
@@ -372,15 +405,31 @@ def flatten_tree(root):
       unicode
     """
 
-    def flatten_row_tree(node):
-        name_dict = {node.name: dict((item.key, item.value if item.value is not None else "") for item in node.items)}
-        for child in node.children:
-            name_dict.update(flatten_row_tree(child))
-        return name_dict
-
     return [flatten_row_tree(row) for row in root.children]
 
 
+def flatten_row_tree(row_tree):
+    """Converts one row tree to a dictionary for easy cell value lookup.  See
+    `flatten_tree` for details.
+
+    :param row_tree: the row tree; its node names must have been made
+        unambiguous already
+
+    :type row_tree: `samples.data_tree.DataNode`
+
+    :return:
+      dictionary mapping node names to dictionaries mapping key names to cell
+      values
+
+    :rtype: dictionary mapping unicode to dictionary mapping unicode to unicode
+    """
+    name_dict = {row_tree.name: dict((item.key, item.value if item.value is not None else "")
+                                     for item in row_tree.items)}
+    for child in row_tree.children:
+        name_dict.update(flatten_row_tree(child))
+    return name_dict
+
+
 def generate_table_rows(flattened_tree, columns, selected_key_indices, label_column, label_column_heading):
     """Generate the final table suited for CSV export and HTML preview.  Note
     that for ODF or Excel output, you should also take the column group list
@@ -430,6 +479,47 @@ def generate_table_rows(flattened_tree, columns, selected_key_indices, label_col
     return table_rows
 
 
+def generate_table_rows_lazily(row_trees, columns, selected_key_indices, generate_label_column, label_column_heading):
+    """Generator variant of `generate_table_rows`.  It yields the rows one by
+    one, and it creates the flattened rows on the fly from the row trees.
+    Together with `build_column_group_list_from_row_trees`, this allows for
+    table exports which never have the whole table in memory.
+
+    :param row_trees: The row trees.  They must be the same as those passed to
+        ``build_column_group_list_from_row_trees``, but their node names don't
+        need to be unambiguous yet; this is done here.
+    :param columns: list of columns as constructed by
+        `build_column_group_list_from_row_trees`
+    :param selected_key_indices: list of the column indices which the user
+        selected for output
+    :param generate_label_column: whether the rows should start with the
+        descriptive name of the row tree
+    :param label_column_heading: Description of the very first column with the
+        table row headings, see `generate_table_rows`.
+
+    :type row_trees: iterable of `samples.data_tree.DataNode`
+    :type columns: list of `Column`
+    :type selected_key_indices: list of int
+    :type generate_label_column: bool
+    :type label_column_heading: unicode
+
+    :return:
+      generator for the rows of the table; the first row contains the headings
+
+    :rtype: generator of list of object
+    """
+    head_row = [label_column_heading] if generate_label_column else []
+    head_row.extend([six.text_type(columns[key_index].heading) for key_index in selected_key_indices])
+    yield head_row
+    for row_tree in row_trees:
+        row_tree.find_unambiguous_names(0)
+        row = flatten_row_tree(row_tree)
+        table_row = [row_tree.descriptive_name] if generate_label_column else []
+        for key_index in selected_key_indices:
+            table_row.append(columns[key_index].get_value(row))
+        yield table_row
+
+
 class ColumnGroupsForm(forms.Form):
     """Form for the columns choice.  It has only one field, ``column_groups``,
     the result of which is a set with the selected column group names.
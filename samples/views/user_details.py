@@ -31,6 +31,7 @@ import django.contrib.auth.models
 from django.views.decorators.http import require_http_methods
 from django import forms
 import django.core.urlresolvers
+import django.utils.timezone
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.utils.text import capfirst
 from django.conf import settings
@@ -135,6 +136,8 @@ def edit_preferences(request, login_name):
         if user_details_form.is_valid() and initials_form.is_valid():
             __change_folded_processes(user_details_form.cleaned_data["default_folded_process_classes"], user)
             user_details = user_details_form.save(commit=False)
+            if "only_important_news" in user_details_form.changed_data:
+                user_details.feed_timestamp = django.utils.timezone.now()
             user_details.show_users_from_departments = Department.objects.filter(id__in=
                                                         user_details_form.cleaned_data["show_users_from_departments"])
             user_details.default_folded_process_classes = [ContentType.objects.get_for_id(int(id_))